@@ -1,52 +1,62 @@
 import os
+import subprocess
+import sys
+import threading
 import gradio as gr
 from dotenv import load_dotenv
-from langchain_community.vectorstores import Chroma
-from langchain_openai.embeddings import OpenAIEmbeddings
-from langchain_openai import ChatOpenAI
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from datasets import Dataset
-from ragas import evaluate
-from ragas.metrics import faithfulness, answer_relevancy, context_precision
 import json
+from eval_runner import EVAL_REPORT_PATH, TurnLog
+from startup import STARTUP_MODE, LazyResource
 
 # Load environment variables
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Load vector store
-vectorstore = Chroma(
-    persist_directory="persisted_rag",
-    embedding_function=OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-)
-# Setup memory and chatbot chain
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
-llm = ChatOpenAI(
-    model_name="gpt-4o-mini",
-    openai_api_key=OPENAI_API_KEY,
-    temperature=0,
-    max_tokens=300
-)
-chatbot_chain = ConversationalRetrievalChain.from_llm(
-    llm=llm,
-    retriever=retriever,
-    memory=memory,
-    return_source_documents=True
-)
-# Evaluation log
-eval_log = []
+
+def build_chain():
+    # LangChain and Chroma load here, not at import, so the UI comes up first
+    from langchain_community.vectorstores import Chroma
+    from langchain_openai.embeddings import OpenAIEmbeddings
+    from langchain_openai import ChatOpenAI
+    from langchain.chains import ConversationalRetrievalChain
+    from langchain.memory import ConversationBufferMemory
+
+    # Load vector store
+    vectorstore = Chroma(
+        persist_directory="persisted_rag",
+        embedding_function=OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
+    )
+    # Setup memory and chatbot chain
+    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    # CONTEXT_COMPRESSION=on|off compares answers with and without compressed context
+    from context_compression import compress_context
+    retriever = compress_context(vectorstore.as_retriever(search_kwargs={"k": 3}))
+    llm = ChatOpenAI(
+        model_name="gpt-4o-mini",
+        openai_api_key=OPENAI_API_KEY,
+        temperature=0,
+        max_tokens=300
+    )
+    return ConversationalRetrievalChain.from_llm(
+        llm=llm,
+        retriever=retriever,
+        memory=memory,
+        return_source_documents=True
+    )
+
+
+chatbot_chain = LazyResource("rag", build_chain)
+
+# Evaluation log: turns go to disk (eval_logs/), not memory, and are scored
+# by eval_runner.py in its own process
+turn_log = TurnLog()
+evaluation = None
 def chat_with_pdf_and_log(message, history):
-    result = chatbot_chain({"question": message})
+    result = chatbot_chain.get()({"question": message})
     answer = result["answer"]
     contexts = [doc.page_content for doc in result["source_documents"]]
     # Add to evaluation log
-    eval_log.append({
-        "question": message,
-        "answer": answer,
-        "contexts": contexts
-    })
+    turn_log.append(message, answer, contexts)
     fallback_phrases = [
         "I don't know", 
         "I'm not sure", 
@@ -57,16 +67,31 @@ def chat_with_pdf_and_log(message, history):
     if any(phrase.lower() in answer.lower() for phrase in fallback_phrases):
         return "I have no idea about this thing. I am trained on very limited data, that is why I can't answer that question."
     return answer
+def evaluate_log():
+    # Starts eval_runner.py in the background and shows the latest report;
+    # scoring never runs in, or blocks, the chat process
+    global evaluation
+    if evaluation is None or evaluation.poll() is not None:
+        evaluation = subprocess.Popen([sys.executable, "eval_runner.py"])
+        status = "Evaluation started; click again later for the updated report."
+    else:
+        status = "Evaluation still running; showing the last report."
+    if not os.path.exists(EVAL_REPORT_PATH):
+        return status
+    with open(EVAL_REPORT_PATH) as f:
+        return status + "\n" + json.dumps(json.load(f), indent=2)
 # Gradio UI
 with gr.Blocks() as demo:
     gr.Markdown("## Jovi Realty ChatBot with RAGAS Evaluation")
     chatbot = gr.ChatInterface(fn=chat_with_pdf_and_log)
     gr.Button("Evaluate with RAGAS").click(
-        lambda: evaluate(
-            Dataset.from_list(eval_log),
-            metrics=[faithfulness, answer_relevancy, context_precision]
-        ).to_pandas().to_json(orient="records", indent=2),
+        evaluate_log,
         outputs=gr.Textbox(label="Evaluation Results (JSON)", lines=10)
     )
+# Build the chain while Gradio starts; with STARTUP_MODE=eager, before it starts
+if STARTUP_MODE == "eager":
+    chatbot_chain.get()
+elif STARTUP_MODE == "background":
+    threading.Thread(target=chatbot_chain.get, daemon=True).start()
 # Launch app
 demo.launch(server_name="0.0.0.0", server_port=8000, share=True)
\ No newline at end of file
@@ -0,0 +1,239 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from metrics import Counter, Gauge, registry
+
+# Admission control for the RAG chain. At most ADMISSION_MAX_CONCURRENCY
+# chain runs go upstream at once; the rest wait in a FIFO queue. A request
+# is turned away straight away instead of queueing when the queue is full
+# (429), or when the wait it would face, estimated from recent service
+# times, is already past its deadline (503). A request still queued at its
+# deadline gets a 503 too. Identical standalone questions in flight at the
+# same time are coalesced: one chain run answers all of them.
+
+ADMISSION = os.getenv("ADMISSION", "on")  # on | off
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+
+ADMISSIONS = registry.register(Counter(
+    "rag_admission_total", "Admission decisions for chain runs", ["result"]))
+QUEUE_DEPTH = registry.register(Gauge(
+    "rag_admission_queue_depth", "Chain runs waiting for a slot"))
+
+# Weight of the newest sample in the service-time average
+_EWMA_ALPHA = 0.2
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing when the server can't take the request in time."""
+
+    def __init__(self, status_code, message, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    def headers(self):
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency=ADMISSION_MAX_CONCURRENCY, max_queue=ADMISSION_MAX_QUEUE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT, enabled=ADMISSION == "on"):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.enabled = enabled
+        self.service_seconds = None  # moving average of how long a slot is held
+        self._running = 0
+        self._waiters = deque()
+
+    async def acquire(self):
+        """Waits for a slot and returns it; call ``release()`` when done.
+
+        Raises Overloaded instead of waiting past the deadline.
+        """
+        if not self.enabled:
+            return _Permit(None)
+        await self._acquire()
+        return _Permit(self)
+
+    @asynccontextmanager
+    async def slot(self):
+        permit = await self.acquire()
+        try:
+            yield
+        finally:
+            permit.release()
+
+    def expected_wait(self):
+        # Time until a new arrival would get a slot if everyone ahead holds
+        # theirs for the average service time
+        if self._running < self.max_concurrency and not self._waiters:
+            return 0.0
+        if self.service_seconds is None:
+            return 0.0
+        return (len(self._waiters) + 1) * self.service_seconds / self.max_concurrency
+
+    def stats(self):
+        return {
+            "running": self._running,
+            "queued": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "service_seconds": self.service_seconds,
+        }
+
+    async def _acquire(self):
+        if self._running < self.max_concurrency and not self._waiters:
+            self._running += 1
+            ADMISSIONS.inc("admitted")
+            return
+        if len(self._waiters) >= self.max_queue:
+            ADMISSIONS.inc("rejected_queue_full")
+            raise Overloaded(429, "Too many requests, please try again shortly.", self.expected_wait())
+        expected = self.expected_wait()
+        if expected > self.queue_timeout:
+            # It would time out in the queue anyway; say so now
+            ADMISSIONS.inc("rejected_deadline")
+            raise Overloaded(503, "The server is busy, please try again shortly.", expected)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        QUEUE_DEPTH.inc()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            ADMISSIONS.inc("rejected_deadline")
+            raise Overloaded(503, "The server is busy, please try again shortly.", self.expected_wait())
+        except BaseException:
+            self._discard(waiter)
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as this request was cancelled
+                self._release()
+            raise
+        QUEUE_DEPTH.dec()
+        ADMISSIONS.inc("admitted_after_queue")
+
+    def _discard(self, waiter):
+        QUEUE_DEPTH.dec()
+        # _release may already have popped it
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+
+    def _release(self):
+        # Hand the slot straight to the oldest waiter still waiting
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._running -= 1
+
+    def _observe(self, seconds):
+        if self.service_seconds is None:
+            self.service_seconds = seconds
+        else:
+            self.service_seconds += _EWMA_ALPHA * (seconds - self.service_seconds)
+
+
+class _Permit:
+    __slots__ = ("controller", "started")
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.started = time.perf_counter()
+
+    def release(self):
+        # Safe to call more than once
+        controller, self.controller = self.controller, None
+        if controller is not None:
+            controller._observe(time.perf_counter() - self.started)
+            controller._release()
+
+
+def coalesce_key(question):
+    return " ".join(question.lower().split())
+
+
+class Coalescer:
+    """Runs one coroutine (or event stream) per key at a time; concurrent callers share its result."""
+
+    def __init__(self):
+        self._in_flight = {}
+        self._streams = {}
+
+    async def run(self, key, factory):
+        task = self._in_flight.get(key)
+        if task is None:
+            # A task of its own, so a caller disconnecting doesn't cancel the
+            # run for the others
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            ADMISSIONS.inc("coalesced")
+        return await asyncio.shield(task)
+
+    def streaming(self, key):
+        return key in self._streams
+
+    def stream(self, key, factory):
+        """Yields the events of the stream running for ``key``, starting one from ``factory`` if none is.
+
+        A caller that joins late gets the events it missed first, then follows live.
+        """
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = _SharedStream(factory())
+            self._streams[key] = shared
+            shared.task.add_done_callback(lambda _: self._streams.pop(key, None))
+        else:
+            ADMISSIONS.inc("coalesced")
+        return shared.follow()
+
+    def __len__(self):
+        return len(self._in_flight) + len(self._streams)
+
+
+class _SharedStream:
+    def __init__(self, events):
+        self.events = []
+        self.error = None
+        self.finished = False
+        self._changed = asyncio.Condition()
+        # Runs in a task of its own, like Coalescer.run, so one client
+        # disconnecting doesn't end the stream for the others
+        self.task = asyncio.ensure_future(self._pump(events))
+
+    async def _pump(self, events):
+        try:
+            async for event in events:
+                async with self._changed:
+                    self.events.append(event)
+                    self._changed.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            async with self._changed:
+                self.finished = True
+                self._changed.notify_all()
+
+    async def follow(self):
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: sent < len(self.events) or self.finished)
+                pending = self.events[sent:]
+            for event in pending:
+                yield event
+            sent += len(pending)
+            if not pending and self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
@@ -0,0 +1,475 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Two-tier answer cache for get_rag_response.
+# The exact tier matches normalized question text; the semantic tier matches
+# question embeddings by cosine similarity. Entries are tied to the index
+# version stamp written by the preprocessing scripts, so rebuilding the
+# index drops every cached answer. The sqlite and redis backends are shared by
+# every worker process, so an answer computed by one worker serves them all.
+
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory")  # memory | sqlite | redis | off
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "answer_cache.sqlite3")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+INDEX_STAMP_PATH = os.getenv("INDEX_STAMP_PATH", ".index_version")
+
+
+def normalize_question(question):
+    question = re.sub(r"[^\w\s-]", " ", question.lower())
+    return " ".join(question.split())
+
+
+def bump_index_version(path=INDEX_STAMP_PATH):
+    # Called by the preprocessing scripts after the index is rebuilt
+    with open(path, "w") as f:
+        f.write(str(time.time_ns()))
+
+
+def read_index_version(path=INDEX_STAMP_PATH):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _VectorSlots:
+    """Fixed-size matrix of unit vectors for brute-force cosine lookup."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.matrix = None
+        self.keys = [None] * capacity
+        self.slot_of = {}
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def add(self, key, vector):
+        if self.matrix is None:
+            self.matrix = np.zeros((self.capacity, len(vector)), dtype=np.float32)
+        self.remove(key)
+        if not self.free:
+            return
+        slot = self.free.pop()
+        self.matrix[slot] = vector
+        self.keys[slot] = key
+        self.slot_of[key] = slot
+
+    def remove(self, key):
+        slot = self.slot_of.pop(key, None)
+        if slot is not None:
+            self.matrix[slot] = 0
+            self.keys[slot] = None
+            self.free.append(slot)
+
+    def nearest(self, vector):
+        if not self.slot_of:
+            return None, 0.0
+        scores = self.matrix @ vector
+        slot = int(np.argmax(scores))
+        return self.keys[slot], float(scores[slot])
+
+    def clear(self):
+        self.__init__(self.capacity)
+
+
+class MemoryCacheBackend:
+    # Lookups never leave the process, so AnswerCache runs them on the event loop
+    blocking = False
+
+    def __init__(self, max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl_seconds=ANSWER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (created, answer)
+        self._vectors = _VectorSlots(max_entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        created, answer = entry
+        if time.time() - created > self.ttl_seconds:
+            self._delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def nearest(self, vector):
+        return self._vectors.nearest(vector)
+
+    def put(self, key, vector, answer):
+        self._entries.pop(key, None)
+        while len(self._entries) >= self.max_entries:
+            self._delete(next(iter(self._entries)))
+        self._entries[key] = (time.time(), answer)
+        if vector is not None:
+            self._vectors.add(key, vector)
+
+    def clear(self):
+        self._entries.clear()
+        self._vectors.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        pass
+
+    def _delete(self, key):
+        self._entries.pop(key, None)
+        self._vectors.remove(key)
+
+
+class SQLiteCacheBackend:
+    """On-disk backend; keeps an in-process mirror of the embeddings for the
+    semantic tier and reloads it when another connection changes the file."""
+
+    blocking = True
+
+    def __init__(self, path=ANSWER_CACHE_PATH, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 ttl_seconds=ANSWER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Workers write concurrently; wait for the lock rather than fail
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, answer TEXT NOT NULL, embedding BLOB, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._vectors = _VectorSlots(max_entries)
+        self._data_version = None
+
+    def get(self, key):
+        row = self._conn.execute("SELECT answer, created FROM answers WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        answer, created = row
+        now = time.time()
+        if now - created > self.ttl_seconds:
+            self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+            self._vectors.remove(key)
+            return None
+        self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+        return answer
+
+    def nearest(self, vector):
+        self._sync_vectors()
+        return self._vectors.nearest(vector)
+
+    def put(self, key, vector, answer):
+        now = time.time()
+        blob = vector.astype(np.float32).tobytes() if vector is not None else None
+        self._conn.execute(
+            "INSERT OR REPLACE INTO answers (key, answer, embedding, created, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, answer, blob, now, now),
+        )
+        if vector is not None:
+            self._vectors.add(key, vector)
+        changes = self._conn.total_changes
+        self._conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        if self._conn.total_changes != changes:
+            # Rows were evicted; rebuild the mirror on the next lookup
+            self._data_version = None
+
+    def clear(self):
+        self._conn.execute("DELETE FROM answers")
+        self._vectors.clear()
+        self._data_version = None
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+    def _sync_vectors(self):
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._vectors.clear()
+        for key, blob in self._conn.execute("SELECT key, embedding FROM answers WHERE embedding IS NOT NULL"):
+            self._vectors.add(key, np.frombuffer(blob, dtype=np.float32))
+        self._data_version = data_version
+
+
+class RedisCacheBackend:
+    """Backend on Redis (or anything speaking its protocol), shared across hosts.
+
+    Each answer is a hash that expires after the TTL. A sorted set tracks
+    last use for the size cap, and a version counter, bumped on every write,
+    tells each process when to reload its mirror of the embeddings.
+    """
+
+    blocking = True
+
+    def __init__(self, url=REDIS_URL, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 ttl_seconds=ANSWER_CACHE_TTL_SECONDS, prefix="rag:answer:"):
+        import redis
+
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+        self._lru_key = prefix + "lru"
+        self._version_key = prefix + "version"
+        self._vectors = _VectorSlots(max_entries)
+        self._version = None
+
+    def _entry_key(self, key):
+        return f"{self.prefix}entry:{key}"
+
+    def get(self, key):
+        answer = self._redis.hget(self._entry_key(key), "answer")
+        if answer is None:
+            return None
+        self._redis.zadd(self._lru_key, {key: time.time()})
+        return answer.decode("utf-8")
+
+    def nearest(self, vector):
+        self._sync_vectors()
+        return self._vectors.nearest(vector)
+
+    def put(self, key, vector, answer):
+        now = time.time()
+        mapping = {"answer": answer}
+        if vector is not None:
+            mapping["embedding"] = vector.astype(np.float32).tobytes()
+        entry_key = self._entry_key(key)
+        pipe = self._redis.pipeline()
+        pipe.delete(entry_key)
+        pipe.hset(entry_key, mapping=mapping)
+        pipe.expire(entry_key, max(1, int(self.ttl_seconds)))
+        pipe.zadd(self._lru_key, {key: now})
+        # Expired hashes are already gone; drop them from the LRU set too
+        pipe.zremrangebyscore(self._lru_key, "-inf", now - self.ttl_seconds)
+        pipe.zrange(self._lru_key, 0, -(self.max_entries + 1))
+        pipe.incr(self._version_key)
+        *_, overflow, version = pipe.execute()
+        # Other mirrors may still hold these keys; get() then misses, which is harmless
+        self._delete([member.decode("utf-8") for member in overflow])
+        if vector is not None:
+            self._vectors.add(key, vector)
+        # Our own write needs no reload; anyone else's in between does
+        if self._version is not None and version == self._version + 1:
+            self._version = version
+
+    def clear(self):
+        keys = [member.decode("utf-8") for member in self._redis.zrange(self._lru_key, 0, -1)]
+        self._delete(keys)
+        self._redis.delete(self._lru_key)
+        self._redis.incr(self._version_key)
+        self._vectors.clear()
+        self._version = None
+
+    def __len__(self):
+        return self._redis.zcard(self._lru_key)
+
+    def close(self):
+        self._redis.close()
+
+    def _delete(self, keys):
+        if not keys:
+            return
+        pipe = self._redis.pipeline()
+        pipe.delete(*[self._entry_key(key) for key in keys])
+        pipe.zrem(self._lru_key, *keys)
+        pipe.execute()
+        for key in keys:
+            self._vectors.remove(key)
+
+    def _sync_vectors(self):
+        version = int(self._redis.get(self._version_key) or 0)
+        if version == self._version:
+            return
+        self._vectors.clear()
+        keys = [member.decode("utf-8") for member in self._redis.zrange(self._lru_key, 0, -1)]
+        pipe = self._redis.pipeline()
+        for key in keys:
+            pipe.hget(self._entry_key(key), "embedding")
+        for key, blob in zip(keys, pipe.execute() if keys else []):
+            if blob is not None:
+                self._vectors.add(key, np.frombuffer(blob, dtype=np.float32))
+        self._version = version
+
+
+class AnswerCache:
+    def __init__(self, backend, similarity_threshold=ANSWER_CACHE_SIMILARITY, index_stamp_path=INDEX_STAMP_PATH):
+        self.backend = backend
+        self.similarity_threshold = similarity_threshold
+        self.index_stamp_path = index_stamp_path
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._stamp_stat = self._stat_stamp()
+        self._index_version = read_index_version(index_stamp_path)
+        self._lock = threading.Lock()
+
+    def lookup_exact(self, question):
+        with self._lock:
+            return self._lookup_exact(question)
+
+    def lookup_semantic(self, embedding):
+        with self._lock:
+            return self._lookup_semantic(embedding)
+
+    def store(self, question, answer, embedding=None):
+        with self._lock:
+            self._store(question, answer, embedding)
+
+    def _lookup_exact(self, question):
+        self._check_index_version()
+        answer = self.backend.get(normalize_question(question))
+        if answer is not None:
+            self.exact_hits += 1
+        return answer
+
+    def _lookup_semantic(self, embedding):
+        # Called after an exact miss; counts the lookup as a miss if nothing
+        # close enough is cached
+        if embedding is not None:
+            match, score = self.backend.nearest(_unit(embedding))
+            if match is not None and score >= self.similarity_threshold:
+                answer = self.backend.get(match)
+                if answer is not None:
+                    self.semantic_hits += 1
+                    return answer
+        self.misses += 1
+        return None
+
+    def _store(self, question, answer, embedding=None):
+        vector = _unit(embedding) if embedding is not None else None
+        self.backend.put(normalize_question(question), vector, answer)
+
+    # Async entry points for the apps. SQLite and Redis calls (and waiting
+    # for self._lock behind one) run in a thread, so a slow or locked store
+    # holds up only the request that hit it, not the event loop. An in-memory
+    # backend is only touched from the loop, which already serialises the
+    # calls, so they run there without the lock
+    async def _call(self, locked, unlocked, *args):
+        if getattr(self.backend, "blocking", True):
+            return await asyncio.to_thread(locked, *args)
+        return unlocked(*args)
+
+    async def alookup_exact(self, question):
+        return await self._call(self.lookup_exact, self._lookup_exact, question)
+
+    async def alookup_semantic(self, embedding):
+        return await self._call(self.lookup_semantic, self._lookup_semantic, embedding)
+
+    async def astore(self, question, answer, embedding=None):
+        await self._call(self.store, self._store, question, answer, embedding)
+
+    def close(self):
+        with self._lock:
+            self.backend.close()
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self.backend),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
+
+    def _stat_stamp(self):
+        try:
+            stat = os.stat(self.index_stamp_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _check_index_version(self):
+        # The stamp is only re-read when the file changes; bump_index_version
+        # rewrites it, which moves its mtime
+        stamp_stat = self._stat_stamp()
+        if stamp_stat == self._stamp_stat:
+            return
+        self._stamp_stat = stamp_stat
+        version = read_index_version(self.index_stamp_path)
+        if version != self._index_version:
+            self.backend.clear()
+            self._index_version = version
+
+
+def build_answer_cache():
+    # Returns None when caching is switched off
+    if ANSWER_CACHE_BACKEND == "off":
+        return None
+    if ANSWER_CACHE_BACKEND == "sqlite":
+        return AnswerCache(SQLiteCacheBackend())
+    if ANSWER_CACHE_BACKEND == "redis":
+        return AnswerCache(RedisCacheBackend())
+    return AnswerCache(MemoryCacheBackend())
+
+
+class QueryEmbeddingMemo(Embeddings):
+    """Remembers recent query embeddings so the vector the cache looked up
+    is reused by the retriever instead of being requested twice."""
+
+    def __init__(self, embeddings, max_entries=256):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text):
+        vector = self._recall(text)
+        if vector is None:
+            vector = self._remember(text, self.embeddings.embed_query(text))
+        return vector
+
+    async def aembed_query(self, text):
+        vector = self._recall(text)
+        if vector is None:
+            vector = self._remember(text, await self.embeddings.aembed_query(text))
+        return vector
+
+    def prime(self, texts, vectors):
+        """Remembers vectors computed elsewhere, e.g. in one batched request."""
+        for text, vector in zip(texts, vectors):
+            self._remember(text, vector)
+
+    def _recall(self, text):
+        with self._lock:
+            vector = self._memo.get(text)
+            if vector is not None:
+                self._memo.move_to_end(text)
+            return vector
+
+    def _remember(self, text, vector):
+        with self._lock:
+            self._memo[text] = vector
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        return vector
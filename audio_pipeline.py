@@ -0,0 +1,333 @@
+import asyncio
+import io
+import os
+import shutil
+import struct
+import tempfile
+import wave
+
+import numpy as np
+
+# Streaming transcription for voice uploads. Audio is read in fixed-size
+# chunks, so memory stays bounded whatever the recording length. Decodable
+# audio is split on silence as it arrives, and the segments are transcribed
+# concurrently and stitched back in order. A long voice note then takes about
+# as long as its slowest segment rather than the sum of all of them. WAV is
+# decoded in-process; other formats are decoded by ffmpeg when it is
+# installed, and otherwise sent to Whisper whole, as before.
+
+AUDIO_CHUNK_BYTES = int(os.getenv("AUDIO_CHUNK_BYTES", str(64 * 1024)))
+AUDIO_MAX_BYTES = int(os.getenv("AUDIO_MAX_BYTES", str(100 * 1024 * 1024)))
+TRANSCRIBE_SPLIT = os.getenv("TRANSCRIBE_SPLIT", "on")  # on | off
+TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", "4"))
+SEGMENT_MIN_SECONDS = float(os.getenv("TRANSCRIBE_SEGMENT_MIN_SECONDS", "10"))
+SEGMENT_MAX_SECONDS = float(os.getenv("TRANSCRIBE_SEGMENT_MAX_SECONDS", "45"))
+SILENCE_DB = float(os.getenv("TRANSCRIBE_SILENCE_DB", "-40"))
+MIN_SILENCE_SECONDS = float(os.getenv("TRANSCRIBE_MIN_SILENCE_SECONDS", "0.5"))
+FFMPEG = shutil.which("ffmpeg") if os.getenv("AUDIO_FFMPEG", "on") == "on" else None
+FFMPEG_SAMPLE_RATE = 16000
+
+_FRAME_SECONDS = 0.03
+_EXTENSIONS = {
+    "audio/wav": ".wav", "audio/x-wav": ".wav", "audio/wave": ".wav", "audio/webm": ".webm",
+    "audio/ogg": ".ogg", "audio/mpeg": ".mp3", "audio/mp3": ".mp3", "audio/mp4": ".m4a",
+    "audio/x-m4a": ".m4a", "audio/flac": ".flac",
+}
+
+
+class AudioTooLarge(ValueError):
+    pass
+
+
+def filename_for(content_type, default="audio.webm"):
+    """Whisper picks the decoder from the file extension."""
+    extension = _EXTENSIONS.get((content_type or "").split(";")[0].strip().lower())
+    return f"audio{extension}" if extension else default
+
+
+async def iter_upload(file, chunk_size=AUDIO_CHUNK_BYTES):
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _limited(chunks, max_bytes):
+    total = 0
+    async for chunk in chunks:
+        total += len(chunk)
+        if total > max_bytes:
+            raise AudioTooLarge(f"Audio upload exceeds {max_bytes} bytes")
+        yield chunk
+
+
+def wav_bytes(samples, sample_rate):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(samples.astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+class WavStreamDecoder:
+    """Incremental PCM WAV decoder: ``feed`` bytes, get mono int16 samples."""
+
+    def __init__(self):
+        self.sample_rate = None
+        self.channels = None
+        self._pending = b""
+        self._in_data = False
+        self._data_left = None
+
+    def feed(self, data):
+        self._pending += data
+        if not self._in_data:
+            self._parse_header()
+            if not self._in_data:
+                return np.zeros(0, dtype=np.int16)
+        data, self._pending = self._pending, b""
+        if self._data_left is not None:
+            data = data[:self._data_left]
+        # Keep partial sample frames for the next call; they still count
+        # towards the data left
+        frame_bytes = 2 * self.channels
+        usable = len(data) - len(data) % frame_bytes
+        self._pending = data[usable:]
+        if self._data_left is not None:
+            self._data_left -= usable
+        samples = np.frombuffer(data[:usable], dtype="<i2")
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1).astype(np.int16)
+        return samples
+
+    def _parse_header(self):
+        buffer = self._pending
+        if len(buffer) < 12:
+            return
+        if buffer[:4] != b"RIFF" or buffer[8:12] != b"WAVE":
+            raise ValueError("Not a WAV stream")
+        offset = 12
+        while len(buffer) >= offset + 8:
+            chunk_id, size = buffer[offset:offset + 4], struct.unpack("<I", buffer[offset + 4:offset + 8])[0]
+            if chunk_id == b"data":
+                if self.channels is None:
+                    raise ValueError("WAV data before fmt chunk")
+                self._in_data = True
+                # Streamed WAVs often leave the size at 0 or 0xFFFFFFFF
+                self._data_left = size if 0 < size < 0xFFFFFFFF else None
+                self._pending = buffer[offset + 8:]
+                return
+            if len(buffer) < offset + 8 + size:
+                return
+            if chunk_id == b"fmt ":
+                audio_format, channels, sample_rate = struct.unpack("<HHI", buffer[offset + 8:offset + 16])
+                bits = struct.unpack("<H", buffer[offset + 22:offset + 24])[0]
+                if audio_format not in (1, 0xFFFE) or bits != 16:
+                    raise ValueError("Only 16-bit PCM WAV can be split")
+                self.channels, self.sample_rate = channels, sample_rate
+            offset += 8 + size + size % 2
+
+
+class SilenceSegmenter:
+    """Cuts a PCM stream into segments at pauses.
+
+    A segment is cut at the middle of the first pause of at least
+    ``min_silence`` seconds once it is ``min_seconds`` long. If no pause
+    comes before ``max_seconds``, it is cut at the quietest frame. Segments
+    that are silent throughout are dropped, since Whisper tends to invent
+    text for them. At most ``max_seconds`` of audio is held in memory.
+    """
+
+    def __init__(self, sample_rate, min_seconds=SEGMENT_MIN_SECONDS, max_seconds=SEGMENT_MAX_SECONDS,
+                 silence_db=SILENCE_DB, min_silence=MIN_SILENCE_SECONDS):
+        self.frame = max(1, int(sample_rate * _FRAME_SECONDS))
+        self.min_frames = int(min_seconds / _FRAME_SECONDS)
+        self.max_frames = max(self.min_frames + 1, int(max_seconds / _FRAME_SECONDS))
+        self.silence_frames = max(1, int(min_silence / _FRAME_SECONDS))
+        self.threshold = 32768.0 * 10 ** (silence_db / 20)
+        self._samples = np.zeros(0, dtype=np.int16)
+        self._rms = np.zeros(0, dtype=np.float32)
+
+    def feed(self, samples):
+        self._samples = np.concatenate([self._samples, samples])
+        complete = len(self._samples) // self.frame
+        if complete > len(self._rms):
+            new = self._samples[len(self._rms) * self.frame:complete * self.frame].astype(np.float32)
+            rms = np.sqrt((new.reshape(-1, self.frame) ** 2).mean(axis=1))
+            self._rms = np.concatenate([self._rms, rms])
+        return self._cut()
+
+    def finish(self):
+        segments = self._cut()
+        tail, self._samples, self._rms = self._samples, np.zeros(0, dtype=np.int16), np.zeros(0, np.float32)
+        if len(tail) and np.abs(tail.astype(np.int32)).max() >= self.threshold:
+            segments.append(tail)
+        return segments
+
+    def _cut(self):
+        segments = []
+        while len(self._rms) > self.min_frames:
+            silent = (self._rms < self.threshold).astype(np.int32)
+            window = np.convolve(silent, np.ones(self.silence_frames, dtype=np.int32), mode="valid")
+            last_start = min(len(window), self.max_frames - self.silence_frames + 1)
+            runs = np.flatnonzero(window[self.min_frames:last_start] == self.silence_frames)
+            if len(runs):
+                cut = self.min_frames + int(runs[0]) + self.silence_frames // 2
+            elif len(self._rms) >= self.max_frames:
+                cut = self.min_frames + int(np.argmin(self._rms[self.min_frames:self.max_frames]))
+            else:
+                break
+            segment = self._samples[:cut * self.frame]
+            self._samples = self._samples[cut * self.frame:]
+            self._rms = self._rms[cut:]
+            if (silent[:cut] == 0).any():
+                segments.append(segment)
+        return segments
+
+
+class AudioTranscriber:
+    """Transcribes uploads with Whisper, splitting decodable audio on silence.
+
+    Works with both the async and the sync OpenAI client; sync calls run in
+    worker threads. Segments wait for a free transcription slot before more
+    of the upload is read, which keeps memory bounded.
+    """
+
+    def __init__(self, client, model="whisper-1", concurrency=TRANSCRIBE_CONCURRENCY,
+                 split=TRANSCRIBE_SPLIT == "on", max_bytes=AUDIO_MAX_BYTES):
+        self.client = client
+        self.model = model
+        self.concurrency = concurrency
+        self.split = split
+        self.max_bytes = max_bytes
+
+    async def transcribe_upload(self, file):
+        """Transcribes a FastAPI ``UploadFile``."""
+        filename = file.filename or filename_for(file.content_type)
+        return await self.transcribe_stream(iter_upload(file), filename)
+
+    async def transcribe_stream(self, chunks, filename="audio.webm"):
+        """Transcribes an async iterator of audio bytes."""
+        chunks = _limited(chunks, self.max_bytes)
+        first = b""
+        async for first in chunks:
+            if first:
+                break
+        if not first:
+            return ""
+
+        if self.split and first[:4] == b"RIFF":
+            decoder = WavStreamDecoder()
+            try:
+                samples = decoder.feed(first)
+            except ValueError:
+                decoder = None
+            if decoder is not None:
+                return await self._transcribe_segments(self._wav_pcm(decoder, samples, chunks))
+        elif self.split and FFMPEG:
+            return await self._transcribe_segments(self._ffmpeg_pcm(first, chunks))
+        return await self._transcribe_whole(first, chunks, filename)
+
+    async def _wav_pcm(self, decoder, samples, chunks):
+        yield decoder.sample_rate, samples
+        async for chunk in chunks:
+            yield decoder.sample_rate, decoder.feed(chunk)
+
+    async def _ffmpeg_pcm(self, first, chunks):
+        # Decode any container ffmpeg understands to 16 kHz mono PCM as it arrives
+        proc = await asyncio.create_subprocess_exec(
+            FFMPEG, "-nostdin", "-loglevel", "error", "-i", "pipe:0", "-f", "s16le", "-ac", "1",
+            "-ar", str(FFMPEG_SAMPLE_RATE), "pipe:1",
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+        )
+
+        async def feed():
+            try:
+                proc.stdin.write(first)
+                await proc.stdin.drain()
+                async for chunk in chunks:
+                    proc.stdin.write(chunk)
+                    await proc.stdin.drain()
+            finally:
+                proc.stdin.close()
+
+        feeder = asyncio.create_task(feed())
+        try:
+            pending = b""
+            while True:
+                data = await proc.stdout.read(AUDIO_CHUNK_BYTES)
+                if not data:
+                    break
+                data, pending = pending + data, b""
+                if len(data) % 2:
+                    data, pending = data[:-1], data[-1:]
+                yield FFMPEG_SAMPLE_RATE, np.frombuffer(data, dtype="<i2")
+            await feeder
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+            feeder.cancel()
+
+    async def _transcribe_segments(self, pcm):
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = []
+
+        async def run(index, samples, sample_rate):
+            try:
+                return await self._transcribe((f"segment-{index:03d}.wav", wav_bytes(samples, sample_rate)))
+            finally:
+                slots.release()
+
+        async def dispatch(segments, sample_rate):
+            for samples in segments:
+                await slots.acquire()
+                tasks.append(asyncio.create_task(run(len(tasks), samples, sample_rate)))
+
+        try:
+            segmenter = None
+            sample_rate = None
+            async for sample_rate, samples in pcm:
+                if segmenter is None:
+                    segmenter = SilenceSegmenter(sample_rate)
+                await dispatch(segmenter.feed(samples), sample_rate)
+            if segmenter is not None:
+                await dispatch(segmenter.finish(), sample_rate)
+            texts = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            await pcm.aclose()
+        return " ".join(text.strip() for text in texts if text.strip())
+
+    async def _transcribe_whole(self, first, chunks, filename):
+        # Not splittable here: spool to disk chunk by chunk, then send as one file
+        suffix = os.path.splitext(filename)[1] or ".webm"
+        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+        # Removed however the spooling ends (too large, client gone, API error)
+        tmp_path = tmp.name
+        try:
+            with tmp:
+                tmp.write(first)
+                async for chunk in chunks:
+                    tmp.write(chunk)
+            with open(tmp_path, "rb") as f:
+                return await self._transcribe(f)
+        finally:
+            os.remove(tmp_path)
+
+    async def _transcribe(self, file):
+        # Imported here; the client exists, so openai is already loaded
+        from openai import AsyncOpenAI
+
+        create = self.client.audio.transcriptions.create
+        if isinstance(self.client, AsyncOpenAI):
+            transcript = await create(model=self.model, file=file)
+        else:
+            transcript = await asyncio.to_thread(create, model=self.model, file=file)
+        return transcript.text
@@ -0,0 +1,291 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_services import start_fake_server
+from loadtest import free_port, post_multipart, start_app
+
+# Sustained-load benchmark for the FastAPI apps, run offline against the
+# fake OpenAI/Pinecone services. A fixed number of closed-loop clients send a
+# weighted mix of /api/query and /api/transcribe requests for a set duration.
+# The report gives requests/sec, p50/p95/p99 latency per endpoint, the app's
+# RSS growth and the upstream calls made. --report writes it as JSON, and
+# --baseline compares against an earlier report, exiting non-zero on a
+# regression beyond --tolerance.
+
+QUESTIONS = [
+    "What does the RS-1 zone allow?",
+    "How tall can a building be in RT-2?",
+    "What are the parking requirements for a duplex?",
+    "Can I build a laneway house on my lot?",
+    "What setbacks apply to a corner lot?",
+]
+
+
+def percentile(sorted_values, q):
+    # Nearest-rank on a sorted list; q in [0, 100]
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def rss_mb(pid):
+    # Linux only; None elsewhere. Includes child processes (the workers of serve.py).
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            total = next(int(line.split()[1]) / 1024 for line in f if line.startswith("VmRSS:"))
+    except (OSError, StopIteration):
+        return None
+    return total + sum(rss_mb(child) or 0 for child in _children(pid))
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, pid, interval=0.25):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            value = rss_mb(self.pid)
+            if value is not None:
+                self.samples.append(value)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def send_query(base_url, worker, i):
+    question = f"{QUESTIONS[i % len(QUESTIONS)]} (client {worker}, #{i})"
+    data = urllib.parse.urlencode({"message": question, "session_id": f"bench-{worker}-{i}"}).encode("utf-8")
+    with urllib.request.urlopen(f"{base_url}/api/query", data=data, timeout=120) as resp:
+        json.loads(resp.read())
+
+
+def send_transcribe(base_url, worker, i):
+    json.loads(post_multipart(f"{base_url}/api/transcribe", {"session_id": f"bench-{worker}-{i}"}))
+
+
+ENDPOINTS = {"query": send_query, "transcribe": send_transcribe}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}' in --mix; expected {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def client_loop(base_url, worker, mix, seed, warmup_until, stop_at, results):
+    rng = random.Random(seed * 1000 + worker)
+    names, weights = list(mix), list(mix.values())
+    i = 0
+    while time.perf_counter() < stop_at:
+        name = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            ENDPOINTS[name](base_url, worker, i)
+            ok = True
+        except (OSError, ValueError):
+            ok = False
+        end = time.perf_counter()
+        if start >= warmup_until:
+            results.append((name, end - start, ok, end))
+        i += 1
+
+
+def fetch_json(url, method="GET"):
+    with urllib.request.urlopen(urllib.request.Request(url, method=method)) as resp:
+        return json.loads(resp.read() or b"{}")
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency for _, latency, ok, _ in samples if ok)
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, _, ok, _ in samples if not ok),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def run_benchmark(app_module, args, mix):
+    fake = start_fake_server(latency=args.latency, token_latency=args.token_latency)
+    fake_url = f"http://127.0.0.1:{fake.server_port}"
+    port = free_port()
+    # Caches off by default: every request should pay the full pipeline
+    extra_env = {} if args.cache else {"ANSWER_CACHE_BACKEND": "off", "EMBEDDING_CACHE": "off"}
+    app = start_app(app_module, fake_url, port, extra_env, workers=args.workers)
+    base_url = f"http://127.0.0.1:{port}"
+    sampler = MemorySampler(app.pid)
+    try:
+        for name in mix:
+            ENDPOINTS[name](base_url, "warmup", 0)
+        rss_start = rss_mb(app.pid)
+        sampler.start()
+
+        results = []
+        start = time.perf_counter()
+        warmup_until = start + args.warmup
+        stop_at = warmup_until + args.duration
+        # Upstream calls are counted from the end of the warmup
+        reset = threading.Timer(args.warmup, fetch_json, (f"{fake_url}/stats/reset", "POST"))
+        reset.start()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for worker in range(args.concurrency):
+                pool.submit(client_loop, base_url, worker, mix, args.seed, warmup_until, stop_at, results)
+        # Requests still in flight at the deadline finish and are counted
+        elapsed = max(stop_at, max((end for *_, end in results), default=stop_at)) - warmup_until
+        sampler.stop()
+        rss_end = rss_mb(app.pid)
+        upstream = fetch_json(f"{fake_url}/stats")
+    finally:
+        app.terminate()
+        app.wait()
+        fake.shutdown()
+
+    report = {
+        "app": app_module,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            "workers": args.workers, "concurrency": args.concurrency, "duration": args.duration, "warmup": args.warmup,
+            "latency": args.latency, "token_latency": args.token_latency, "mix": mix, "cache": args.cache,
+        },
+        "elapsed_s": elapsed,
+        "overall": summarize(results, elapsed),
+        "endpoints": {name: summarize([r for r in results if r[0] == name], elapsed) for name in mix},
+        "memory_mb": {
+            "start": rss_start, "end": rss_end,
+            "peak": max(sampler.samples, default=rss_end),
+            "growth": rss_end - rss_start if rss_start is not None and rss_end is not None else None,
+        },
+        "upstream_calls": upstream.get("requests", {}),
+        "upstream_peak_in_flight": upstream.get("peak_in_flight"),
+    }
+    return report
+
+
+def print_report(report):
+    config = report["config"]
+    print(f"\n{report['app']} @ {report['commit'] or '?'}: {config.get('workers', 1)} worker(s), "
+          f"{config['concurrency']} clients, "
+          f"{config['duration']:.0f}s, {config['latency'] * 1000:.0f}ms upstream latency")
+    print(f"{'endpoint':<12}{'requests':>10}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'max ms':>9}")
+    for name, stats in [*report["endpoints"].items(), ("overall", report["overall"])]:
+        print(f"{name:<12}{stats['requests']:>10}{stats['errors']:>8}{stats['rps']:>9.1f}{stats['p50_ms']:>9.0f}"
+              f"{stats['p95_ms']:>9.0f}{stats['p99_ms']:>9.0f}{stats['max_ms']:>9.0f}")
+    memory = report["memory_mb"]
+    if memory["start"] is not None:
+        print(f"RSS: {memory['start']:.0f} MB -> {memory['end']:.0f} MB "
+              f"(peak {memory['peak']:.0f} MB, growth {memory['growth']:+.1f} MB)")
+    calls = ", ".join(f"{route} {count}" for route, count in sorted(report["upstream_calls"].items()))
+    print(f"Upstream calls: {calls} (peak in flight {report['upstream_peak_in_flight']})")
+
+
+def compare(report, baseline, tolerance):
+    """Regressions of ``report`` against ``baseline``, as readable strings."""
+    problems = []
+    for name, stats in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before:
+            continue
+        if before["rps"] and stats["rps"] < before["rps"] * (1 - tolerance):
+            problems.append(f"{name}: rps {before['rps']:.1f} -> {stats['rps']:.1f}")
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if before[key] and stats[key] > before[key] * (1 + tolerance):
+                problems.append(f"{name}: {key} {before[key]:.0f} -> {stats[key]:.0f}")
+        if stats["errors"] > before["errors"]:
+            problems.append(f"{name}: errors {before['errors']} -> {stats['errors']}")
+    growth, before_growth = report["memory_mb"]["growth"], baseline.get("memory_mb", {}).get("growth")
+    # Small absolute slack: RSS moves a few MB between runs on its own
+    if growth is not None and before_growth is not None and growth > max(before_growth, 0) * (1 + tolerance) + 5:
+        problems.append(f"memory growth {before_growth:+.1f} MB -> {growth:+.1f} MB")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline throughput/latency benchmark for the RAG API")
+    parser.add_argument("--app", nargs="+", default=["main"], help="Modules exposing the FastAPI app")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes; more than 1 runs serve.py")
+    parser.add_argument("--concurrency", type=int, default=16, help="Closed-loop clients")
+    parser.add_argument("--duration", type=float, default=20, help="Measured seconds per app")
+    parser.add_argument("--warmup", type=float, default=2, help="Seconds of load before measuring")
+    parser.add_argument("--latency", type=float, default=0.1, help="Artificial latency per upstream call")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Seconds between streamed tokens")
+    parser.add_argument("--mix", default="query=4,transcribe=1", help="Endpoint weights, e.g. query=4,transcribe=1")
+    parser.add_argument("--cache", action="store_true", help="Leave the answer and embedding caches on")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", help="Write the report(s) as JSON to this path")
+    parser.add_argument("--baseline", help="Earlier --report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    reports = []
+    for app_module in args.app:
+        report = run_benchmark(app_module, args, mix)
+        print_report(report)
+        reports.append(report)
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"\n📝 Report written to {args.report}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baselines = {report["app"]: report for report in json.load(f)}
+        regressions = []
+        for report in reports:
+            if report["app"] in baselines:
+                regressions += [f"{report['app']} {problem}"
+                                for problem in compare(report, baselines[report["app"]], args.tolerance)]
+        if regressions:
+            print("\n❌ Regressions against the baseline:")
+            for problem in regressions:
+                print(f"  - {problem}")
+            sys.exit(1)
+        print("\n✅ No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
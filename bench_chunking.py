@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from pypdf import PdfReader
+
+from fake_services import lexical_embedding
+from hierarchical_chunking import CHILD_FETCH_K, ParentStore, expand_to_parents, split_structured
+from ingestion import estimate_tokens
+from local_index import LocalVectorIndex
+
+# Chunking and retrieval parameter sweep over the PDFs in data/.
+# For each splitter setting (chunk_size, chunk_overlap) the pages are split,
+# embedded and indexed in a local flat index. For each k, the labelled
+# questions in bench_questions.jsonl are then run against that index. A
+# question counts as a hit when one of the top k chunks contains its evidence
+# phrase. Embeddings come from fake_services.lexical_embedding: deterministic,
+# offline and free, and close enough to keyword retrieval to rank settings
+# against each other. Absolute hit rates with real embeddings will differ.
+# The "structured" row indexes hierarchical_chunking's child chunks and, for
+# each k, returns the top k parent sections of the CHILD_FETCH_K best children.
+#
+#   python bench_chunking.py --chunk-sizes 500 1000 1500 --overlaps 0 150 --k 3 5 8 --report chunking.json
+
+QUESTIONS_PATH = "bench_questions.jsonl"
+
+
+class LexicalEmbeddings(Embeddings):
+    def __init__(self, dim=1536):
+        self.dim = dim
+
+    def embed_documents(self, texts):
+        return [lexical_embedding(text, self.dim) for text in texts]
+
+    def embed_query(self, text):
+        return lexical_embedding(text, self.dim)
+
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+
+def load_pages(folder):
+    # Parsed once and shared by every setting; extraction isn't what's being compared
+    pages = []
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith(".pdf"):
+            reader = PdfReader(os.path.join(folder, filename))
+            pages.extend(Document(page_content=page.extract_text() or "", metadata={"source": filename, "page": i})
+                         for i, page in enumerate(reader.pages))
+    return pages
+
+
+def load_questions(path=QUESTIONS_PATH):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def dir_size_mb(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1e6
+
+
+def build_index(pages, chunk_size, chunk_overlap, embedding, path):
+    start = time.perf_counter()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = splitter.split_documents(pages)
+    index = LocalVectorIndex(embedding, mode="flat")
+    index.add_documents(chunks, ids=[str(i) for i in range(len(chunks))])
+    index.save(path)
+    return index, len(chunks), time.perf_counter() - start
+
+
+def build_structured_index(pages, embedding, path):
+    start = time.perf_counter()
+    children = []
+    store = ParentStore(f"{path}-parents")
+    for source in sorted({page.metadata["source"] for page in pages}):
+        texts = [page.page_content for page in pages if page.metadata["source"] == source]
+        source_children, parents = split_structured(texts, source)
+        store.put(source, parents)
+        children.extend(source_children)
+    index = LocalVectorIndex(embedding, mode="flat")
+    index.add_documents(children, ids=[str(i) for i in range(len(children))])
+    index.save(path)
+    return index, store, len(children), time.perf_counter() - start
+
+
+def run_queries(index, questions, k, embedding, store=None):
+    latencies, tokens, hits, reciprocal_ranks = [], [], 0, 0.0
+    for question in questions:
+        start = time.perf_counter()
+        vector = embedding.embed_query(question["question"])
+        if store is None:
+            docs = index.similarity_search_by_vector(vector, k=k)
+        else:
+            docs = expand_to_parents(index.similarity_search_by_vector(vector, k=CHILD_FETCH_K), store, k)
+        latencies.append(time.perf_counter() - start)
+        tokens.append(sum(estimate_tokens(doc.page_content) for doc in docs))
+        evidence = _normalize(question["evidence"])
+        rank = next((i for i, doc in enumerate(docs, 1) if evidence in _normalize(doc.page_content)), None)
+        if rank is not None:
+            hits += 1
+            reciprocal_ranks += 1 / rank
+    return {
+        "hit_rate": hits / len(questions),
+        "mrr": reciprocal_ranks / len(questions),
+        "context_tokens": float(np.mean(tokens)),
+        "query_p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "query_p95_ms": float(np.percentile(latencies, 95)) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunking / k sweep over data/")
+    parser.add_argument("--data", default="data")
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[300, 500, 1000, 1500])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[0, 150])
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 5, 8])
+    parser.add_argument("--no-structured", action="store_true", help="Skip the structured chunking row")
+    parser.add_argument("--report", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    pages = load_pages(args.data)
+    parse_seconds = time.perf_counter() - start
+    questions = load_questions(args.questions)
+    embedding = LexicalEmbeddings()
+    print(f"{len(pages)} pages parsed in {parse_seconds:.1f}s (not included below); "
+          f"{len(questions)} labelled questions\n")
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="bench_chunking_")
+    try:
+        for chunk_size in args.chunk_sizes:
+            for chunk_overlap in args.overlaps:
+                if chunk_overlap >= chunk_size:
+                    continue
+                path = os.path.join(workdir, f"{chunk_size}-{chunk_overlap}")
+                index, chunks, ingest_seconds = build_index(pages, chunk_size, chunk_overlap, embedding, path)
+                index_mb = dir_size_mb(path)
+                for k in args.k:
+                    results.append({
+                        "chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "k": k, "chunks": chunks,
+                        "ingest_seconds": ingest_seconds, "chunks_per_second": chunks / ingest_seconds,
+                        "index_mb": index_mb, **run_queries(index, questions, k, embedding),
+                    })
+        if not args.no_structured:
+            path = os.path.join(workdir, "structured")
+            index, store, chunks, ingest_seconds = build_structured_index(pages, embedding, path)
+            index_mb = dir_size_mb(path)
+            for k in args.k:
+                results.append({
+                    "chunk_size": "struct", "chunk_overlap": "-", "k": k, "chunks": chunks,
+                    "ingest_seconds": ingest_seconds, "chunks_per_second": chunks / ingest_seconds,
+                    "index_mb": index_mb, **run_queries(index, questions, k, embedding, store),
+                })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'size':>5} {'overlap':>7} {'k':>3} {'chunks':>6} {'ingest s':>8} {'chunks/s':>8} {'index MB':>8} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'ctx tok':>7} {'hit rate':>8} {'MRR':>5}")
+    for row in results:
+        print(f"{row['chunk_size']:>5} {row['chunk_overlap']:>7} {row['k']:>3} {row['chunks']:>6} "
+              f"{row['ingest_seconds']:>8.2f} {row['chunks_per_second']:>8.0f} {row['index_mb']:>8.2f} "
+              f"{row['query_p50_ms']:>7.2f} {row['query_p95_ms']:>7.2f} {row['context_tokens']:>7.0f} "
+              f"{row['hit_rate']:>8.0%} {row['mrr']:>5.2f}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"pages": len(pages), "questions": len(questions), "results": results}, f, indent=2)
+        print(f"\n📝 Results written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from bench_chunking import QUESTIONS_PATH, LexicalEmbeddings, _normalize, dir_size_mb, load_pages, load_questions
+from compact_vectors import CompactEmbeddings, FullVectorStore, RescoringVectorStore, shorten
+from local_index import LocalVectorIndex
+
+# Recall vs size of compact vector storage over the PDFs in data/.
+# The pages are split as in preprocessing (1000/150) and embedded once at
+# full width. For each width (--dims, 0 = full) and dtype, the shortened
+# vectors are put in a local flat index, and every query is run with and
+# without exact rescoring against the full-precision sidecar. recall@k is
+# the share of the exact full-width top k that is found. The hit rate is the
+# share of labelled questions in bench_questions.jsonl whose evidence is
+# in the top k. Queries are the labelled questions plus sentences sampled
+# from the chunks.
+#
+# --embeddings lexical (the default) is offline and free. Its feature-hashed
+# vectors are not trained to be shortened the way text-embedding-3 vectors
+# are, so recall without rescoring is pessimistic. Use --embeddings openai
+# (OPENAI_API_KEY; vectors go through the embedding cache) to choose a real
+# setting.
+#
+#   python bench_compact.py --dims 0 512 256 --dtypes float32 int8 --k 5 --report compact.json
+
+
+def build_embeddings(kind):
+    if kind == "lexical":
+        return LexicalEmbeddings()
+    from langchain_openai.embeddings import OpenAIEmbeddings
+    from embedding_cache import cached_embeddings
+
+    return cached_embeddings(OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"), model="text-embedding-3-small"))
+
+
+def sample_queries(texts, count, seed=0):
+    sentences = [sentence.strip() for text in texts for sentence in re.split(r"(?<=[.?!])\s+", text)
+                 if 40 <= len(sentence.strip()) <= 200]
+    return random.Random(seed).sample(sentences, min(count, len(sentences)))
+
+
+def exact_top_k(full, query_vectors, k):
+    scores = query_vectors @ full.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def run_setting(index, search, query_vectors, truth, labelled, k):
+    recalls, latencies, hits = [], [], 0
+    for i, vector in enumerate(query_vectors):
+        start = time.perf_counter()
+        docs = search(vector, k)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len({int(doc.id) for doc in docs} & truth[i]) / k)
+        if i < len(labelled):
+            evidence = _normalize(labelled[i]["evidence"])
+            hits += any(evidence in _normalize(doc.page_content) for doc in docs)
+    return {
+        "recall": float(np.mean(recalls)),
+        "hit_rate": hits / len(labelled),
+        "query_p50_ms": float(np.percentile(latencies, 50)) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs size of compact (shortened / int8) vectors")
+    parser.add_argument("--data", default="data")
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--embeddings", default="lexical", choices=["lexical", "openai"])
+    parser.add_argument("--dims", type=int, nargs="+", default=[0, 1024, 512, 256, 128])
+    parser.add_argument("--dtypes", nargs="+", default=["float32", "int8"], choices=["float32", "int8"])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--oversample", type=int, default=4)
+    parser.add_argument("--sample-queries", type=int, default=200)
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    parser.add_argument("--report", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    chunks = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150).split_documents(
+        load_pages(args.data))
+    texts = [chunk.page_content for chunk in chunks]
+    labelled = load_questions(args.questions)
+    queries = [question["question"] for question in labelled] + sample_queries(texts, args.sample_queries)
+    embedding = build_embeddings(args.embeddings)
+    full = shorten(embedding.embed_documents(texts), 0)
+    query_vectors = shorten([embedding.embed_query(query) for query in queries], 0)
+    truth = exact_top_k(full, query_vectors, args.k)
+    print(f"{len(chunks)} chunks, {full.shape[1]} dimensions, {len(queries)} queries "
+          f"({len(labelled)} labelled), {args.embeddings} embeddings\n")
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="bench_compact_")
+    try:
+        sidecar = FullVectorStore(os.path.join(workdir, "full_vectors"))
+        sidecar.put(texts, full)
+        sidecar.save()
+        sidecar_mb = dir_size_mb(sidecar.path)
+        for dim in args.dims:
+            vectors = shorten(full, dim)
+            for dtype in args.dtypes:
+                path = os.path.join(workdir, f"{dim}-{dtype}")
+                compact = CompactEmbeddings(embedding, dim, FullVectorStore(sidecar.path))
+                index = LocalVectorIndex(compact, mode="flat", dtype=dtype)
+                index.add_embeddings(texts, vectors, [chunk.metadata for chunk in chunks],
+                                     [str(i) for i in range(len(texts))])
+                index.save(path)
+                index = LocalVectorIndex.load(path, compact)
+                vector_mb = sum(os.path.getsize(os.path.join(path, name)) / 1e6
+                                for name in ("vectors.npy", "scales.npy") if os.path.exists(os.path.join(path, name)))
+                rescoring = RescoringVectorStore(index, args.oversample)
+                searches = {
+                    "off": lambda vector, k: index.similarity_search_by_vector(shorten(vector, dim)[0], k),
+                    "on": rescoring.similarity_search_by_vector,
+                }
+                for rescore, search in searches.items():
+                    results.append({
+                        "dims": vectors.shape[1], "dtype": dtype, "rescore": rescore, "vector_mb": vector_mb,
+                        "sidecar_mb": sidecar_mb if rescore == "on" else 0.0,
+                        **run_setting(index, search, query_vectors, truth, labelled, args.k),
+                    })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'dims':>5} {'dtype':>7} {'rescore':>7} {'index MB':>8} {'sidecar MB':>10} "
+          f"{f'recall@{args.k}':>9} {'hit rate':>8} {'p50 ms':>7}")
+    for row in results:
+        print(f"{row['dims']:>5} {row['dtype']:>7} {row['rescore']:>7} {row['vector_mb']:>8.2f} "
+              f"{row['sidecar_mb']:>10.2f} {row['recall']:>9.1%} {row['hit_rate']:>8.0%} {row['query_p50_ms']:>7.2f}")
+
+    # The sidecar stays on local disk; what shrinks is the index the queries hit
+    baseline = results[0]
+    keeps_quality = [row for row in results
+                     if row["recall"] >= args.min_recall and row["hit_rate"] >= baseline["hit_rate"]]
+    if keeps_quality:
+        best = min(keeps_quality, key=lambda row: row["vector_mb"])
+        print(f"\n✅ Smallest index with recall@{args.k} >= {args.min_recall:.0%} and no loss in hit rate: "
+              f"EMBEDDING_DIMENSIONS={best['dims']} LOCAL_INDEX_DTYPE={best['dtype']} RESCORE={best['rescore']} "
+              f"({best['vector_mb']:.2f} MB vs {baseline['vector_mb']:.2f} MB)")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"chunks": len(chunks), "queries": len(queries), "embeddings": args.embeddings,
+                       "k": args.k, "oversample": args.oversample, "results": results}, f, indent=2)
+        print(f"\n📝 Results written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
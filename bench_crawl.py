@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import requests
+
+from fake_services import fake_pdf, start_pdf_site
+from pdf_files_COV import run_crawl, summarize
+
+# Crawler benchmark against a local PDF site: the old sequential download
+# loop versus the concurrent crawler, then re-runs that exercise the
+# conditional GETs (nothing changed), a changed file, and a download cut off
+# mid-transfer that has to resume.
+
+
+def run_sequential(site, names, folder, delay):
+    # What pdf_files_COV.py used to do: each file, one after another, every time
+    start = time.perf_counter()
+    for name in names:
+        resp = requests.get(site.url(name), timeout=30)
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(resp.content)
+        time.sleep(delay)
+    return time.perf_counter() - start
+
+
+def crawl(site, folder, args):
+    site.reset()
+    results, downloaded, elapsed = asyncio.run(run_crawl(
+        folder, [], [site.url("brochures.html")], max_connections=args.max_connections,
+        per_host=args.per_host, host_delay=args.host_delay, retries=2,
+    ))
+    return summarize(results), downloaded, elapsed, site.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF crawler benchmark")
+    parser.add_argument("--files", type=int, default=12)
+    parser.add_argument("--pages", type=int, default=20, help="Size of each fake PDF")
+    parser.add_argument("--latency", type=float, default=0.2, help="Server latency per request")
+    parser.add_argument("--max-connections", type=int, default=8)
+    parser.add_argument("--per-host", type=int, default=4)
+    parser.add_argument("--host-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    files = {f"brochure-{i}.pdf": fake_pdf(f"Brochure {i} zoning by-law", args.pages) for i in range(args.files)}
+    site = start_pdf_site(files, latency=args.latency)
+    work_dir = tempfile.mkdtemp(prefix="bench_crawl_")
+    failures = []
+
+    def check(label, ok):
+        print(f"{'✅' if ok else '❌'} {label}")
+        if not ok:
+            failures.append(label)
+
+    try:
+        os.makedirs(os.path.join(work_dir, "sequential"))
+        sequential = run_sequential(site, list(files), os.path.join(work_dir, "sequential"), args.host_delay)
+
+        folder = os.path.join(work_dir, "crawl")
+        first = crawl(site, folder, args)
+        second = crawl(site, folder, args)
+
+        # One file changes on the server; a new one is added and its download is cut off half way
+        site.put("brochure-0.pdf", fake_pdf("Brochure 0, amended", args.pages))
+        site.put("brochure-new.pdf", fake_pdf("New brochure", args.pages))
+        site.drop_after["brochure-new.pdf"] = len(site.files["brochure-new.pdf"][0]) // 2
+        third = crawl(site, folder, args)
+        intact = all(open(os.path.join(folder, name), "rb").read() == data
+                     for name, (data, _, _) in site.files.items())
+    finally:
+        site.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    total_mb = sum(len(data) for data in files.values()) / 1e6
+    print(f"Files                     : {args.files} x {total_mb / args.files:.2f} MB "
+          f"(server latency {args.latency}s, {args.per_host} per host)")
+    print(f"Sequential loop           : {sequential:.2f}s")
+    for label, (counts, downloaded, elapsed, stats) in (
+            ("Crawler, first run", first), ("Crawler, nothing changed", second),
+            ("Crawler, 1 changed + 1 new", third)):
+        print(f"{label:<26}: {elapsed:.2f}s  {downloaded / 1e6:.2f} MB  {counts}  "
+              f"responses {stats['responses']}  peak in flight {stats['peak_in_flight']}")
+    print(f"Speed-up (first run)      : {sequential / first[2]:.1f}x\n")
+
+    check("first run downloads every file", first[0] == {"new": args.files})
+    check("re-run is all 304s with no PDF bytes",
+          second[0] == {"unchanged": args.files} and second[1] == 0
+          and second[3]["responses"].get("304") == args.files)
+    check("changed and new files are downloaded, the rest are 304s",
+          third[0] == {"changed": 1, "new": 1, "unchanged": args.files - 1}
+          and third[3]["responses"].get("304") == args.files - 1)
+    check("cut-off download resumed with a range request",
+          third[3]["responses"].get("dropped") == 1 and third[3]["responses"].get("206") == 1)
+    check("files on disk match the server", intact)
+    check("per-host concurrency limit held",
+          max(first[3]["peak_in_flight"], third[3]["peak_in_flight"]) <= args.per_host)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import os
+import time
+
+from langchain_core.documents import Document
+from langchain_openai.embeddings import OpenAIEmbeddings
+from langchain_pinecone import PineconeVectorStore
+from pinecone import PineconeAsyncio
+
+from fake_services import start_fake_server
+from ingestion import PineconeUpsertEngine, chunk_id
+
+# Ingestion benchmark against the local OpenAI/Pinecone stand-ins: the old
+# one-batch-at-a-time PineconeVectorStore.from_documents loop versus the
+# concurrent PineconeUpsertEngine, on the same synthetic chunks.
+
+INDEX_NAME = "fake-index"
+NAMESPACE = "bench"
+
+
+def synthetic_chunks(count, size=1000):
+    words = "zoning district dwelling laneway suite rezoning setback height density parcel".split()
+    docs = []
+    for i in range(count):
+        text = " ".join(words[(i + j) % len(words)] for j in range(size // 8))[:size]
+        docs.append(Document(page_content=f"{i} {text}", metadata={"source": "bench.pdf", "page": i // 3}))
+    return docs
+
+
+def make_embeddings(fake_url):
+    # No tiktoken pass, so the benchmark runs fully offline
+    return OpenAIEmbeddings(api_key="sk-fake", base_url=f"{fake_url}/v1", model="text-embedding-3-small",
+                            check_embedding_ctx_length=False)
+
+
+def run_baseline(docs, fake_url, batch_size=100):
+    embedding = make_embeddings(fake_url)
+    start = time.perf_counter()
+    for i in range(0, len(docs), batch_size):
+        PineconeVectorStore.from_documents(
+            documents=docs[i:i + batch_size],
+            embedding=embedding,
+            index_name=INDEX_NAME,
+            namespace=NAMESPACE
+        )
+    return time.perf_counter() - start
+
+
+async def run_engine(docs, fake_url, embed_concurrency, max_inputs):
+    embedding = make_embeddings(fake_url)
+    async with PineconeAsyncio(api_key="pc-fake") as pc:
+        async with pc.IndexAsyncio(host=fake_url) as index:
+            engine = PineconeUpsertEngine(embedding, index, NAMESPACE, embed_concurrency=embed_concurrency,
+                                          max_request_inputs=max_inputs)
+            start = time.perf_counter()
+            await engine.submit([(chunk_id(doc), doc) for doc in docs])
+            await engine.drain()
+            return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion throughput benchmark")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.3, help="Artificial latency per upstream call")
+    parser.add_argument("--embed-concurrency", type=int, default=8)
+    parser.add_argument("--max-inputs", type=int, default=100, help="Chunks per embedding request")
+    args = parser.parse_args()
+
+    fake = start_fake_server(latency=args.latency)
+    fake_url = f"http://127.0.0.1:{fake.server_port}"
+    os.environ.update({
+        "PINECONE_API_KEY": "pc-fake",
+        "PINECONE_CONTROLLER_HOST": fake_url,
+    })
+    docs = synthetic_chunks(args.chunks)
+    try:
+        baseline = run_baseline(docs, fake_url)
+        engine = asyncio.run(run_engine(docs, fake_url, args.embed_concurrency, args.max_inputs))
+    finally:
+        fake.shutdown()
+
+    print(f"Chunks                         : {len(docs)} (upstream latency {args.latency}s per call)")
+    print(f"Sequential from_documents loop : {baseline:.2f}s  ({len(docs) / baseline:.1f} chunks/sec)")
+    print(f"PineconeUpsertEngine           : {engine:.2f}s  ({len(docs) / engine:.1f} chunks/sec)")
+    print(f"Speed-up                       : {baseline / engine:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from local_index import LocalVectorIndex
+
+# Recall and latency of the local index modes against exact float32 search.
+# Uses the vectors of an existing index (--index) or synthetic clustered
+# vectors, so it runs offline and costs no embedding calls.
+
+
+def synthetic_vectors(count, dim, clusters=200, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(0, clusters, count)] + 0.6 * rng.normal(size=(count, dim))).astype(np.float32)
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000
+
+
+def dir_size_mb(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1e6
+
+
+def run_config(name, vectors, queries, truth, k, workdir, **options):
+    ef_values = options.pop("ef_values", [None])
+    ids = [str(i) for i in range(len(vectors))]
+    start = time.perf_counter()
+    index = LocalVectorIndex(None, **options)
+    index.add_embeddings(ids, vectors, ids=ids)
+    build = time.perf_counter() - start
+    path = os.path.join(workdir, name)
+    index.save(path)
+
+    start = time.perf_counter()
+    index = LocalVectorIndex.load(path, None)
+    cold_load = time.perf_counter() - start
+
+    rows = []
+    for ef in ef_values:
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            found = index.search_rows(query, k, ef=ef)
+            latencies.append(time.perf_counter() - start)
+            hits += len(expected & {row for row, _ in found})
+        label = name if ef is None else f"{name} ef={ef}"
+        rows.append((label, hits / (k * len(queries)), percentile_ms(latencies, 50),
+                     percentile_ms(latencies, 95), build, cold_load * 1000, dir_size_mb(path)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local vector index recall/latency benchmark")
+    parser.add_argument("--index", help="Take vectors from an existing local index instead of synthetic data")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 64, 128])
+    args = parser.parse_args()
+
+    if args.index:
+        source = LocalVectorIndex.load(args.index, None)
+        vectors = source._rows(np.arange(source._size))
+    else:
+        vectors = synthetic_vectors(args.count, args.dim)
+    rng = np.random.default_rng(1)
+    # Queries are perturbed corpus vectors, so they land near real neighbourhoods
+    picks = rng.integers(0, len(vectors), args.queries)
+    queries = vectors[picks] + 0.3 * np.std(vectors) * rng.normal(size=(args.queries, vectors.shape[1]))
+
+    exact = LocalVectorIndex(None, mode="flat")
+    exact.add_embeddings([str(i) for i in range(len(vectors))], vectors)
+    truth = [{row for row, _ in exact.search_rows(query, args.k)} for query in queries]
+
+    workdir = tempfile.mkdtemp(prefix="bench_vector_index_")
+    try:
+        results = []
+        results += run_config("flat-float32", vectors, queries, truth, args.k, workdir, mode="flat")
+        results += run_config("flat-int8", vectors, queries, truth, args.k, workdir, mode="flat", dtype="int8")
+        results += run_config("hnsw-float32", vectors, queries, truth, args.k, workdir, mode="hnsw",
+                              ef_values=args.ef)
+        results += run_config("hnsw-int8", vectors, queries, truth, args.k, workdir, mode="hnsw", dtype="int8",
+                              ef_values=args.ef)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {args.queries} queries, recall@{args.k} "
+          f"vs exact float32")
+    print(f"{'config':<22}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}{'build s':>9}{'load ms':>9}{'disk MB':>9}")
+    for label, recall, p50, p95, build, load, size in results:
+        print(f"{label:<22}{recall:>8.3f}{p50:>9.2f}{p95:>9.2f}{build:>9.1f}{load:>9.1f}{size:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
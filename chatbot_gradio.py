@@ -1,40 +1,83 @@
 import os
+import threading
 import gradio as gr
 from dotenv import load_dotenv
-from langchain_community.vectorstores import Chroma
-from langchain_openai.embeddings import OpenAIEmbeddings
-from langchain_openai import ChatOpenAI
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from openai import OpenAI
+from session_memory import build_session_store
+from intent_router import build_intent_router, canned_reply, get_time_based_greeting
+from startup import STARTUP_MODE, LazyResource
 
 # Load environment variables
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-# Load vector store from disk
-vectorstore = Chroma(
-    persist_directory="persisted_rag",
-    embedding_function=OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-)
-
-# Create one persistent chatbot_chain per session
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-chatbot_chain = ConversationalRetrievalChain.from_llm(
-    llm=ChatOpenAI(
-        model_name="gpt-4o-mini",
-        openai_api_key=OPENAI_API_KEY,
-        temperature=0,
-        max_tokens=300
-    ),
-    retriever=vectorstore.as_retriever(search_kwargs={"k": 5}),
-    memory=memory
-)
+# chroma, or local for the in-process index built by local_index.py
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+
+
+def build_client():
+    from openai import OpenAI
+    return OpenAI(api_key=OPENAI_API_KEY)
+
+
+def build_chain():
+    # LangChain and the vector store load here, not at import, so the UI comes up first
+    from langchain_openai.embeddings import OpenAIEmbeddings
+    from langchain_openai import ChatOpenAI
+    from langchain.chains import ConversationalRetrievalChain
+    from compact_vectors import compact_embeddings
+    from hybrid_retrieval import build_retriever
+
+    # Load vector store from disk. It may hold shortened or int8 vectors
+    # (EMBEDDING_DIMENSIONS, LOCAL_INDEX_DTYPE), rescored by build_retriever
+    embedding = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
+    if VECTOR_BACKEND == "local":
+        from local_index import LOCAL_INDEX_DTYPE, LOCAL_INDEX_PATH, LocalVectorIndex
+        vectorstore = LocalVectorIndex.load(LOCAL_INDEX_PATH, compact_embeddings(
+            embedding, quantized=LOCAL_INDEX_DTYPE == "int8"))
+    else:
+        from langchain_community.vectorstores import Chroma
+        vectorstore = Chroma(
+            persist_directory="persisted_rag",
+            embedding_function=compact_embeddings(embedding)
+        )
+
+    return ConversationalRetrievalChain.from_llm(
+        llm=ChatOpenAI(
+            model_name="gpt-4o-mini",
+            openai_api_key=OPENAI_API_KEY,
+            temperature=0,
+            max_tokens=300
+        ),
+        retriever=build_retriever(vectorstore, VECTOR_BACKEND)
+    )
+
+
+# One shared chain; conversation history is kept per Gradio session
+sessions = build_session_store()
+intent_router = build_intent_router()
+client = LazyResource("transcriber", build_client)
+chatbot_chain = LazyResource("rag", build_chain)
+
+
+def warm_up():
+    try:
+        client.get()
+        chatbot_chain.get()
+        print("✅ Chatbot chain ready")
+    except Exception as e:
+        print(f"❌ Warm-up failed, will retry on the first message: {str(e)}")
 
 # Chat function with custom fallback handling
-def chat_with_pdf(message, history):
-    response = chatbot_chain.invoke({"question": message, "chat_history": history})
+def chat_with_pdf(message, history, request: gr.Request):
+    # Greetings, thanks and small talk skip the chain; follow-ups in a
+    # conversation only by the rules
+    session_id = request.session_hash
+    chat_history = sessions.get_history(session_id)
+    reply = canned_reply(intent_router.route(message, has_history=bool(chat_history)),
+                         get_time_based_greeting()) if intent_router else None
+    if reply is not None:
+        return history + [("user", message), ("assistant", reply)]
+
+    response = chatbot_chain.get().invoke({"question": message, "chat_history": chat_history})
 
     fallback_phrases = [
         "I don't know",
@@ -44,9 +87,12 @@ def chat_with_pdf(message, history):
         "I do not have enough information"
     ]
     if any(phrase.lower() in response['answer'].lower() for phrase in fallback_phrases):
-        return history + [("user", message), ("assistant", "I have no idea about this thing. I am trained on very limited data, that is why I can't answer that question.")]
+        answer = "I have no idea about this thing. I am trained on very limited data, that is why I can't answer that question."
+    else:
+        answer = response['answer']
 
-    return history + [("user", message), ("assistant", response['answer'])]
+    sessions.append(session_id, message, answer)
+    return history + [("user", message), ("assistant", answer)]
 
 # Whisper API transcription function
 def transcribe_audio(audio_file):
@@ -54,14 +100,14 @@ def transcribe_audio(audio_file):
         return "Please provide an audio input."
 
     with open(audio_file, "rb") as f:
-        transcript = client.audio.transcriptions.create(model="whisper-1", file=f)
+        transcript = client.get().audio.transcriptions.create(model="whisper-1", file=f)
     return transcript.text
 
 # Combined function for audio input
-def transcribe_and_chat(audio_file, history):
+def transcribe_and_chat(audio_file, history, request: gr.Request):
     question = transcribe_audio(audio_file)
     print(f"🗣️ Transcribed Text: {question}")
-    return chat_with_pdf(question, history)
+    return chat_with_pdf(question, history, request)
 
 # Build Gradio UI
 with gr.Blocks() as demo:
@@ -97,5 +143,11 @@ with gr.Blocks() as demo:
         outputs=chatbot_display
     )
 
+# Build the chain while Gradio starts; with STARTUP_MODE=eager, before it starts
+if STARTUP_MODE == "eager":
+    warm_up()
+elif STARTUP_MODE == "background":
+    threading.Thread(target=warm_up, daemon=True).start()
+
 # Launch the app
 demo.launch(server_name="0.0.0.0", server_port=3000, share=True)
\ No newline at end of file
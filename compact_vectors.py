@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# Compact vector storage with exact rescoring. text-embedding-3 vectors can
+# be shortened by keeping their first EMBEDDING_DIMENSIONS values and
+# re-normalising. This gives the same result as the API's `dimensions`
+# parameter, so one full-width call yields both sizes. The vector index
+# (Pinecone, Chroma or the local index, optionally int8 with
+# LOCAL_INDEX_DTYPE) stores only the short vectors. The full float32 vectors
+# go to a local sidecar (FULL_VECTORS_PATH): a memory-mapped matrix keyed by
+# the chunk text's hash. At query time RESCORE_OVERSAMPLE x k candidates are
+# fetched from the compact index and re-ranked by their exact full-width
+# cosine similarity.
+
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))  # 0 keeps the full 1536 | 512 | 256 ...
+FULL_EMBEDDING_DIMENSIONS = 1536
+RESCORE = os.getenv("RESCORE", "on")  # on | off
+RESCORE_OVERSAMPLE = int(os.getenv("RESCORE_OVERSAMPLE", "4"))
+FULL_VECTORS_PATH = os.getenv("FULL_VECTORS_PATH", "full_vectors")
+
+
+def _normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def shorten(vectors, dim=EMBEDDING_DIMENSIONS):
+    """The first ``dim`` values of each vector, re-normalised (all of them if ``dim`` is 0)."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return _normalize(vectors[:, :dim] if dim else vectors)
+
+
+def text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class FullVectorStore:
+    """Full-precision vectors by text hash: vectors.npy (memory-mapped) and keys.json.
+
+    New vectors are held in memory until ``save()``. Readers reload when the
+    files are rewritten.
+    """
+
+    def __init__(self, path=FULL_VECTORS_PATH):
+        self.path = path
+        self._pending = {}
+        self._loaded = None  # (mtime, {key: row}, vectors)
+        self._lock = threading.Lock()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _current(self):
+        try:
+            mtime = os.path.getmtime(self._file("keys.json"))
+        except OSError:
+            return {}, None
+        if self._loaded is None or self._loaded[0] != mtime:
+            with open(self._file("keys.json")) as f:
+                rows = {key: row for row, key in enumerate(json.load(f))}
+            self._loaded = (mtime, rows, np.load(self._file("vectors.npy"), mmap_mode="r"))
+        return self._loaded[1], self._loaded[2]
+
+    def put(self, texts, vectors):
+        vectors = _normalize(vectors)
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                self._pending[text_key(text)] = vector
+
+    def get(self, texts):
+        """``(found, vectors)``: a mask of the texts that have a vector, and those vectors."""
+        keys = [text_key(text) for text in texts]
+        with self._lock:
+            rows, vectors = self._current()
+            pending = dict(self._pending)
+        found = np.array([key in rows or key in pending for key in keys], dtype=bool)
+        matrix = [pending[key] if key in pending else vectors[rows[key]] for key, hit in zip(keys, found) if hit]
+        return found, np.array(matrix, dtype=np.float32).reshape(len(matrix), -1)
+
+    def save(self):
+        with self._lock:
+            if not self._pending:
+                return
+            rows, vectors = self._current()
+            # A text already stored has the same vector; only new texts are appended
+            new_keys = [key for key in self._pending if key not in rows]
+            new_vectors = np.array([self._pending[key] for key in new_keys], dtype=np.float32)
+            if vectors is not None and len(vectors):
+                merged = np.concatenate([np.asarray(vectors), new_vectors.reshape(-1, vectors.shape[1])])
+            else:
+                merged = new_vectors
+            os.makedirs(self.path, exist_ok=True)
+            # Vectors first: readers go by keys.json, whose rows are then always present
+            tmp_path = self._file(f"vectors.tmp-{os.getpid()}.npy")
+            np.save(tmp_path, merged)
+            os.replace(tmp_path, self._file("vectors.npy"))
+            tmp_path = self._file(f"keys.json.tmp-{os.getpid()}")
+            with open(tmp_path, "w") as f:
+                json.dump(list(rows) + new_keys, f)
+            os.replace(tmp_path, self._file("keys.json"))
+            self._pending = {}
+            self._loaded = None
+
+    def __len__(self):
+        rows, _ = self._current()
+        return len(set(rows) | set(self._pending))
+
+
+class CompactEmbeddings(Embeddings):
+    """Returns shortened vectors for the index; the full document vectors
+    are kept in ``store`` for rescoring."""
+
+    def __init__(self, embeddings, dim=EMBEDDING_DIMENSIONS, store=None):
+        self.embeddings = embeddings
+        self.dim = dim
+        self.store = store if store is not None else FullVectorStore()
+
+    def embed_documents(self, texts):
+        vectors = self.embeddings.embed_documents(texts)
+        self.store.put(texts, vectors)
+        return shorten(vectors, self.dim).tolist()
+
+    async def aembed_documents(self, texts):
+        vectors = await self.embeddings.aembed_documents(texts)
+        self.store.put(texts, vectors)
+        return shorten(vectors, self.dim).tolist()
+
+    def embed_query(self, text):
+        return shorten(self.embeddings.embed_query(text), self.dim)[0].tolist()
+
+    async def aembed_query(self, text):
+        return shorten(await self.embeddings.aembed_query(text), self.dim)[0].tolist()
+
+
+def compact_embeddings(embeddings, quantized=False):
+    """``embeddings`` shortened per EMBEDDING_DIMENSIONS. Also wrapped when the
+    index is ``quantized`` (int8), so the full vectors are kept for rescoring."""
+    if EMBEDDING_DIMENSIONS or quantized:
+        return CompactEmbeddings(embeddings)
+    return embeddings
+
+
+def rescore(docs, query_vector, store, k):
+    """The best ``k`` of ``docs`` by full-precision cosine similarity.
+
+    Docs with no stored vector keep their compact order, after the others.
+    """
+    found, vectors = store.get([doc.page_content for doc in docs])
+    scores = vectors @ _normalize(query_vector)[0] if len(vectors) else np.zeros(0)
+    rescored = sorted(zip(scores, [doc for doc, hit in zip(docs, found) if hit]), key=lambda pair: -pair[0])
+    return ([doc for _, doc in rescored] + [doc for doc, hit in zip(docs, found) if not hit])[:k]
+
+
+class RescoringVectorStore(VectorStore):
+    """Searches ``vectorstore`` (built with CompactEmbeddings) for
+    ``oversample`` x k candidates and re-ranks them against the full vectors."""
+
+    def __init__(self, vectorstore, oversample=RESCORE_OVERSAMPLE):
+        self.vectorstore = vectorstore
+        self.compact = vectorstore.embeddings
+        self.oversample = oversample
+
+    @property
+    def embeddings(self):
+        return self.compact
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        return self.vectorstore.add_texts(texts, metadatas, **kwargs)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, vectorstore_cls=None, oversample=RESCORE_OVERSAMPLE,
+                   **kwargs):
+        """Builds a ``vectorstore_cls`` (the local index by default) of compact
+        vectors from ``texts`` and wraps it."""
+        if vectorstore_cls is None:
+            from local_index import LocalVectorIndex
+            vectorstore_cls = LocalVectorIndex
+        if not isinstance(embedding, CompactEmbeddings):
+            embedding = CompactEmbeddings(embedding)
+        vectorstore = vectorstore_cls.from_texts(texts, embedding, metadatas, **kwargs)
+        return cls(vectorstore, oversample)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        candidates = self.vectorstore.similarity_search_by_vector(
+            shorten(embedding, self.compact.dim)[0].tolist(), k=k * self.oversample, **kwargs)
+        return rescore(candidates, embedding, self.compact.store, k)
+
+    async def asimilarity_search_by_vector(self, embedding, k=4, **kwargs):
+        candidates = await self.vectorstore.asimilarity_search_by_vector(
+            shorten(embedding, self.compact.dim)[0].tolist(), k=k * self.oversample, **kwargs)
+        return rescore(candidates, embedding, self.compact.store, k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        # One full-width query vector serves both the compact search and the rescoring
+        return self.similarity_search_by_vector(self.compact.embeddings.embed_query(query), k, **kwargs)
+
+    async def asimilarity_search(self, query, k=4, **kwargs):
+        return await self.asimilarity_search_by_vector(await self.compact.embeddings.aembed_query(query), k,
+                                                       **kwargs)
+
+
+def rescoring(vectorstore):
+    """``vectorstore`` with exact rescoring if it holds compact vectors and RESCORE is on."""
+    if RESCORE == "on" and isinstance(getattr(vectorstore, "embeddings", None), CompactEmbeddings):
+        return RescoringVectorStore(vectorstore)
+    return vectorstore
@@ -0,0 +1,189 @@
+import math
+import os
+import re
+from collections import Counter
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import run_in_executor
+from pydantic import ConfigDict
+
+from hybrid_retrieval import tokenize
+from metrics import stage
+from session_memory import estimate_tokens
+
+# Context assembly between retrieval and the answer prompt. Chunks are cut
+# with a 150-character overlap, so neighbouring chunks of the same page
+# repeat text and the top k often include two of them. This stage drops
+# duplicate chunks, merges overlapping chunks of the same source/page into
+# one passage, and, only when the result is over CONTEXT_TOKEN_BUDGET,
+# keeps the sentences that best match the question (in document order)
+# until the budget is filled. Within budget, nothing is cut. Off by default
+# until RAGAS.py shows the budget doesn't cost answer quality.
+
+CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "off")  # on | off
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "800"))
+# Shortest suffix/prefix match that counts as chunk overlap
+MIN_OVERLAP_CHARS = 20
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?;:])\s+(?=[A-Z0-9(\"'])|\n{2,}|\n(?=\s*(?:[-*•]|\(?[a-z0-9]{1,3}[.)])\s)")
+_GAP = " … "
+
+
+def _page_key(doc):
+    return doc.metadata.get("source"), doc.metadata.get("page")
+
+
+def _overlap(left, right, min_chars=MIN_OVERLAP_CHARS):
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``."""
+    if len(right) < min_chars:
+        return 0
+    probe = right[:min_chars]
+    start = left.find(probe, max(0, len(left) - len(right)))
+    while start != -1:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(probe, start + 1)
+    return 0
+
+
+def _join(left, right):
+    """``left`` and ``right`` as one text if one contains or overlaps the other, else None."""
+    if right in left:
+        return left
+    if left in right:
+        return right
+    overlap = _overlap(left, right)
+    if overlap:
+        return left + right[overlap:]
+    overlap = _overlap(right, left)
+    if overlap:
+        return right + left[overlap:]
+    return None
+
+
+def merge_chunks(docs):
+    """Drops duplicate chunks and joins overlapping chunks of the same page.
+
+    Passages keep the position and metadata of their best-ranked chunk.
+    """
+    passages = []  # [page key, text, metadata]
+    for doc in docs:
+        text = doc.page_content.strip()
+        if not text:
+            continue
+        key = _page_key(doc)
+        target = None
+        for passage in passages:
+            joined = _join(passage[1], text) if passage[0] == key else None
+            if joined is not None:
+                passage[1] = joined
+                target = passage
+                break
+        if target is None:
+            passages.append([key, text, dict(doc.metadata)])
+            continue
+        # The grown passage may now bridge to another passage of the page
+        for other in list(passages):
+            joined = _join(target[1], other[1]) if other is not target and other[0] == key else None
+            if joined is not None:
+                target[1] = joined
+                passages.remove(other)
+    return [Document(page_content=text, metadata=metadata) for _, text, metadata in passages]
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in _SENTENCE_RE.split(text) if sentence and sentence.strip()]
+
+
+def extract_relevant(query, docs, budget=CONTEXT_TOKEN_BUDGET):
+    """Keeps the sentences that best match ``query`` within ``budget`` tokens.
+
+    Sentences are scored by the IDF-weighted query terms they contain, with
+    a small bonus for passages ranked higher by retrieval. Each passage keeps
+    its chosen sentences in their original order; gaps are marked with "…".
+    The top-scoring sentence is always kept.
+    """
+    sentences = []  # (passage index, position, text)
+    for i, doc in enumerate(docs):
+        sentences.extend((i, j, sentence) for j, sentence in enumerate(split_sentences(doc.page_content)))
+    if not sentences:
+        return docs
+    terms = [set(tokenize(text)) for _, _, text in sentences]
+    document_frequency = Counter(term for sentence_terms in terms for term in sentence_terms)
+    query_terms = set(tokenize(query))
+    count = len(sentences)
+
+    scores = []
+    for (i, _, _), sentence_terms in zip(sentences, terms):
+        matched = query_terms & sentence_terms
+        score = sum(math.log(1 + count / document_frequency[term]) for term in matched)
+        scores.append(score + 0.1 / (i + 1))
+
+    chosen = set()
+    used = 0
+    for index in sorted(range(count), key=lambda index: -scores[index]):
+        cost = estimate_tokens(sentences[index][2])
+        # The best sentence is kept even on its own over budget: some
+        # context beats none
+        if used + cost > budget and chosen:
+            continue
+        chosen.add(index)
+        used += cost
+
+    compressed = []
+    for i, doc in enumerate(docs):
+        parts = []
+        last = None
+        for index, (passage, position, text) in enumerate(sentences):
+            if passage != i or index not in chosen:
+                continue
+            if last is not None and position != last + 1:
+                parts.append(_GAP)
+            elif parts:
+                parts.append(" ")
+            parts.append(text)
+            last = position
+        if parts:
+            compressed.append(Document(page_content="".join(parts), metadata=doc.metadata))
+    return compressed
+
+
+def context_tokens(docs):
+    return sum(estimate_tokens(doc.page_content) for doc in docs)
+
+
+def compress_documents(query, docs, budget=CONTEXT_TOKEN_BUDGET):
+    with stage("compress"):
+        merged = merge_chunks(docs)
+        if context_tokens(merged) <= budget:
+            return merged
+        return extract_relevant(query, merged, budget)
+
+
+class CompressingRetriever(BaseRetriever):
+    """Wraps a retriever; returns its documents deduplicated, merged and
+    trimmed to the context token budget."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    base_retriever: BaseRetriever
+    budget: int = CONTEXT_TOKEN_BUDGET
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        docs = self.base_retriever.invoke(query, {"callbacks": run_manager.get_child()})
+        return compress_documents(query, docs, self.budget)
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        docs = await self.base_retriever.ainvoke(query, {"callbacks": run_manager.get_child()})
+        if context_tokens(docs) > self.budget:
+            # Sentence scoring is CPU work; keep it off the event loop
+            return await run_in_executor(None, compress_documents, query, docs, self.budget)
+        return compress_documents(query, docs, self.budget)
+
+
+def compress_context(retriever):
+    """``retriever`` wrapped per CONTEXT_COMPRESSION."""
+    if CONTEXT_COMPRESSION == "on":
+        return CompressingRetriever(base_retriever=retriever)
+    return retriever
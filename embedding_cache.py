@@ -0,0 +1,278 @@
+import asyncio
+import atexit
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Persistent, content-hash-keyed embedding cache shared by the serving and
+# ingestion scripts. Vectors live in a memory-mapped float32 matrix
+# (vectors.f32) and a SQLite table maps each content hash to its row.
+# When the cache is full, the least recently used rows are reused.
+# Lookups only read: the last-used times of hits are collected in memory and
+# written by a background thread every EMBEDDING_CACHE_TOUCH_SECONDS, on its
+# own connection, so a hit never waits on an ingestion run's write lock.
+# The async methods do their SQLite and memmap work in a thread.
+
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "on")  # on | off
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+EMBEDDING_CACHE_TOUCH_SECONDS = float(os.getenv("EMBEDDING_CACHE_TOUCH_SECONDS", "30"))
+
+_GROW_ROWS = 4096
+_SQL_BATCH = 500
+
+
+def _tag(key):
+    # 64-bit prefix of the key, stored next to each row so a reader can tell
+    # if the row was reassigned between the index lookup and the read
+    return np.uint64(int(key[:16], 16))
+
+
+class EmbeddingCache:
+    def __init__(self, path=EMBEDDING_CACHE_DIR, max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+                 touch_seconds=EMBEDDING_CACHE_TOUCH_SECONDS):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_seconds = touch_seconds
+        self._db = sqlite3.connect(os.path.join(path, "index.sqlite3"), check_same_thread=False,
+                                   isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, row INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._tags = None
+        self.dim = self._meta("dim")
+        self._touched = {}  # key: last hit, not yet written
+        self._touch_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._touch_db = None
+        self._flusher = None
+
+    def get_many(self, keys):
+        """Returns {key: float32 vector} for the keys that are cached."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        if self.dim is None:
+            # Another process may have created the store since we opened it
+            self.dim = self._meta("dim")
+        if not keys or self.dim is None:
+            return found
+        with self._lock:
+            rows = []
+            for i in range(0, len(keys), _SQL_BATCH):
+                batch = keys[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows.extend(self._db.execute(
+                    f"SELECT key, row FROM entries WHERE key IN ({placeholders})", batch
+                ).fetchall())
+            if not rows:
+                return found
+            self._map(max(row for _, row in rows) + 1)
+            for key, row in rows:
+                if self._tags[row] != _tag(key):
+                    continue
+                vector = np.array(self._vectors[row])
+                # Checked again after the copy: a writer reusing the row
+                # clears the tag before it touches the vector
+                if self._tags[row] == _tag(key):
+                    found[key] = vector
+        self._touch(found)
+        return found
+
+    def _touch(self, keys):
+        if not keys:
+            return
+        now = time.time()
+        with self._touch_lock:
+            self._touched.update(dict.fromkeys(keys, now))
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="embedding-cache-touch", daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush_touches)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.touch_seconds)
+            self.flush_touches()
+
+    def flush_touches(self):
+        """Writes the last-used times of recent hits. Kept for the next try if the database is busy."""
+        # Only the swap holds _touch_lock, so hits never wait on the write
+        with self._flush_lock:
+            with self._touch_lock:
+                touched, self._touched = self._touched, {}
+            if not touched:
+                return
+            try:
+                if self._touch_db is None:
+                    self._touch_db = sqlite3.connect(os.path.join(self.path, "index.sqlite3"),
+                                                     check_same_thread=False, isolation_level=None, timeout=30)
+                self._touch_db.execute("BEGIN")
+                self._touch_db.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                           [(when, key) for key, when in touched.items()])
+                self._touch_db.execute("COMMIT")
+            except sqlite3.Error:
+                if self._touch_db is not None and self._touch_db.in_transaction:
+                    self._touch_db.execute("ROLLBACK")
+                with self._touch_lock:
+                    for key, when in touched.items():
+                        self._touched[key] = max(when, self._touched.get(key, 0.0))
+
+    def put_many(self, items):
+        """Stores {key: vector}; keys already present are left untouched."""
+        if not items:
+            return
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if self.dim is None:
+                    self.dim = len(next(iter(items.values())))
+                    self._set_meta("dim", self.dim)
+                keys = list(items)
+                existing = set()
+                for i in range(0, len(keys), _SQL_BATCH):
+                    batch = keys[i:i + _SQL_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    existing.update(key for (key,) in self._db.execute(
+                        f"SELECT key FROM entries WHERE key IN ({placeholders})", batch))
+                new_keys = [key for key in keys if key not in existing][:self.max_entries]
+                if not new_keys:
+                    self._db.execute("COMMIT")
+                    return
+
+                rows = self._allocate_rows(len(new_keys))
+                self._map(max(rows) + 1)
+                # Readers in other processes match rows by tag, so a reused
+                # row is untagged before its vector changes and retagged after
+                self._tags[rows] = 0
+                self._tags.flush()
+                for key, row in zip(new_keys, rows):
+                    self._vectors[row] = np.asarray(items[key], dtype=np.float32)
+                self._vectors.flush()
+                for key, row in zip(new_keys, rows):
+                    self._tags[row] = _tag(key)
+                self._tags.flush()
+                now = time.time()
+                self._db.executemany("INSERT INTO entries (key, row, last_used) VALUES (?, ?, ?)",
+                                     [(key, row, now) for key, row in zip(new_keys, rows)])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _allocate_rows(self, count):
+        next_row = self._meta("next_row") or 0
+        fresh = list(range(next_row, min(next_row + count, self.max_entries)))
+        if fresh:
+            self._set_meta("next_row", fresh[-1] + 1)
+        reused = []
+        if len(fresh) < count:
+            # Full: take over the least recently used rows
+            victims = self._db.execute(
+                "SELECT key, row FROM entries ORDER BY last_used LIMIT ?", (count - len(fresh),)
+            ).fetchall()
+            self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in victims])
+            reused = [row for _, row in victims]
+        return fresh + reused
+
+    def _map(self, rows_needed):
+        # (Re)map the vector and tag files so they cover rows_needed rows
+        if self._vectors is not None and len(self._vectors) >= rows_needed:
+            return
+        vectors_path = os.path.join(self.path, "vectors.f32")
+        tags_path = os.path.join(self.path, "tags.u64")
+        current_rows = os.path.getsize(vectors_path) // (4 * self.dim) if os.path.exists(vectors_path) else 0
+        rows = max(current_rows, rows_needed)
+        if rows > current_rows:
+            rows = min(-(-rows // _GROW_ROWS) * _GROW_ROWS, max(self.max_entries, rows_needed))
+            for file_path, itemsize in ((vectors_path, 4 * self.dim), (tags_path, 8)):
+                with open(file_path, "ab") as f:
+                    f.truncate(rows * itemsize)
+        self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+        self._tags = np.memmap(tags_path, dtype=np.uint64, mode="r+", shape=(rows,))
+
+    def _meta(self, name):
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name, value):
+        self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only calls the wrapped model for texts it has
+    never embedded before; misses are sent in one batched request."""
+
+    def __init__(self, embeddings, cache):
+        self.embeddings = embeddings
+        self.cache = cache
+        model = getattr(embeddings, "model", type(embeddings).__name__)
+        dimensions = getattr(embeddings, "dimensions", None)
+        self.namespace = f"{model}:{dimensions}" if dimensions else model
+
+    def _key(self, kind, text):
+        return hashlib.sha256(f"{self.namespace}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, kind, texts):
+        keys = [self._key(kind, text) for text in texts]
+        found = self.cache.get_many(keys)
+        missing = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in found))
+        return keys, found, missing
+
+    def _fill(self, kind, keys, found, missing, vectors):
+        computed = {self._key(kind, text): vector for text, vector in zip(missing, vectors)}
+        self.cache.put_many(computed)
+        found.update({key: np.asarray(vector, dtype=np.float32) for key, vector in computed.items()})
+        return [found[key].tolist() for key in keys]
+
+    def embed_documents(self, texts):
+        keys, found, missing = self._lookup("document", texts)
+        vectors = self.embeddings.embed_documents(missing) if missing else []
+        return self._fill("document", keys, found, missing, vectors)
+
+    async def aembed_documents(self, texts):
+        # A miss writes under SQLite's write lock, which an ingestion run may
+        # hold for seconds; keep that off the event loop
+        keys, found, missing = await asyncio.to_thread(self._lookup, "document", texts)
+        vectors = await self.embeddings.aembed_documents(missing) if missing else []
+        return await asyncio.to_thread(self._fill, "document", keys, found, missing, vectors)
+
+    def embed_query(self, text):
+        keys, found, missing = self._lookup("query", [text])
+        vectors = [self.embeddings.embed_query(text)] if missing else []
+        return self._fill("query", keys, found, missing, vectors)[0]
+
+    async def aembed_query(self, text):
+        keys, found, missing = await asyncio.to_thread(self._lookup, "query", [text])
+        vectors = [await self.embeddings.aembed_query(text)] if missing else []
+        return (await asyncio.to_thread(self._fill, "query", keys, found, missing, vectors))[0]
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def cached_embeddings(embeddings):
+    # Wraps embeddings with the shared on-disk cache unless EMBEDDING_CACHE=off
+    if EMBEDDING_CACHE == "off":
+        return embeddings
+    with _caches_lock:
+        cache = _caches.get(EMBEDDING_CACHE_DIR)
+        if cache is None:
+            cache = _caches[EMBEDDING_CACHE_DIR] = EmbeddingCache()
+    return CachedEmbeddings(embeddings, cache)
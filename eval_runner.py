@@ -0,0 +1,466 @@
+import argparse
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Offline RAGAS evaluation of logged chat turns.
+# The chat app appends each turn (question, answer, retrieved contexts) to a
+# JSONL log in EVAL_LOG_DIR and never holds them in memory. A new segment file
+# is started once the current one passes EVAL_LOG_MAX_BYTES. This runner reads
+# the segments in order and scores them in batches, EVAL_CONCURRENCY batches
+# at a time. It records how far it got in a checkpoint, so an interrupted run
+# picks up where it stopped. Scores are cached per sample and metric, so a
+# turn that was already scored (or logged twice) is never sent to the
+# evaluator again. Every run ends by writing an aggregated report over the
+# whole log.
+#
+#   python eval_runner.py --concurrency 4 --batch-size 20
+#   python eval_runner.py --report-only
+
+logger = logging.getLogger(__name__)
+
+EVAL_LOG_DIR = os.getenv("EVAL_LOG_DIR", "eval_logs")
+EVAL_LOG_MAX_BYTES = int(os.getenv("EVAL_LOG_MAX_BYTES", str(16 * 1024 * 1024)))
+# Oldest segments beyond this many are deleted; 0 keeps them all
+EVAL_LOG_KEEP = int(os.getenv("EVAL_LOG_KEEP", "0"))
+EVAL_CACHE_PATH = os.getenv("EVAL_CACHE_PATH", "eval_scores.sqlite3")
+EVAL_CHECKPOINT_PATH = os.getenv("EVAL_CHECKPOINT_PATH", "eval_checkpoint.json")
+EVAL_REPORT_PATH = os.getenv("EVAL_REPORT_PATH", "eval_report.json")
+EVAL_SCORER = os.getenv("EVAL_SCORER", "ragas")  # ragas | overlap (no LLM calls)
+EVAL_METRICS = os.getenv("EVAL_METRICS", "faithfulness,answer_relevancy,context_precision")
+EVAL_LLM_MODEL = os.getenv("EVAL_LLM_MODEL", "gpt-4o-mini")
+EVAL_BATCH_SIZE = int(os.getenv("EVAL_BATCH_SIZE", "20"))
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "4"))
+
+_SEGMENT_RE = re.compile(r"^turns-\d{8}T\d{6}-\d{6}-\d+\.jsonl$")
+# Lowest-scoring samples listed per metric in the report
+_REPORT_LOWEST = 10
+
+
+def sample_key(sample):
+    # Same turn, same key: duplicates share their cached scores
+    payload = json.dumps([sample["question"], sample["answer"], sample["contexts"], sample.get("ground_truth")],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TurnLog:
+    """Append-only JSONL log of chat turns, split into size-capped segments.
+
+    Segment names sort by creation time and carry the writer's pid, so
+    several worker processes can log to the same directory.
+    """
+
+    def __init__(self, path=EVAL_LOG_DIR, max_bytes=EVAL_LOG_MAX_BYTES, keep=EVAL_LOG_KEEP):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._file = None
+
+    def append(self, question, answer, contexts, ground_truth=None, **extra):
+        record = {"ts": time.time(), "question": question, "answer": answer, "contexts": list(contexts)}
+        if ground_truth is not None:
+            record["ground_truth"] = ground_truth
+        record.update(extra)
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        try:
+            with self._lock:
+                if self._file is None or self._file.tell() + len(line) > self.max_bytes:
+                    self._rotate()
+                # One write per line, so a reader never sees half a record
+                self._file.write(line)
+                self._file.flush()
+        except Exception as e:
+            # Losing a log line must never fail the chat turn
+            logger.error(f"Failed to log turn for evaluation: {str(e)}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        now = time.time()
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) + f"-{int(now % 1 * 1e6):06d}"
+        self._file = open(os.path.join(self.path, f"turns-{stamp}-{os.getpid()}.jsonl"), "ab")
+        if self.keep:
+            for old in list_segments(self.path)[:-self.keep]:
+                os.remove(os.path.join(self.path, old))
+
+
+def list_segments(path=EVAL_LOG_DIR):
+    if not os.path.isdir(path):
+        return []
+    return sorted(name for name in os.listdir(path) if _SEGMENT_RE.match(name))
+
+
+def iter_turns(path=EVAL_LOG_DIR, start=None):
+    """Yields (segment, end offset, sample) for each complete line, in log order.
+
+    ``start`` maps segments to the byte offset to resume from.
+    """
+    start = start or {}
+    for segment in list_segments(path):
+        offset = start.get(segment, 0)
+        with open(os.path.join(path, segment), "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Still being written; the next run reads it
+                    break
+                offset += len(line)
+                try:
+                    sample = json.loads(line)
+                except ValueError:
+                    logger.error(f"Skipping malformed line in {segment} before offset {offset}")
+                    continue
+                yield segment, offset, sample
+
+
+class Checkpoint:
+    """How far into each segment every batch has been scored; saved atomically."""
+
+    def __init__(self, path=EVAL_CHECKPOINT_PATH):
+        self.path = path
+        self.offsets = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.offsets = json.load(f).get("offsets", {})
+
+    def advance(self, segment, offset):
+        self.offsets[segment] = offset
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"offsets": self.offsets, "updated_at": time.time()}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def prune(self, segments):
+        # Forget segments that rotation has deleted
+        self.offsets = {segment: offset for segment, offset in self.offsets.items() if segment in segments}
+
+
+class ScoreCache:
+    """Per-sample metric scores, keyed by sample, metric and scorer.
+
+    A NULL score means the metric was computed but undefined (NaN), which
+    is still not worth recomputing.
+    """
+
+    def __init__(self, path=EVAL_CACHE_PATH):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "key TEXT NOT NULL, metric TEXT NOT NULL, scorer TEXT NOT NULL, score REAL, scored_at REAL NOT NULL, "
+            "PRIMARY KEY (key, metric, scorer))"
+        )
+        self._lock = threading.Lock()
+
+    def get_many(self, keys, scorer):
+        """Returns {key: {metric: score}} for the keys with any cached score."""
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                for key, metric, score in self._conn.execute(
+                        f"SELECT key, metric, score FROM scores WHERE scorer = ? AND key IN ({placeholders})",
+                        [scorer, *batch]):
+                    found.setdefault(key, {})[metric] = score
+        return found
+
+    def put_many(self, rows, scorer):
+        """Stores [(key, {metric: score})]."""
+        now = time.time()
+        values = [(key, metric, None if score is None or math.isnan(score) else float(score), scorer, now)
+                  for key, scores in rows for metric, score in scores.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO scores (key, metric, score, scorer, scored_at) VALUES (?, ?, ?, ?, ?)", values)
+            self._conn.execute("COMMIT")
+
+    def close(self):
+        self._conn.close()
+
+
+class RagasScorer:
+    """Scores samples with RAGAS; each call is one ``ragas.evaluate``."""
+
+    def __init__(self, metrics=EVAL_METRICS, model=EVAL_LLM_MODEL):
+        self.metrics = [metric.strip() for metric in metrics.split(",") if metric.strip()]
+        self.model = model
+        # Part of the cache key: scores from another judge model aren't reused
+        self.name = f"ragas:{model}"
+
+    def score(self, samples):
+        # ragas and datasets are only needed by the runner, never by the chat app
+        from datasets import Dataset
+        from langchain_openai import ChatOpenAI
+        from ragas import evaluate
+        import ragas.metrics
+
+        rows = [{"question": s["question"], "answer": s["answer"], "contexts": s["contexts"],
+                 **({"ground_truth": s["ground_truth"]} if "ground_truth" in s else {})} for s in samples]
+        result = evaluate(
+            Dataset.from_list(rows),
+            metrics=[getattr(ragas.metrics, metric) for metric in self.metrics],
+            llm=ChatOpenAI(model_name=self.model, temperature=0),
+            show_progress=False,
+        ).to_pandas()
+        return [{metric: float(row[metric]) for metric in self.metrics} for _, row in result.iterrows()]
+
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("a an and are as at be by can for from how i in is it of on or that the this to what "
+                       "which with you your".split())
+
+
+def _terms(text):
+    return {term for term in _WORD_RE.findall(text.lower()) if term not in _STOPWORDS}
+
+
+class OverlapScorer:
+    """Lexical stand-ins for groundedness and relevance, with no LLM calls.
+
+    context_overlap is the share of answer terms found in the contexts;
+    question_overlap the share of question terms found in the answer. Cheap
+    enough to run over every turn, e.g. to spot ungrounded answers before
+    paying for a RAGAS run.
+    """
+
+    name = "overlap"
+    metrics = ["context_overlap", "question_overlap"]
+
+    def score(self, samples):
+        scores = []
+        for sample in samples:
+            answer = _terms(sample["answer"])
+            question = _terms(sample["question"])
+            context = _terms(" ".join(sample["contexts"]))
+            scores.append({
+                "context_overlap": len(answer & context) / len(answer) if answer else float("nan"),
+                "question_overlap": len(question & answer) / len(question) if question else float("nan"),
+            })
+        return scores
+
+
+def build_scorer(name=EVAL_SCORER):
+    if name == "overlap":
+        return OverlapScorer()
+    return RagasScorer()
+
+
+def _done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class EvalRunner:
+    def __init__(self, scorer, cache, checkpoint, log_dir=EVAL_LOG_DIR, batch_size=EVAL_BATCH_SIZE,
+                 concurrency=EVAL_CONCURRENCY):
+        self.scorer = scorer
+        self.cache = cache
+        self.checkpoint = checkpoint
+        self.log_dir = log_dir
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.stats = {"read": 0, "cached": 0, "scored": 0, "failed": 0, "batches": 0}
+
+    def run(self, limit=None):
+        """Scores the turns logged since the checkpoint; returns the run stats."""
+        self.checkpoint.prune(set(list_segments(self.log_dir)))
+        # Batches finish out of order; the checkpoint only moves past a batch
+        # once every batch before it is done
+        pending = deque()  # (future, segment, end offset)
+        failed = False
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for batch, segment, offset in self._batches(limit):
+                pending.append((self._submit(executor, batch), segment, offset))
+                while pending and (len(pending) >= self.concurrency or pending[0][0].done()):
+                    failed = self._finish(pending.popleft(), failed)
+            while pending:
+                failed = self._finish(pending.popleft(), failed)
+        return self.stats
+
+    def _batches(self, limit):
+        # Batches end at segment boundaries, so one offset checkpoints each
+        batch = []
+        current = offset = None
+        for segment, end, sample in iter_turns(self.log_dir, self.checkpoint.offsets):
+            if batch and (segment != current or len(batch) == self.batch_size):
+                yield batch, current, offset
+                batch = []
+            if self.stats["read"] == limit:
+                return
+            batch.append(sample)
+            current, offset = segment, end
+            self.stats["read"] += 1
+        if batch:
+            yield batch, current, offset
+
+    def _submit(self, executor, batch):
+        keys = [sample_key(sample) for sample in batch]
+        cached = self.cache.get_many(keys, self.scorer.name)
+        todo = {}
+        for key, sample in zip(keys, batch):
+            if all(metric in cached.get(key, {}) for metric in self.scorer.metrics):
+                self.stats["cached"] += 1
+            else:
+                todo.setdefault(key, sample)
+        if not todo:
+            return _done(None)
+        return executor.submit(self._score, todo)
+
+    def _score(self, todo):
+        scores = self.scorer.score(list(todo.values()))
+        self.cache.put_many(zip(todo, scores), self.scorer.name)
+        return len(todo)
+
+    def _finish(self, item, failed):
+        future, segment, offset = item
+        try:
+            scored = future.result()
+        except Exception as e:
+            logger.error(f"Evaluation batch failed: {str(e)}")
+            self.stats["failed"] += 1
+            # Later batches still get scored and cached, but the checkpoint stays
+            # here so the next run retries this one
+            return True
+        self.stats["batches"] += 1
+        self.stats["scored"] += scored or 0
+        if not failed:
+            self.checkpoint.advance(segment, offset)
+        if self.stats["batches"] % 10 == 0:
+            print(f"📊 {self.stats['read']} turns read, {self.stats['scored']} scored, "
+                  f"{self.stats['cached']} already cached")
+        return failed
+
+
+def _percentile(values, fraction):
+    index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+def build_report(scorer, cache, log_dir=EVAL_LOG_DIR, lowest=_REPORT_LOWEST):
+    """Aggregates the cached scores of every distinct turn in the log."""
+    seen = set()
+    values = {metric: [] for metric in scorer.metrics}
+    missing = dict.fromkeys(scorer.metrics, 0)
+    worst = {metric: [] for metric in scorer.metrics}  # max-heaps of (-score, key, question)
+    turns = unscored = 0
+    batch = []
+
+    def flush():
+        nonlocal unscored
+        cached = cache.get_many([key for key, _ in batch], scorer.name)
+        for key, question in batch:
+            scores = cached.get(key, {})
+            if not scores:
+                unscored += 1
+                continue
+            for metric in scorer.metrics:
+                score = scores.get(metric)
+                if score is None:
+                    missing[metric] += 1
+                    continue
+                values[metric].append(score)
+                heapq.heappush(worst[metric], (-score, key, question))
+                if len(worst[metric]) > lowest:
+                    heapq.heappop(worst[metric])
+        batch.clear()
+
+    for _, _, sample in iter_turns(log_dir):
+        turns += 1
+        key = sample_key(sample)
+        if key in seen:
+            continue
+        seen.add(key)
+        batch.append((key, sample["question"]))
+        if len(batch) == 500:
+            flush()
+    flush()
+
+    metrics = {}
+    for metric, scores in values.items():
+        scores.sort()
+        metrics[metric] = {
+            "count": len(scores),
+            "undefined": missing[metric],
+            "mean": sum(scores) / len(scores) if scores else None,
+            "p10": _percentile(scores, 0.10) if scores else None,
+            "p50": _percentile(scores, 0.50) if scores else None,
+            "min": scores[0] if scores else None,
+            "lowest": [{"key": key, "question": question, "score": -score}
+                       for score, key, question in sorted(worst[metric], reverse=True)],
+        }
+    return {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "scorer": scorer.name,
+        "turns": turns,
+        "distinct_turns": len(seen),
+        "unscored": unscored,
+        "metrics": metrics,
+    }
+
+
+def write_report(report, path=EVAL_REPORT_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate logged chat turns")
+    parser.add_argument("--log-dir", default=EVAL_LOG_DIR)
+    parser.add_argument("--scorer", choices=["ragas", "overlap"], default=EVAL_SCORER)
+    parser.add_argument("--batch-size", type=int, default=EVAL_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=EVAL_CONCURRENCY, help="Batches scored at once")
+    parser.add_argument("--limit", type=int, help="Stop after this many new turns")
+    parser.add_argument("--cache", default=EVAL_CACHE_PATH)
+    parser.add_argument("--checkpoint", default=EVAL_CHECKPOINT_PATH)
+    parser.add_argument("--report", default=EVAL_REPORT_PATH)
+    parser.add_argument("--report-only", action="store_true", help="Only rebuild the report from cached scores")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    scorer = build_scorer(args.scorer)
+    cache = ScoreCache(args.cache)
+    try:
+        if not args.report_only:
+            start = time.perf_counter()
+            runner = EvalRunner(scorer, cache, Checkpoint(args.checkpoint), args.log_dir, args.batch_size,
+                                args.concurrency)
+            stats = runner.run(args.limit)
+            print(f"✅ {stats['read']} new turns in {time.perf_counter() - start:.1f}s: {stats['scored']} scored, "
+                  f"{stats['cached']} already cached, {stats['failed']} failed batches")
+        report = build_report(scorer, cache, args.log_dir)
+        write_report(report, args.report)
+    finally:
+        cache.close()
+    for metric, summary in report["metrics"].items():
+        mean = "n/a" if summary["mean"] is None else f"{summary['mean']:.3f}"
+        print(f"   {metric:<20} mean {mean} over {summary['count']} turns")
+    print(f"📝 Report for {report['distinct_turns']} distinct turns written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
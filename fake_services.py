@@ -0,0 +1,473 @@
+import argparse
+import base64
+import hashlib
+import io
+import json
+import math
+import re
+import struct
+import threading
+import time
+import wave
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Deterministic local stand-ins for the OpenAI and Pinecone HTTP APIs.
+# Point the apps at them with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and
+# PINECONE_HOST=http://127.0.0.1:<port> to benchmark without paying for,
+# or depending on, the real services.
+
+EMBEDDING_DIM = 1536
+FAKE_ANSWER = (
+    "Under the zoning by-law the RS-1 district permits one-family dwellings, "
+    "secondary suites and laneway houses subject to the conditions of use."
+)
+FAKE_TRANSCRIPT = "What does the RS-1 zone allow?"
+FAKE_CHUNKS = [
+    ("RS-1 One-Family Dwelling District Schedule permits one-family dwellings.", "Buy By Law.pdf"),
+    ("Laneway houses are permitted in RS zones subject to section 11.24.", "Buy By Law.pdf"),
+    ("Rezoning applications must meet the green buildings policy.", "bulletin-green-buildings-policy-for-rezoning.pdf"),
+    ("Secondary suites are permitted in one-family dwellings.", "Buy By Law.pdf"),
+    ("CD-1 comprehensive development districts are tailored by by-law.", "Buy By Law.pdf"),
+]
+
+
+def fake_embedding(text, dim=EMBEDDING_DIM):
+    # Hash-seeded unit vector so identical input always maps to the same point
+    values = []
+    counter = 0
+    while len(values) < dim:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        values.extend(b / 127.5 - 1.0 for b in digest)
+        counter += 1
+    values = values[:dim]
+    norm = sum(v * v for v in values) ** 0.5 or 1.0
+    return [v / norm for v in values]
+
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:[.-][a-z0-9]+)*")
+
+
+def lexical_embedding(text, dim=EMBEDDING_DIM):
+    # Feature-hashed word unigrams and bigrams (signed, log-scaled counts):
+    # deterministic like fake_embedding, but texts sharing words end up
+    # close together, so retrieval quality can be measured offline
+    words = _WORD_RE.findall(text.lower())
+    values = [0.0] * dim
+    counts = {}
+    for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        counts[feature] = counts.get(feature, 0) + 1
+    for feature, count in counts.items():
+        digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        values[digest % dim] += (1.0 + math.log(count)) * (1 if digest >> 63 else -1)
+    norm = sum(v * v for v in values) ** 0.5
+    if not norm:
+        return fake_embedding(text, dim)
+    return [v / norm for v in values]
+
+
+class ServiceStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def enter(self, route):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.peak_in_flight = self.in_flight
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            return self._send_json(self.server.stats.snapshot())
+        if self.path.startswith("/describe_index_stats"):
+            return self._send_json(self._index_stats())
+        if self.path.rstrip("/") == "/indexes":
+            return self._send_json({"indexes": [self._index_model(name) for name in self.server.indexes]})
+        if self.path.startswith("/indexes/"):
+            name = self.path.split("/")[2]
+            if name in self.server.indexes:
+                return self._send_json(self._index_model(name))
+        self._send_json({"error": f"unknown route {self.path}"}, status=404)
+
+    def do_POST(self):
+        route = self.path.split("?")[0].rstrip("/")
+        body = self._read_body()
+        if route == "/stats/reset":
+            self.server.stats.reset()
+            return self._send_json({"ok": True})
+
+        self.server.stats.enter(route)
+        try:
+            time.sleep(self.server.latency.get(route, self.server.default_latency))
+            if route.endswith("/embeddings"):
+                return self._embeddings(json.loads(body))
+            if route.endswith("/chat/completions"):
+                return self._chat(json.loads(body))
+            if route.endswith("/audio/transcriptions"):
+                return self._transcribe(body)
+            if route == "/query":
+                return self._query(json.loads(body))
+            if route == "/vectors/upsert":
+                return self._upsert(json.loads(body))
+            if route == "/vectors/delete":
+                return self._delete(json.loads(body))
+            if route == "/describe_index_stats":
+                return self._send_json(self._index_stats())
+            if route == "/indexes":
+                name = json.loads(body)["name"]
+                self.server.indexes.add(name)
+                return self._send_json(self._index_model(name), status=201)
+            self._send_json({"error": f"unknown route {route}"}, status=404)
+        finally:
+            self.server.stats.leave()
+
+    # OpenAI
+    def _embeddings(self, payload):
+        inputs = payload["input"]
+        if isinstance(inputs, (str, int)) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dim = payload.get("dimensions") or EMBEDDING_DIM
+        data = []
+        for i, item in enumerate(inputs):
+            if self.server.embedding == "lexical" and isinstance(item, str):
+                vector = lexical_embedding(item, dim)
+            else:
+                vector = fake_embedding(json.dumps(item), dim)
+            if payload.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{dim}f", *vector)).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        self._send_json({
+            "object": "list",
+            "data": data,
+            "model": payload.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": 8 * len(inputs), "total_tokens": 8 * len(inputs)},
+        })
+
+    def _transcribe(self, body):
+        # WAV uploads are "transcribed" as the tones they contain, one word per
+        # tone, so tests can check that split segments are stitched in order.
+        # Other formats get the fixed transcript.
+        audio = self._multipart_file(body)
+        if audio[:4] != b"RIFF":
+            return self._send_json({"text": FAKE_TRANSCRIPT})
+        with wave.open(io.BytesIO(audio)) as wav:
+            rate = wav.getframerate()
+            samples = struct.unpack(f"<{wav.getnframes() * wav.getnchannels()}h",
+                                    wav.readframes(wav.getnframes()))[::wav.getnchannels()]
+        # Decoding cost scales with audio length, like the real service
+        time.sleep(self.server.transcription_rate * len(samples) / rate)
+        words = []
+        for start in range(0, len(samples) - rate // 2 + 1, rate // 2):
+            window = samples[start:start + rate // 2]
+            # Measure over the loud span only, so windows at a tone's edge read true
+            loud = [i for i, v in enumerate(window) if abs(v) >= 1000]
+            if not loud or loud[-1] - loud[0] < rate // 8:
+                continue
+            span = window[loud[0]:loud[-1] + 1]
+            # Zero crossings per second / 2 is the frequency of a pure tone
+            crossings = sum(1 for a, b in zip(span, span[1:]) if (a < 0) != (b < 0))
+            word = f"tone{round(crossings * rate / len(span) / 2 / 50) * 50}"
+            if not words or words[-1] != word:
+                words.append(word)
+        self._send_json({"text": " ".join(words)})
+
+    def _multipart_file(self, body):
+        boundary = self.headers.get("Content-Type", "").split("boundary=")[-1].strip('"').encode("latin-1")
+        for part in body.split(b"--" + boundary):
+            head, _, content = part.partition(b"\r\n\r\n")
+            if b'name="file"' in head:
+                return content[:-2] if content.endswith(b"\r\n") else content
+        return b""
+
+    def _chat(self, payload):
+        created = int(time.time())
+        if payload.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for word in FAKE_ANSWER.split(" "):
+                chunk = {
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                    "model": payload.get("model", "gpt-4o-mini"),
+                    "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(self.server.token_latency)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+            return
+        self._send_json({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": created,
+            "model": payload.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": FAKE_ANSWER},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 200, "completion_tokens": 40, "total_tokens": 240},
+        })
+
+    # Pinecone data plane
+    def _query(self, payload):
+        vector = payload.get("vector") or []
+        top_k = payload.get("topK", 5)
+        scored = []
+        for vector_id, (values, metadata) in self.server.vectors.items():
+            score = sum(a * b for a, b in zip(vector, values))
+            scored.append((score, vector_id, metadata))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        matches = [
+            {"id": vector_id, "score": score, "values": [], "metadata": metadata}
+            for score, vector_id, metadata in scored[:top_k]
+        ]
+        self._send_json({"matches": matches, "namespace": payload.get("namespace", ""),
+                         "usage": {"readUnits": 1}})
+
+    def _upsert(self, payload):
+        with self.server.vectors_lock:
+            for vector in payload.get("vectors", []):
+                self.server.vectors[vector["id"]] = (vector["values"], vector.get("metadata", {}))
+        self._send_json({"upsertedCount": len(payload.get("vectors", []))})
+
+    def _delete(self, payload):
+        with self.server.vectors_lock:
+            if payload.get("deleteAll"):
+                self.server.vectors.clear()
+            for vector_id in payload.get("ids", []):
+                self.server.vectors.pop(vector_id, None)
+        self._send_json({})
+
+    # Pinecone control plane; every index name is served by this same server
+    def _index_model(self, name):
+        host, port = self.server.server_address[:2]
+        return {
+            "name": name, "dimension": EMBEDDING_DIM, "metric": "cosine",
+            "host": f"http://{host}:{port}", "vector_type": "dense",
+            "spec": {"serverless": {"cloud": "aws", "region": "us-east-1"}},
+            "status": {"ready": True, "state": "Ready"},
+            "deletion_protection": "disabled",
+        }
+
+    def _index_stats(self):
+        count = len(self.server.vectors)
+        return {"namespaces": {"default": {"vectorCount": count}}, "dimension": EMBEDDING_DIM,
+                "indexFullness": 0.0, "totalVectorCount": count}
+
+
+def start_fake_server(host="127.0.0.1", port=0, latency=0.2, token_latency=0.01, route_latency=None,
+                      indexes=None, transcription_rate=0.0, embedding="hash"):
+    server = ThreadingHTTPServer((host, port), FakeHandler)
+    server.daemon_threads = True
+    server.stats = ServiceStats()
+    server.default_latency = latency
+    server.token_latency = token_latency
+    # Extra seconds per second of WAV audio transcribed
+    server.transcription_rate = transcription_rate
+    server.latency = dict(route_latency or {})
+    # "hash": unrelated random vectors; "lexical": similar texts get similar vectors
+    server.embedding = embedding
+    server.indexes = set(indexes or ["fake-index"])
+    server.vectors_lock = threading.Lock()
+    embed = lexical_embedding if embedding == "lexical" else fake_embedding
+    server.vectors = {
+        f"fake-{i}": (embed(text), {"text": text, "source": source})
+        for i, (text, source) in enumerate(FAKE_CHUNKS)
+    }
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+# Static PDF site for the crawler: an HTML page linking to the PDFs, served
+# with ETag/Last-Modified validators, 304s, Range and If-Range.
+
+def fake_pdf(text, pages=1):
+    # Not a valid PDF, but it starts like one; padded so downloads take a few reads
+    return b"%PDF-1.4\n" + (text.encode("utf-8") + b"\n") * (2000 * pages) + b"%%EOF\n"
+
+
+class PDFSiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.record(status, len(body))
+
+    def do_GET(self):
+        route = self.path.split("?")[0]
+        if route.rstrip("/") == "/stats":
+            body = json.dumps(self.server.snapshot()).encode("utf-8")
+            return self._send(200, body, {"Content-Type": "application/json"})
+        self.server.stats.enter(route)
+        try:
+            time.sleep(self.server.latency)
+            if route == "/brochures.html":
+                links = "".join(f'<li><a href="{link}">{link}</a></li>' for link in self.server.page_links)
+                return self._send(200, f"<html><body><ul>{links}</ul></body></html>".encode("utf-8"),
+                                  {"Content-Type": "text/html"})
+            entry = self.server.files.get(route.lstrip("/"))
+            if entry is None:
+                return self._send(404, b"not found")
+            self._send_pdf(route.lstrip("/"), *entry)
+        finally:
+            self.server.stats.leave()
+
+    def _send_pdf(self, name, data, etag, last_modified):
+        validators = {"ETag": etag, "Last-Modified": last_modified} if self.server.validators else {}
+        if self.server.validators and (self.headers.get("If-None-Match") == etag
+                                       or self.headers.get("If-Modified-Since") == last_modified):
+            return self._send(304, headers=validators)
+        start = 0
+        status = 200
+        requested = self.headers.get("Range", "")
+        if requested.startswith("bytes=") and self.headers.get("If-Range") in (etag, last_modified):
+            start = int(requested[len("bytes="):].split("-")[0])
+            status = 206
+        body = data[start:]
+        headers = {"Content-Type": "application/pdf", "Accept-Ranges": "bytes", **validators}
+        if status == 206:
+            headers["Content-Range"] = f"bytes {start}-{len(data) - 1}/{len(data)}"
+        drop_after = self.server.drop_after.pop(name, None)
+        if drop_after is None:
+            return self._send(status, body, headers)
+        # Announce the whole body, send part of it, then hang up
+        self.send_response(status)
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[:drop_after])
+        self.wfile.flush()
+        self.server.record("dropped", drop_after)
+        self.close_connection = True
+
+
+class PDFSite(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.05, validators=True):
+        super().__init__(address, PDFSiteHandler)
+        self.stats = ServiceStats()
+        self.latency = latency
+        # False: no ETag/Last-Modified, so clients can only compare contents
+        self.validators = validators
+        self.files = {}  # name: (bytes, etag, last modified)
+        self.page_links = []
+        self.drop_after = {}  # name: bytes sent before the next download of it is cut off
+        self._lock = threading.Lock()
+        self.responses = {}
+        self.bytes_sent = 0
+        self._epoch = int(time.time()) - 86400
+        self._versions = 0
+
+    def url(self, path=""):
+        return f"http://127.0.0.1:{self.server_port}/{path}"
+
+    def put(self, name, data, linked=True):
+        # A new version gets a new ETag and a Last-Modified a second later
+        # than any before (HTTP dates have one-second resolution)
+        with self._lock:
+            self._versions += 1
+            modified = formatdate(self._epoch + self._versions, usegmt=True)
+        etag = f'"{hashlib.sha256(data).hexdigest()[:16]}"'
+        self.files[name] = (data, etag, modified)
+        if linked and name not in self.page_links:
+            self.page_links.append(name)
+
+    def record(self, status, size):
+        with self._lock:
+            self.responses[str(status)] = self.responses.get(str(status), 0) + 1
+            self.bytes_sent += size
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats.snapshot(), "responses": dict(self.responses), "bytes_sent": self.bytes_sent}
+
+    def reset(self):
+        self.stats.reset()
+        with self._lock:
+            self.responses = {}
+            self.bytes_sent = 0
+
+
+def start_pdf_site(files, host="127.0.0.1", port=0, latency=0.05, validators=True):
+    """Serves ``files`` ({name: bytes}) and /brochures.html linking to them."""
+    server = PDFSite((host, port), latency, validators)
+    for name, data in files.items():
+        server.put(name, data)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI/Pinecone stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds added to every API call")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Seconds between streamed tokens")
+    parser.add_argument("--transcription-rate", type=float, default=0.0,
+                        help="Seconds per second of WAV audio transcribed")
+    parser.add_argument("--embedding", choices=["hash", "lexical"], default="hash",
+                        help="lexical: embeddings that reflect shared words, for retrieval-quality runs")
+    args = parser.parse_args()
+
+    server = start_fake_server(args.host, args.port, args.latency, args.token_latency,
+                               transcription_rate=args.transcription_rate, embedding=args.embedding)
+    print(f"Fake OpenAI at http://{args.host}:{server.server_port}/v1")
+    print(f"Fake Pinecone at http://{args.host}:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,369 @@
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import run_in_executor
+from pydantic import ConfigDict
+from pypdf import PdfReader
+
+# Structure-aware chunking with parent-child ("small-to-big") retrieval:
+# small child chunks cut along the by-laws' sections are embedded, and the
+# parent sections they come from are returned (see README).
+
+CHUNKING = os.getenv("CHUNKING", "recursive")  # recursive | structured
+CHILD_CHUNK_SIZE = int(os.getenv("CHILD_CHUNK_SIZE", "400"))
+CHILD_CHUNK_OVERLAP = int(os.getenv("CHILD_CHUNK_OVERLAP", "40"))
+PARENT_MAX_CHARS = int(os.getenv("PARENT_MAX_CHARS", "1200"))
+# Shorter sections are merged into the next one
+PARENT_MIN_CHARS = int(os.getenv("PARENT_MIN_CHARS", "300"))
+PARENT_STORE_PATH = os.getenv("PARENT_STORE_PATH", "parent_store")
+# Children fetched per query, and parents returned from them
+CHILD_FETCH_K = int(os.getenv("CHILD_FETCH_K", "10"))
+PARENT_K = int(os.getenv("PARENT_K", "3"))
+
+# "16.3 A person ...", "4.1.1 Embodied Carbon Limits", "2. Whenever ..."
+_SECTION_RE = re.compile(r"^(\d{1,3}(?:\.\d{1,3}){0,3})\.?\s+(?=[A-Z(\"“'])")
+# "(1)", "(a)", "(iv)" opening a line
+_CLAUSE_RE = re.compile(r"^\((?:\d{1,3}|[a-z]{1,2}|[ivxl]{1,6})\)\s")
+_PAGE_NUMBER_RE = re.compile(r"^(?:page\s+)?\d{1,4}$", re.I)
+# Fee schedule rows: "$1,629", "Animal Clinic or Hospital $360"
+_TABLE_LINE_RE = re.compile(r"(?:^|\s)\$\s?[\d,]+(?:\.\d+)?$")
+# Running headers/footers: repeated on at least this share of pages
+_REPEATED_LINE_SHARE = 0.5
+_TABLE_LABEL_CHARS = 80
+_EDGE_LINES = 3
+
+
+def _clean(line):
+    return " ".join(line.split())
+
+
+def _is_heading(line):
+    # Short all-caps line ("PET STORES") or short numbered title with no sentence punctuation
+    letters = [c for c in line if c.isalpha()]
+    if not letters or len(line) > 90:
+        return False
+    if sum(c.isupper() for c in letters) / len(letters) > 0.9 and len(letters) >= 4:
+        return True
+    match = _SECTION_RE.match(line)
+    return bool(match) and len(line) <= 70 and not line.rstrip().endswith((".", ",", ";", ":"))
+
+
+def _repeated_lines(pages):
+    # Lines near the top or bottom of many pages, with digits masked ("Page 2" == "Page 3")
+    if len(pages) < 3:
+        return set()
+    seen = Counter()
+    for lines in pages:
+        edges = lines[:_EDGE_LINES] + lines[-_EDGE_LINES:]
+        seen.update({re.sub(r"\d+", "#", line) for line in edges})
+    return {line for line, count in seen.items() if count >= _REPEATED_LINE_SHARE * len(pages)}
+
+
+def _page_lines(page_texts):
+    """(page, line) pairs with running headers, footers and page numbers removed;
+    "" marks a paragraph break."""
+    pages = [[_clean(line) for line in text.splitlines()] for text in page_texts]
+    repeated = _repeated_lines([[line for line in lines if line] for lines in pages])
+    for page, lines in enumerate(pages):
+        content = [i for i, line in enumerate(lines) if line]
+        edges = set(content[:_EDGE_LINES] + content[-_EDGE_LINES:])
+        for i, line in enumerate(lines):
+            if i in edges and (_PAGE_NUMBER_RE.match(line) or re.sub(r"\d+", "#", line) in repeated):
+                continue
+            yield page, line
+        yield page, ""
+
+
+class _Section:
+    def __init__(self, title, page):
+        self.title = title
+        self.page = page
+        self.last_page = page
+        self.blocks = []  # [kind, page, lines]
+        self.has_body = False
+
+    def add_line(self, page, line, kind):
+        last = self.blocks[-1] if self.blocks else None
+        if last is not None and not last[2]:
+            last[0], last[1] = kind, page
+        elif last is None or last[0] != kind:
+            self.blocks.append([kind, page, []])
+        self.blocks[-1][2].append(line)
+        self.last_page = page
+
+    def break_paragraph(self):
+        if self.blocks and self.blocks[-1][0] == "text" and self.blocks[-1][2]:
+            self.blocks.append(["text", self.last_page, []])
+
+    def finish(self):
+        # Short labels between table rows ("Animal Clinic or Hospital" above
+        # "$360") belong to the table; then adjacent table blocks are joined
+        blocks = [block for block in self.blocks if block[2]]
+        for i, block in enumerate(blocks):
+            near_table = any(0 <= j < len(blocks) and blocks[j][0] == "table" for j in (i - 1, i + 1))
+            if block[0] == "text" and near_table and len(_block_text(block)) <= _TABLE_LABEL_CHARS:
+                block[0] = "table"
+        self.blocks = []
+        for block in blocks:
+            if self.blocks and block[0] == "table" and self.blocks[-1][0] == "table":
+                self.blocks[-1][2].extend(block[2])
+            else:
+                self.blocks.append(block)
+        return self
+
+    def text(self):
+        return "\n".join(_block_text(block) for block in self.blocks if block[2])
+
+    def size(self):
+        return sum(len(line) + 1 for block in self.blocks for line in block[2])
+
+
+def _block_text(block):
+    kind, _, lines = block
+    return "\n".join(lines) if kind == "table" else " ".join(lines)
+
+
+def _sections(page_texts):
+    sections = []
+    title = None
+    current = None
+    for page, line in _page_lines(page_texts):
+        if not line:
+            if current is not None:
+                current.break_paragraph()
+            continue
+        heading = _is_heading(line)
+        if heading or _SECTION_RE.match(line):
+            if current is None or current.has_body:
+                current = _Section(line if heading else title, page)
+                sections.append(current)
+            elif heading:
+                # Consecutive headings ("4 REQUIREMENTS", "4.1 Requirements for ...") form one title
+                current.title = f"{current.title} – {line}" if current.title else line
+            if heading:
+                title = current.title
+                current.add_line(page, line, "heading")
+                current.break_paragraph()
+                continue
+        if current is None:
+            current = _Section(title, page)
+            sections.append(current)
+        if _CLAUSE_RE.match(line):
+            current.break_paragraph()
+        kind = "table" if _TABLE_LINE_RE.search(line) else "text"
+        current.add_line(page, line, kind)
+        current.has_body = True
+    return [section.finish() for section in sections if section.has_body]
+
+
+def _merge_small(sections, min_chars=PARENT_MIN_CHARS, max_chars=PARENT_MAX_CHARS):
+    merged = []
+    for section in sections:
+        previous = merged[-1] if merged else None
+        if previous is not None and previous.size() < min_chars and previous.size() + section.size() <= max_chars:
+            previous.blocks.extend(section.blocks)
+            previous.last_page = section.last_page
+            previous.title = previous.title or section.title
+            continue
+        merged.append(section)
+    return merged
+
+
+def _split_large(section, max_chars=PARENT_MAX_CHARS):
+    # Oversized sections (the definitions run for pages) become several parents
+    parts = []
+    part = None
+    for block in section.blocks:
+        if part is None or part.size() and part.size() + len(_block_text(block)) > max_chars:
+            part = _Section(section.title, block[1])
+            part.has_body = True
+            parts.append(part)
+        part.blocks.append(block)
+        part.last_page = block[1]
+    return parts
+
+
+def _source_prefix(source):
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+
+
+def parent_id(source, text):
+    # Prefixed like ingestion.chunk_id, so the store finds the file by id
+    content = hashlib.sha256(f"{source}\0{text}".encode("utf-8")).hexdigest()
+    return f"{_source_prefix(source)}-p{content[:24]}"
+
+
+def _child_units(section, child_size, splitter):
+    # Paragraphs and clauses; tables line by line, so rows are never cut
+    for kind, page, lines in section.blocks:
+        if not lines or kind == "heading":
+            continue
+        if kind == "table":
+            for line in lines:
+                yield kind, page, line
+            continue
+        text = " ".join(lines)
+        if len(text) <= child_size:
+            yield kind, page, text
+        else:
+            for piece in splitter.split_text(text):
+                yield kind, page, piece
+
+
+def split_structured(page_texts, source, child_size=CHILD_CHUNK_SIZE, child_overlap=CHILD_CHUNK_OVERLAP,
+                     max_chars=PARENT_MAX_CHARS, min_chars=PARENT_MIN_CHARS):
+    """Splits a document's page texts into ``(children, parents)`` Documents."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=child_size, chunk_overlap=child_overlap)
+    children, parents = [], []
+    sections = [part for section in _merge_small(_sections(page_texts), min_chars, max_chars)
+                for part in _split_large(section, max_chars)]
+    for section in sections:
+        text = section.text()
+        pid = parent_id(source, text)
+        title = section.title or ""
+        parents.append(Document(id=pid, page_content=text, metadata={
+            "source": source, "page": section.page, "last_page": section.last_page, "section": title,
+            "parent_id": pid}))
+        # Pack consecutive units of the same kind into children of up to child_size
+        packed = []  # [kind, page, text]
+        for kind, page, unit in _child_units(section, child_size, splitter):
+            last = packed[-1] if packed else None
+            if last is not None and last[0] == kind and len(last[2]) + len(unit) + 1 <= child_size:
+                last[2] += ("\n" if kind == "table" else " ") + unit
+            else:
+                packed.append([kind, page, unit])
+        for kind, page, unit in packed:
+            # The title gives a clause like "(b) interfere with police ..." its subject
+            content = f"{title}\n{unit}" if title and not unit.startswith(title) else unit
+            children.append(Document(page_content=content, metadata={
+                "source": source, "page": page, "parent_id": pid, "section": title, "kind": kind}))
+    return children, parents
+
+
+def split_pdf_structured(path, filename, child_size=CHILD_CHUNK_SIZE, child_overlap=CHILD_CHUNK_OVERLAP):
+    # Runs in a worker process, on a whole file: sections cross page breaks
+    reader = PdfReader(path)
+    return split_structured([page.extract_text() or "" for page in reader.pages], filename, child_size,
+                            child_overlap)
+
+
+class ParentStore:
+    """Parent sections by id: one JSON file per source PDF, replaced atomically.
+
+    Files are loaded on first use and reloaded when ingestion rewrites them.
+    Ingestion stages a file's parents when it is parsed and commits them once
+    its children are in the index, so the store never runs ahead of the index.
+    """
+
+    def __init__(self, path=PARENT_STORE_PATH):
+        self.path = path
+        self._files = {}  # prefix: (mtime, {parent id: Document})
+        self._staged = {}  # source: parents not yet written
+
+    def _file(self, prefix):
+        return os.path.join(self.path, f"{prefix}.json")
+
+    def put(self, source, parents):
+        os.makedirs(self.path, exist_ok=True)
+        prefix = _source_prefix(source)
+        tmp_path = f"{self._file(prefix)}.tmp-{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump({"source": source, "parents": {doc.id: {"text": doc.page_content, "metadata": doc.metadata}
+                                                     for doc in parents}}, f)
+        os.replace(tmp_path, self._file(prefix))
+
+    def stage(self, source, parents):
+        self._staged[source] = parents
+
+    def commit(self, source):
+        parents = self._staged.pop(source, None)
+        if parents is not None:
+            self.put(source, parents)
+
+    def remove(self, source):
+        self._staged.pop(source, None)
+        path = self._file(_source_prefix(source))
+        if os.path.exists(path):
+            os.remove(path)
+
+    def sources(self):
+        if not os.path.isdir(self.path):
+            return set()
+        found = set()
+        for name in os.listdir(self.path):
+            if name.endswith(".json"):
+                with open(os.path.join(self.path, name)) as f:
+                    found.add(json.load(f)["source"])
+        return found
+
+    def get(self, pid):
+        prefix = pid.split("-", 1)[0]
+        try:
+            mtime = os.path.getmtime(self._file(prefix))
+        except OSError:
+            return None
+        cached = self._files.get(prefix)
+        if cached is None or cached[0] != mtime:
+            with open(self._file(prefix)) as f:
+                records = json.load(f)["parents"]
+            cached = (mtime, {key: Document(id=key, page_content=record["text"], metadata=record["metadata"])
+                              for key, record in records.items()})
+            self._files[prefix] = cached
+        return cached[1].get(pid)
+
+
+def expand_to_parents(children, store, k=PARENT_K):
+    """The parents of ``children``, in order of their best child, at most ``k``.
+
+    Chunks without a parent (from a recursively split index) pass through.
+    """
+    results = []
+    seen = set()
+    for doc in children:
+        pid = doc.metadata.get("parent_id")
+        if pid is None:
+            key = doc.page_content
+            parent = doc
+        else:
+            key = pid
+            parent = store.get(pid) or doc
+        if key in seen:
+            continue
+        seen.add(key)
+        results.append(parent)
+        if len(results) == k:
+            break
+    return results
+
+
+class ParentChildRetriever(BaseRetriever):
+    """Retrieves small child chunks with ``child_retriever`` and returns
+    their parent sections."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    child_retriever: BaseRetriever
+    store: ParentStore
+    k: int = PARENT_K
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        children = self.child_retriever.invoke(query, {"callbacks": run_manager.get_child()})
+        return expand_to_parents(children, self.store, self.k)
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        children = await self.child_retriever.ainvoke(query, {"callbacks": run_manager.get_child()})
+        # The parent store reads its JSON files from disk
+        return await run_in_executor(None, expand_to_parents, children, self.store, self.k)
+
+
+def parent_context(retriever):
+    """``retriever`` returning parent sections per CHUNKING."""
+    if CHUNKING == "structured":
+        return ParentChildRetriever(child_retriever=retriever, store=ParentStore())
+    return retriever
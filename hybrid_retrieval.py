@@ -0,0 +1,304 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+from collections import Counter
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import run_in_executor
+from pydantic import ConfigDict
+
+# Hybrid retrieval: a BM25 inverted index over the same chunks as the vector
+# store, fused with dense results by reciprocal rank fusion (RRF). An
+# optional CPU cross-encoder can rerank the fused candidates. The
+# preprocessing scripts build the BM25 index, and the apps load it read-only.
+
+# Each vector store gets its own BM25 index under bm25_index/, so ingesting
+# for one backend doesn't replace another's; BM25_INDEX_PATH pins one path
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", "")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")  # vector | hybrid
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "5"))
+# Candidates taken from each of the dense and lexical retrievers before fusion
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# e.g. cross-encoder/ms-marco-MiniLM-L-6-v2; needs sentence-transformers
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "20"))
+
+# Keeps zone codes and section numbers ("RS-1", "11.24", "CD-1") whole
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+_SEPARATOR_RE = re.compile(r"[-./]")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i if in is it its may of on or "
+    "shall that the their there these this to was what when where which who will with".split()
+)
+
+
+def tokenize(text):
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        if token.isalpha() and len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            # Fold plain plurals: "zones" -> "zone"
+            token = token[:-1]
+        tokens.append(token)
+        if _SEPARATOR_RE.search(token):
+            # "RS-1" should also match "RS 1" and "RS1"
+            parts = _SEPARATOR_RE.split(token)
+            tokens.extend(part for part in parts if part not in _STOPWORDS)
+            tokens.append("".join(parts))
+    return tokens
+
+
+def bm25_index_path(store):
+    """Path of the BM25 index for the vector store named ``store`` (e.g. "local")."""
+    return BM25_INDEX_PATH or os.path.join("bm25_index", store)
+
+
+def doc_key(doc):
+    # Stores disagree on whether they return ids, so fuse on source + text
+    source = str(doc.metadata.get("source", ""))
+    return hashlib.sha1(f"{source}\0{doc.page_content}".encode("utf-8")).hexdigest()
+
+
+class BM25Index:
+    """Okapi BM25 over chunk texts, with postings stored as flat NumPy arrays.
+
+    Adds and removals only touch the corpus; the postings are rebuilt on the
+    next search or save.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.texts = []
+        self.metadatas = []
+        self._row_of = {}
+        self._postings = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def sources(self):
+        return {metadata.get("source") for metadata in self.metadatas}
+
+    def add(self, ids, texts, metadatas=None):
+        metadatas = metadatas or [{} for _ in ids]
+        for doc_id, text, metadata in zip(ids, texts, metadatas):
+            row = self._row_of.get(doc_id)
+            if row is None:
+                self._row_of[doc_id] = len(self.ids)
+                self.ids.append(doc_id)
+                self.texts.append(text)
+                self.metadatas.append(dict(metadata))
+            else:
+                self.texts[row] = text
+                self.metadatas[row] = dict(metadata)
+        self._postings = None
+
+    def add_documents(self, items):
+        """Adds ``(doc_id, Document)`` pairs."""
+        items = list(items)
+        self.add([doc_id for doc_id, _ in items], [doc.page_content for _, doc in items],
+                 [doc.metadata for _, doc in items])
+
+    def remove(self, predicate):
+        """Drops every chunk whose metadata satisfies ``predicate``."""
+        keep = [row for row, metadata in enumerate(self.metadatas) if not predicate(metadata)]
+        if len(keep) == len(self.ids):
+            return
+        self.ids = [self.ids[row] for row in keep]
+        self.texts = [self.texts[row] for row in keep]
+        self.metadatas = [self.metadatas[row] for row in keep]
+        self._row_of = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._postings = None
+
+    def _build(self):
+        postings = {}
+        doc_len = np.zeros(len(self.texts), dtype=np.float32)
+        for row, text in enumerate(self.texts):
+            counts = Counter(tokenize(text))
+            doc_len[row] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((row, tf))
+        vocab = {term: i for i, term in enumerate(sorted(postings))}
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        for term, i in vocab.items():
+            offsets[i + 1] = len(postings[term])
+        offsets = np.cumsum(offsets)
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.float32)
+        for term, i in vocab.items():
+            entries = np.array(postings[term], dtype=np.int64).reshape(-1, 2)
+            doc_ids[offsets[i]:offsets[i + 1]] = entries[:, 0]
+            tfs[offsets[i]:offsets[i + 1]] = entries[:, 1]
+        self._postings = (vocab, offsets, doc_ids, tfs, doc_len)
+
+    def search(self, query, k=HYBRID_FETCH_K):
+        """Returns up to ``k`` ``(row, score)`` pairs with a positive score, best first."""
+        if not self.ids:
+            return []
+        if self._postings is None:
+            self._build()
+        vocab, offsets, doc_ids, tfs, doc_len = self._postings
+        count = len(doc_len)
+        avg_len = float(doc_len.mean()) or 1.0
+        norm = self.k1 * (1 - self.b + self.b * doc_len / avg_len)
+        scores = np.zeros(count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            i = vocab.get(term)
+            if i is None:
+                continue
+            rows = doc_ids[offsets[i]:offsets[i + 1]]
+            tf = tfs[offsets[i]:offsets[i + 1]]
+            df = len(rows)
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + norm[rows])
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return [(int(row), float(scores[row])) for row in hits]
+
+    def document(self, row):
+        return Document(id=self.ids[row], page_content=self.texts[row], metadata=dict(self.metadatas[row]))
+
+    def similarity_search(self, query, k=HYBRID_FETCH_K):
+        return [self.document(row) for row, _ in self.search(query, k)]
+
+    def save(self, path):
+        # Written to a temp directory and swapped in, so readers never see a mix
+        if self._postings is None:
+            self._build()
+        vocab, offsets, doc_ids, tfs, doc_len = self._postings
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        with open(os.path.join(tmp_path, "corpus.jsonl"), "w") as f:
+            for doc_id, text, metadata in zip(self.ids, self.texts, self.metadatas):
+                f.write(json.dumps({"id": doc_id, "text": text, "metadata": metadata}) + "\n")
+        with open(os.path.join(tmp_path, "vocab.json"), "w") as f:
+            json.dump(sorted(vocab, key=vocab.get), f)
+        np.savez(os.path.join(tmp_path, "postings.npz"), offsets=offsets, doc_ids=doc_ids, tfs=tfs,
+                 doc_len=doc_len)
+        with open(os.path.join(tmp_path, "params.json"), "w") as f:
+            json.dump({"k1": self.k1, "b": self.b, "count": len(self.ids)}, f)
+        old_path = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(os.path.join(path, "params.json")):
+            raise FileNotFoundError(
+                f"No BM25 index at '{path}'. It is built by preprocess_pdf.py / local_pdf_preprocessing.py."
+            )
+        with open(os.path.join(path, "params.json")) as f:
+            params = json.load(f)
+        index = cls(params["k1"], params["b"])
+        with open(os.path.join(path, "corpus.jsonl")) as f:
+            for line in f:
+                record = json.loads(line)
+                index.ids.append(record["id"])
+                index.texts.append(record["text"])
+                index.metadatas.append(record["metadata"])
+        index._row_of = {doc_id: row for row, doc_id in enumerate(index.ids)}
+        with open(os.path.join(path, "vocab.json")) as f:
+            vocab = {term: i for i, term in enumerate(json.load(f))}
+        arrays = np.load(os.path.join(path, "postings.npz"))
+        index._postings = (vocab, arrays["offsets"], arrays["doc_ids"], arrays["tfs"], arrays["doc_len"])
+        return index
+
+
+def reciprocal_rank_fusion(result_lists, k=RRF_K):
+    """Merges ranked Document lists; each list adds ``1 / (k + rank)`` per doc."""
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class CrossEncoderReranker:
+    """Scores (question, chunk) pairs with a small cross-encoder on CPU."""
+
+    def __init__(self, model_name=RERANKER_MODEL):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("RERANKER_MODEL needs `pip install sentence-transformers`") from e
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def rerank(self, query, docs):
+        if not docs:
+            return docs
+        scores = self.model.predict([(query, doc.page_content) for doc in docs])
+        return [docs[i] for i in np.argsort(-np.asarray(scores), kind="stable")]
+
+
+class HybridRetriever(BaseRetriever):
+    """Dense + BM25 retrieval fused with RRF, optionally cross-encoder reranked."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: object
+    bm25: BM25Index
+    k: int = RETRIEVAL_K
+    fetch_k: int = HYBRID_FETCH_K
+    rrf_k: int = RRF_K
+    reranker: object = None
+    rerank_top_n: int = RERANK_TOP_N
+
+    def _finish(self, query, dense, lexical):
+        fused = reciprocal_rank_fusion([dense, lexical], self.rrf_k)
+        if self.reranker is not None:
+            fused = self.reranker.rerank(query, fused[:self.rerank_top_n])
+        return fused[:self.k]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        dense = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        lexical = self.bm25.similarity_search(query, self.fetch_k)
+        return self._finish(query, dense, lexical)
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        # BM25 scoring is CPU work; it runs in a thread while the dense query is in flight
+        dense, lexical = await asyncio.gather(
+            self.vectorstore.asimilarity_search(query, k=self.fetch_k),
+            run_in_executor(None, self.bm25.similarity_search, query, self.fetch_k))
+        if self.reranker is not None:
+            # The cross-encoder is CPU-bound; keep it off the event loop
+            return await run_in_executor(None, self._finish, query, dense, lexical)
+        return self._finish(query, dense, lexical)
+
+
+def build_retriever(vectorstore, store):
+    """The retriever selected by RETRIEVAL_MODE for ``vectorstore``, with
+    exact rescoring of compact vectors, parent sections per CHUNKING and
+    context compression per CONTEXT_COMPRESSION. ``store`` names the vector
+    store, for its BM25 index."""
+    from compact_vectors import rescoring
+    from context_compression import compress_context
+    from hierarchical_chunking import CHILD_FETCH_K, CHUNKING, parent_context
+
+    # With structured chunking the index holds small children; fetch more of
+    # them, parent_context turns them into at most PARENT_K sections
+    k = CHILD_FETCH_K if CHUNKING == "structured" else RETRIEVAL_K
+    # Compact (shortened or int8) vectors are re-ranked against the full ones
+    vectorstore = rescoring(vectorstore)
+    if RETRIEVAL_MODE == "hybrid":
+        reranker = CrossEncoderReranker(RERANKER_MODEL) if RERANKER_MODEL else None
+        return compress_context(parent_context(HybridRetriever(
+            vectorstore=vectorstore, bm25=BM25Index.load(bm25_index_path(store)), k=k, reranker=reranker)))
+    return compress_context(parent_context(vectorstore.as_retriever(search_kwargs={"k": k})))
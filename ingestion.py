@@ -0,0 +1,312 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+
+from hierarchical_chunking import CHUNKING, split_pdf_structured
+
+# Building blocks for the preprocessing scripts: a manifest of what is
+# already in the vector index, deterministic chunk ids so re-runs only
+# touch chunks that are new, changed or gone, a process-pool parser that
+# streams chunks, and a concurrent embed + upsert engine.
+
+logger = logging.getLogger(__name__)
+
+INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", "ingest_manifest.json")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "20"))
+# Parsed page ranges allowed to wait for the upload stage; bounds peak memory
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", str(2 * INGEST_WORKERS)))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "8"))
+UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", "8"))
+EMBED_REQUEST_MAX_TOKENS = int(os.getenv("EMBED_REQUEST_MAX_TOKENS", "100000"))
+EMBED_REQUEST_MAX_INPUTS = int(os.getenv("EMBED_REQUEST_MAX_INPUTS", "256"))
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "100"))
+MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "6"))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(doc):
+    # Stable across runs: same source, page and text -> same vector id
+    source = doc.metadata.get("source", "")
+    page = doc.metadata.get("page", "")
+    content = hashlib.sha256(f"{source}\0{page}\0{doc.page_content}".encode("utf-8")).hexdigest()
+    prefix = hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+    return f"{prefix}-{content[:32]}"
+
+
+class IngestManifest:
+    """Tracks, per source file, the file hash and the chunk ids in the index.
+
+    A file's hash is only updated once all of its chunks are uploaded and its
+    stale chunks deleted, so a crashed run re-processes that file and skips
+    the batches it already uploaded.
+    """
+
+    def __init__(self, path=INGEST_MANIFEST_PATH):
+        self.path = path
+        if os.path.exists(path):
+            with open(path) as f:
+                self.files = json.load(f).get("files", {})
+        else:
+            self.files = {}
+
+    def is_current(self, filename, sha256, chunking=CHUNKING):
+        # Switching CHUNKING re-chunks every file, even unchanged ones
+        entry = self.files.get(filename)
+        return (entry is not None and entry.get("sha256") == sha256
+                and entry.get("chunking", "recursive") == chunking)
+
+    def chunk_ids(self, filename):
+        return set(self.files.get(filename, {}).get("chunk_ids", []))
+
+    def record_uploaded(self, filename, ids):
+        entry = self.files.setdefault(filename, {"sha256": None, "chunk_ids": []})
+        entry["chunk_ids"] = sorted(set(entry["chunk_ids"]) | set(ids))
+        self.save()
+
+    def complete_file(self, filename, sha256, ids, chunking=CHUNKING):
+        self.files[filename] = {"sha256": sha256, "chunk_ids": sorted(ids), "chunking": chunking}
+        self.save()
+
+    def remove_file(self, filename):
+        self.files.pop(filename, None)
+        self.save()
+
+    def save(self):
+        # Write-then-rename so a crash never leaves a truncated manifest
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"files": self.files}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+def split_pdf_pages(path, filename, start, end, chunk_size, chunk_overlap):
+    # Runs in a worker process: extract pages [start, end) and split them
+    reader = PdfReader(path)
+    pages = [
+        Document(page_content=reader.pages[i].extract_text(), metadata={"source": filename, "page": i})
+        for i in range(start, end)
+    ]
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return splitter.split_documents(pages)
+
+
+def _page_ranges(folder, filenames, pages_per_task, whole_files=False):
+    for filename in filenames:
+        path = os.path.join(folder, filename)
+        if whole_files:
+            yield path, filename, 0, None, True
+            continue
+        page_count = len(PdfReader(path).pages)
+        starts = list(range(0, page_count, pages_per_task)) or [0]
+        for start in starts:
+            end = min(start + pages_per_task, page_count)
+            yield path, filename, start, end, end >= page_count
+
+
+def iter_pdf_chunks(folder, filenames, chunk_size=1000, chunk_overlap=150, workers=INGEST_WORKERS,
+                    pages_per_task=INGEST_PAGES_PER_TASK, max_pending=INGEST_MAX_PENDING, chunking=CHUNKING,
+                    parent_store=None):
+    """Yields ``(filename, chunks, file_done)`` in file and page order.
+
+    Page ranges are parsed and split in a process pool while the caller
+    embeds and uploads earlier chunks. At most ``max_pending`` ranges are
+    parsed ahead of the caller. ``file_done`` is True on a file's last range.
+
+    With ``chunking="structured"`` each file is one task (sections run across
+    pages), the chunks are the child chunks of hierarchical_chunking, and the
+    file's parent sections are staged in ``parent_store``; the caller
+    commits them once the file's children are uploaded.
+    """
+    structured = chunking == "structured"
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+
+        def result(filename, future):
+            if not structured:
+                return future.result()
+            children, parents = future.result()
+            if parent_store is not None:
+                parent_store.stage(filename, parents)
+            return children
+
+        for path, filename, start, end, file_done in _page_ranges(folder, filenames, pages_per_task,
+                                                                   whole_files=structured):
+            if structured:
+                future = pool.submit(split_pdf_structured, path, filename)
+            else:
+                future = pool.submit(split_pdf_pages, path, filename, start, end, chunk_size, chunk_overlap)
+            pending.append((filename, future, file_done))
+            if len(pending) >= max_pending:
+                filename, future, file_done = pending.popleft()
+                yield filename, result(filename, future), file_done
+        while pending:
+            filename, future, file_done = pending.popleft()
+            yield filename, result(filename, future), file_done
+
+
+def estimate_tokens(text):
+    # ~4 characters per token; only used to pack embedding requests
+    return len(text) // 4 + 1
+
+
+def is_rate_limited(error):
+    return getattr(error, "status_code", None) == 429 or getattr(error, "status", None) == 429
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that halves on rate limiting and creeps back up by
+    one slot per success (AIMD), up to ``max_limit``."""
+
+    def __init__(self, max_limit):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.active = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    async def success(self):
+        async with self._condition:
+            self.limit = min(self.max_limit, self.limit + 1)
+            self._condition.notify_all()
+
+    async def throttled(self):
+        async with self._condition:
+            self.limit = max(1, self.limit // 2)
+
+
+class PineconeUpsertEngine:
+    """Embeds and upserts chunks with overlapping, bounded concurrency.
+
+    Chunks are packed into embedding requests of up to ``max_request_tokens``
+    / ``max_request_inputs``. Up to ``embed_concurrency`` requests run at once,
+    and their vectors are upserted through one pooled asyncio index in batches
+    of ``upsert_batch_size``. Rate-limited calls back off exponentially, and
+    the limit for that stage is halved.
+    """
+
+    def __init__(self, embeddings, index, namespace, on_uploaded=None,
+                 embed_concurrency=EMBED_CONCURRENCY, upsert_concurrency=UPSERT_CONCURRENCY,
+                 max_request_tokens=EMBED_REQUEST_MAX_TOKENS, max_request_inputs=EMBED_REQUEST_MAX_INPUTS,
+                 upsert_batch_size=UPSERT_BATCH_SIZE, text_key="text"):
+        self.embeddings = embeddings
+        self.index = index
+        self.namespace = namespace
+        self.on_uploaded = on_uploaded
+        self.max_request_tokens = max_request_tokens
+        self.max_request_inputs = max_request_inputs
+        self.upsert_batch_size = upsert_batch_size
+        self.text_key = text_key
+        self._embed_limiter = AdaptiveLimiter(embed_concurrency)
+        self._upsert_limiter = AdaptiveLimiter(upsert_concurrency)
+        # Backpressure: callers wait once this many requests are outstanding
+        self._slots = asyncio.Semaphore(2 * embed_concurrency)
+        self._buffer = []
+        self._buffer_tokens = 0
+        self._tasks = set()
+        self._errors = []
+        self.chunks_uploaded = 0
+        self.started = None
+
+    async def submit(self, items):
+        """Queues ``(doc_id, doc)`` pairs; returns once they are scheduled."""
+        if self.started is None and items:
+            # Throughput is measured from the first chunk, not engine creation
+            self.started = time.perf_counter()
+        for doc_id, doc in items:
+            tokens = estimate_tokens(doc.page_content)
+            if self._buffer and (self._buffer_tokens + tokens > self.max_request_tokens
+                                 or len(self._buffer) >= self.max_request_inputs):
+                await self.flush()
+            self._buffer.append((doc_id, doc))
+            self._buffer_tokens += tokens
+
+    async def flush(self):
+        if self._errors:
+            raise self._errors[0]
+        if not self._buffer:
+            return
+        request, self._buffer, self._buffer_tokens = self._buffer, [], 0
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(request))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def drain(self):
+        await self.flush()
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        if self._errors:
+            raise self._errors[0]
+
+    @property
+    def throughput(self):
+        if self.started is None:
+            return 0.0
+        elapsed = time.perf_counter() - self.started
+        return self.chunks_uploaded / elapsed if elapsed else 0.0
+
+    async def _process(self, request):
+        try:
+            texts = [doc.page_content for _, doc in request]
+            vectors = await self._call(self._embed_limiter, self.embeddings.aembed_documents, texts)
+            records = [
+                {"id": doc_id, "values": vector, "metadata": {**doc.metadata, self.text_key: doc.page_content}}
+                for (doc_id, doc), vector in zip(request, vectors)
+            ]
+            upserts = [
+                self._call(self._upsert_limiter, self.index.upsert,
+                           vectors=records[i:i + self.upsert_batch_size], namespace=self.namespace,
+                           show_progress=False)
+                for i in range(0, len(records), self.upsert_batch_size)
+            ]
+            await asyncio.gather(*upserts)
+            self.chunks_uploaded += len(request)
+            if self.on_uploaded is not None:
+                await self.on_uploaded(request)
+        except Exception as e:
+            self._errors.append(e)
+        finally:
+            self._slots.release()
+
+    async def _call(self, limiter, func, *args, **kwargs):
+        for attempt in range(MAX_RETRIES + 1):
+            async with limiter:
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    if not is_rate_limited(e) or attempt == MAX_RETRIES:
+                        raise
+                    await limiter.throttled()
+                    delay = min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random())
+                    logger.warning(f"Rate limited, retrying in {delay:.1f}s (limit now {limiter.limit})")
+                else:
+                    await limiter.success()
+                    return result
+            await asyncio.sleep(delay)
@@ -0,0 +1,171 @@
+import math
+import os
+import re
+from collections import Counter as Multiset
+from datetime import datetime
+
+from metrics import Counter, registry
+
+# Fast path for messages that don't need retrieval. Greetings, thanks,
+# goodbyes and small talk ("how are you", "who are you") get a templated
+# reply instead of a condense call, a retrieval and a completion. Whole-message
+# regex rules come first. If none matches, a character n-gram nearest-neighbour
+# model over the examples below catches variants ("heyyy", "thx a lot",
+# "gud nite"). Anything that looks like a domain question (a zoning term, a
+# number, a longer question) always goes to the chain; a missed greeting is
+# cheap, a swallowed question is not. Once a session has history, short
+# messages are mostly follow-ups ("tell me more", "ok and the fees?"), so
+# only the rules apply there.
+
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "on")  # on | off
+INTENT_MODEL = os.getenv("INTENT_MODEL", "ngram")  # ngram | off (rules only)
+INTENT_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", "0.55"))
+# Longer messages are never routed by the model
+INTENT_MAX_WORDS = 6
+
+QUESTION = "question"
+GREETING = "greeting"
+THANKS = "thanks"
+GOODBYE = "goodbye"
+CHITCHAT = "chitchat"
+
+INTENTS = registry.register(Counter(
+    "rag_intent_total", "Messages by routed intent (question = sent to the chain)", ["intent"]))
+
+REPLIES = {
+    THANKS: "You're welcome! Let me know if you have any other questions about zoning or properties. 🏡",
+    GOODBYE: "Goodbye! Come back any time you have questions about zoning or properties. 👋",
+    CHITCHAT: "I'm JoviBot 🤖, and I can help with zoning, by-laws and property questions. "
+              "What would you like to know?",
+}
+
+_FILLER = r"(?:\s*(?:there|all|everyone|guys|folks|team|jovi|jovibot|bot|again|so|very|much|a lot|lots|man|buddy|friend|mate))*"
+_END = r"[\s!.,?:;)(😊🙂👋🙏]*$"
+RULES = [
+    (GREETING, re.compile(
+        r"^\s*(?:hi+|hey+|hello+|hiya|howdy|yo|greetings|good\s+(?:morning|afternoon|evening|day)|"
+        r"what'?s\s+up|sup)" + _FILLER + _END, re.I)),
+    (THANKS, re.compile(
+        r"^\s*(?:(?:ok(?:ay)?|great|cool|perfect|awesome|nice)[\s,!.]*)?"
+        r"(?:thanks?|thank\s+(?:you|u)|thx|ty|cheers|much\s+appreciated|appreciate\s+it)" + _FILLER + _END, re.I)),
+    (GOODBYE, re.compile(
+        r"^\s*(?:(?:ok(?:ay)?|thanks?)[\s,!.]*)?"
+        r"(?:bye+|goodbye|good\s*night|see\s+(?:you|ya)(?:\s+later)?|later|take\s+care|have\s+a\s+good\s+(?:one|day))"
+        + _FILLER + _END, re.I)),
+    (CHITCHAT, re.compile(
+        r"^\s*(?:hi+|hey+|hello+)?[\s,!]*(?:how\s+are\s+(?:you|u)(?:\s+doing)?(?:\s+today)?|how'?s\s+it\s+going|"
+        r"who\s+are\s+(?:you|u)|what'?s\s+your\s+name|what\s+is\s+your\s+name|are\s+you\s+(?:a\s+)?(?:bot|robot|human|real)|"
+        r"what\s+can\s+(?:you|u)\s+do|tell\s+me\s+a\s+joke|how\s+old\s+are\s+you|nice\s+to\s+meet\s+(?:you|u))"
+        + _FILLER + _END, re.I)),
+]
+
+# A message with any of these is treated as a question, whatever else it says
+_DOMAIN_RE = re.compile(
+    r"\d|zon|lot|park|build|by-?law|permit|setback|height|densit|propert|house|home|suite|dwelling|"
+    r"develop|polic|fee|land|storey|floor|laneway|duplex|tenant|rent|sell|buy|price|area|district|"
+    r"green|energy|leed|rezon|applica|require|allow|regulat", re.I)
+
+EXAMPLES = {
+    GREETING: ["hi", "hello", "hey", "hey there", "hi there", "hello there", "heyy", "hiii", "hellooo",
+               "good morning", "good evening", "good afternoon", "morning", "evening", "yo", "howdy",
+               "hey bot", "hello jovi", "hi all", "greetings", "what's up", "sup", "helo", "hai"],
+    THANKS: ["thanks", "thank you", "thanks a lot", "thank you so much", "thx", "ty", "thanks!", "cheers",
+             "many thanks", "much appreciated", "appreciate it", "ok thanks", "great thanks", "thank u",
+             "tnx", "thankyou", "thanks a bunch", "perfect thank you"],
+    GOODBYE: ["bye", "goodbye", "bye bye", "see you", "see ya", "good night", "gud nite", "later",
+              "take care", "have a good day", "cya", "byee", "ok bye", "talk later", "see you later"],
+    CHITCHAT: ["how are you", "how are you doing", "how's it going", "who are you", "what's your name",
+               "are you a bot", "are you human", "what can you do", "tell me a joke", "you are funny",
+               "lol", "haha", "what's the weather like", "i'm bored",
+               "do you like music", "how old are you", "nice to meet you", "how r u"],
+    QUESTION: ["what does the rs-1 zone allow", "how tall can a building be", "parking requirements",
+               "can i build a laneway house", "what setbacks apply", "what is the green buildings policy",
+               "rezoning application fees", "minimum lot size", "what is a secondary suite",
+               "how many units can i build", "is a duplex allowed", "what is the floor area ratio",
+               "what are the energy requirements", "where can i find the by-law", "what is cd-1",
+               "tell me about zoning", "what is allowed on my property", "density rules",
+               # Follow-ups: they refer back to the previous answer
+               "tell me more", "what do you mean", "can you explain", "explain that", "why", "how so",
+               "go on", "more details", "what else", "can you elaborate", "can you clarify", "really",
+               "is that right", "give me an example", "and then", "what about that", "ok and", "okay so",
+               "what does that mean", "how come", "why not", "which one", "say more"],
+}
+
+
+def _ngrams(text, sizes=(2, 3, 4)):
+    text = f" {' '.join(re.sub(r'[^a-z0-9 ]', ' ', text.lower()).split())} "
+    for size in sizes:
+        for i in range(len(text) - size + 1):
+            yield text[i:i + size]
+
+
+def char_ngram_vector(text):
+    """Sparse unit vector of character 2-4-gram counts, as {gram: weight}.
+
+    Plain dicts: the example set is small, and importing NumPy here would
+    add to the apps' import time.
+    """
+    counts = Multiset(_ngrams(text))
+    norm = math.sqrt(sum(count * count for count in counts.values()))
+    return {gram: count / norm for gram, count in counts.items()} if norm else {}
+
+
+def _cosine(query, example):
+    return sum(weight * example.get(gram, 0.0) for gram, weight in query.items())
+
+
+class IntentRouter:
+    def __init__(self, model=INTENT_MODEL, threshold=INTENT_THRESHOLD, examples=EXAMPLES):
+        self.threshold = threshold
+        self._examples = []  # (intent, vector)
+        if model == "ngram":
+            self._examples = [(intent, char_ngram_vector(text)) for intent, texts in examples.items()
+                              for text in texts]
+
+    def classify(self, message, use_model=True):
+        """Returns (intent, how): how is "rule", "model" or "default"."""
+        text = message.strip()
+        if not text:
+            return QUESTION, "default"
+        for intent, pattern in RULES:
+            if pattern.match(text):
+                return intent, "rule"
+        if not use_model or not self._examples or _DOMAIN_RE.search(text) or len(text.split()) > INTENT_MAX_WORDS:
+            return QUESTION, "default"
+        vector = char_ngram_vector(text)
+        score, intent = max((_cosine(vector, example), intent) for intent, example in self._examples)
+        if score >= self.threshold:
+            return intent, "model"
+        return QUESTION, "default"
+
+    def route(self, message, has_history=False):
+        """The intent of ``message``, counted in rag_intent_total. With
+        ``has_history`` only the rules are used."""
+        intent, _ = self.classify(message, use_model=not has_history)
+        INTENTS.inc(intent)
+        return intent
+
+
+def get_time_based_greeting():
+    # Shared by the apps' welcome messages and greeting replies
+    hour = datetime.now().hour
+    if hour < 12:
+        greeting = "🌅 Good morning"
+    elif 12 <= hour < 18:
+        greeting = "🌞 Good afternoon"
+    else:
+        greeting = "🌇 Good evening"
+    return greeting
+
+
+def canned_reply(intent, greeting):
+    """Templated answer for a routed intent; ``greeting`` is the app's
+    time-of-day greeting. None for questions."""
+    if intent == GREETING:
+        return greeting
+    return REPLIES.get(intent)
+
+
+def build_intent_router():
+    # None when routing is switched off; the apps then send everything to the chain
+    return IntentRouter() if INTENT_ROUTER == "on" else None
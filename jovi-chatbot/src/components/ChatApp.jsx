@@ -2,6 +2,16 @@ import React, { useState, useEffect, useRef } from 'react';
 import './ChatApp.css';
 import { marked } from 'marked';
 
+// The server keeps conversation history keyed by this id
+const getSessionId = () => {
+  let sessionId = localStorage.getItem('jovi_session_id');
+  if (!sessionId) {
+    sessionId = crypto.randomUUID();
+    localStorage.setItem('jovi_session_id', sessionId);
+  }
+  return sessionId;
+};
+
 const ChatApp = () => {
   const [messages, setMessages] = useState(() => {
     const saved = localStorage.getItem('jovi_chat_history');
@@ -36,6 +46,63 @@ const ChatApp = () => {
     });
   };
 
+  const streamAnswer = async (text) => {
+    const formData = new FormData();
+    formData.append('message', text);
+    formData.append('session_id', getSessionId());
+
+    const res = await fetch('http://localhost:8000/api/query/stream', {
+      method: 'POST',
+      body: formData,
+    });
+    if (!res.ok) {
+      updateLastBotMessage(await errorMessage(res, 'Something went wrong, please try again.'));
+      return;
+    }
+    await renderAnswerStream(res);
+  };
+
+  // A 429/503 from admission control carries Retry-After; say when to retry
+  const errorMessage = async (res, fallback) => {
+    const data = await res.json().catch(() => ({}));
+    const message = data.error || fallback;
+    const retryAfter = res.headers.get('Retry-After');
+    return retryAfter ? `${message} (retry in ${retryAfter}s)` : message;
+  };
+
+  // Reads an SSE answer stream, re-rendering the last bot message as tokens
+  // arrive; the voice endpoint sends a transcript event before the answer
+  const renderAnswerStream = async (res, onTranscript) => {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let answer = '';
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split('\n\n');
+      buffer = events.pop();
+      for (const raw of events) {
+        if (!raw.startsWith('data: ')) continue;
+        const event = JSON.parse(raw.slice(6));
+        if (event.type === 'transcript') {
+          onTranscript?.(event.text);
+          continue;
+        }
+        if (event.type === 'token') {
+          answer += event.text;
+        } else if (event.type === 'replace') {
+          answer = event.text;
+        } else if (event.type === 'done') {
+          answer = event.answer;
+        }
+        updateLastBotMessage(marked.parse(answer), true);
+      }
+    }
+  };
+
   const sendMessage = async (e) => {
     e.preventDefault();
     if (!input.trim()) return;
@@ -45,15 +112,7 @@ const ChatApp = () => {
     appendMessage('bot', '<div class="typing-indicator"><span></span><span></span><span></span></div>', true);
     setInput('');
 
-    const formData = new FormData();
-    formData.append('message', userMsg);
-
-    const res = await fetch('http://localhost:8000/api/query', {
-      method: 'POST',
-      body: formData,
-    });
-    const data = await res.json();
-    updateLastBotMessage(marked.parse(data.answer), true);
+    await streamAnswer(userMsg);
   };
 
   const handleVoiceInput = async () => {
@@ -71,28 +130,31 @@ const ChatApp = () => {
     recorder.ondataavailable = (e) => audioChunks.current.push(e.data);
 
     recorder.onstop = async () => {
-      const audioBlob = new Blob(audioChunks.current, { type: 'audio/webm' });
-      const formData = new FormData();
-      const file = new File([audioBlob], 'voice.webm', { type: 'audio/webm' });
-      formData.append('file', file);
+      const audioBlob = new Blob(audioChunks.current, { type: recorder.mimeType || 'audio/webm' });
 
       appendMessage('user', '🎤 [Voice Input]');
       appendMessage('bot', '<div class="typing-indicator"><span></span><span></span><span></span></div>', true);
 
-      const res = await fetch('http://localhost:8000/api/transcribe', { method: 'POST', body: formData });
-      const data = await res.json();
-
-      appendMessage('user', data.query);
-      const textForm = new FormData();
-      textForm.append('message', data.query);
-
-      const botRes = await fetch('http://localhost:8000/api/query', {
+      // One request: the transcript arrives first, then the streamed answer.
+      // The raw recording is the body, so the server can read it as it arrives.
+      const sessionId = encodeURIComponent(getSessionId());
+      const res = await fetch(`http://localhost:8000/api/voice/stream?session_id=${sessionId}`, {
         method: 'POST',
-        body: textForm,
+        headers: { 'Content-Type': audioBlob.type },
+        body: audioBlob,
+      });
+      if (!res.ok) {
+        updateLastBotMessage(await errorMessage(res, 'Failed to process audio'));
+        return;
+      }
+      await renderAnswerStream(res, (transcript) => {
+        // Replace the voice placeholder with what was heard
+        setMessages((prev) => [
+          ...prev.slice(0, -2),
+          { sender: 'user', content: transcript, isHtml: false },
+          prev[prev.length - 1],
+        ]);
       });
-
-      const botData = await botRes.json();
-      updateLastBotMessage(marked.parse(botData.answer), true);
     };
 
     recorder.start();
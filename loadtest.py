@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_services import start_fake_server
+
+# Load benchmark for the FastAPI app against local OpenAI/Pinecone stand-ins.
+# Fires concurrent /api/query requests and checks that they overlap: with a
+# non-blocking request path the wall time stays close to one request's latency
+# instead of growing with the number of requests. With --voice it instead
+# counts the upstream calls one voice message costs in the old two-request
+# flow and through /api/voice/stream.
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(app_module, fake_url, port, extra_env=None, workers=1):
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "sk-fake",
+        "OPENAI_BASE_URL": f"{fake_url}/v1",
+        "PINECONE_API_KEY": "pc-fake",
+        "PINECONE_INDEX_NAME": "fake-index",
+        "PINECONE_HOST": fake_url,
+        "PINECONE_CONTROLLER_HOST": fake_url,
+    })
+    env.update(extra_env or {})
+    if workers > 1:
+        serve = os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve.py")
+        command = [sys.executable, serve, "--app", app_module, "--host", "127.0.0.1", "--workers", str(workers)]
+    else:
+        command = [sys.executable, "-m", "uvicorn", f"{app_module}:app"]
+    proc = subprocess.Popen([*command, "--port", str(port), "--log-level", "warning"], env=env)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{app_module} exited with code {proc.returncode}")
+        try:
+            # Wait for the warm-up too, so the first measured requests don't pay for it
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/api/ready", timeout=1).close()
+            return proc
+        except urllib.error.HTTPError as e:
+            # 503 while warming up; apps without a readiness route answer 404
+            if e.code != 503:
+                return proc
+            time.sleep(0.2)
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"{app_module} did not start within 60s")
+
+
+def post_query(base_url, message):
+    data = urllib.parse.urlencode({"message": message}).encode("utf-8")
+    start = time.perf_counter()
+    with urllib.request.urlopen(f"{base_url}/api/query", data=data, timeout=120) as resp:
+        body = json.loads(resp.read())
+    return time.perf_counter() - start, body
+
+
+def post_multipart(url, fields, audio=b"\x1aE\xdf\xa3fake-webm"):
+    boundary = uuid.uuid4().hex
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8")
+        for name, value in fields.items()
+    ]
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="voice.webm"\r\n'
+        f"Content-Type: audio/webm\r\n\r\n".encode("utf-8") + audio + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    request = urllib.request.Request(url, data=b"".join(parts),
+                                     headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    with urllib.request.urlopen(request, timeout=120) as resp:
+        return resp.read()
+
+
+def parse_sse(body):
+    return [json.loads(block[len("data: "):]) for block in body.decode("utf-8").split("\n\n")
+            if block.startswith("data: ")]
+
+
+def voice_two_requests(base_url, session_id):
+    # What the clients used to do: /api/transcribe (which already answers),
+    # then the transcript again through /api/query/stream
+    data = json.loads(post_multipart(f"{base_url}/api/transcribe", {"session_id": session_id}))
+    body = urllib.parse.urlencode({"message": data["query"], "session_id": session_id}).encode("utf-8")
+    with urllib.request.urlopen(f"{base_url}/api/query/stream", data=body, timeout=120) as resp:
+        return parse_sse(resp.read())
+
+
+def voice_one_request(base_url, session_id):
+    events = parse_sse(post_multipart(f"{base_url}/api/voice/stream", {"session_id": session_id}))
+    assert events and events[0]["type"] == "transcript", "transcript must be the first event"
+    return events
+
+
+def upstream_cost(fake_url, flow, *args):
+    urllib.request.urlopen(urllib.request.Request(f"{fake_url}/stats/reset", method="POST")).close()
+    start = time.perf_counter()
+    flow(*args)
+    elapsed = time.perf_counter() - start
+    with urllib.request.urlopen(f"{fake_url}/stats") as resp:
+        requests = json.loads(resp.read())["requests"]
+    return elapsed, requests
+
+
+def run_voice_check(app_module, fake_url):
+    routes = ["/v1/audio/transcriptions", "/v1/embeddings", "/query", "/v1/chat/completions"]
+    results = {}
+    for name, flow in [("transcribe + query", voice_two_requests), ("voice/stream", voice_one_request)]:
+        # A fresh app per flow, with caches off, so neither flow warms the other
+        port = free_port()
+        app = start_app(app_module, fake_url, port, {"ANSWER_CACHE_BACKEND": "off", "EMBEDDING_CACHE": "off"})
+        try:
+            results[name] = upstream_cost(fake_url, flow, f"http://127.0.0.1:{port}", uuid.uuid4().hex)
+        finally:
+            app.terminate()
+            app.wait()
+    print(f"{'flow':<20}{'wall s':>8}" + "".join(f"{route.split('/')[-1]:>16}" for route in routes))
+    for name, (elapsed, requests) in results.items():
+        print(f"{name:<20}{elapsed:>8.2f}" + "".join(f"{requests.get(route, 0):>16}" for route in routes))
+    before, after = results["transcribe + query"][1], results["voice/stream"][1]
+    halved = all(after.get(route, 0) * 2 <= before.get(route, 0) for route in routes[1:])
+    single = after.get("/v1/audio/transcriptions", 0) == 1
+    print("✅ One transcription and half the RAG calls per voice message" if halved and single
+          else "❌ Voice flow still repeats upstream calls")
+
+
+def tone_recording(seconds, sample_rate=8000):
+    """A WAV of distinct tones separated by short pauses, and its expected transcript."""
+    import numpy as np
+    from audio_pipeline import wav_bytes
+
+    rng = np.random.default_rng(0)
+    pieces, words, total, i = [], [], 0.0, 0
+    while total < seconds:
+        freq = 200 + 100 * (i % 15)
+        length = float(rng.uniform(6, 14))
+        t = np.arange(int(length * sample_rate)) / sample_rate
+        pieces += [8000 * np.sin(2 * np.pi * freq * t), np.zeros(int(0.8 * sample_rate))]
+        words.append(f"tone{freq}")
+        total += length + 0.8
+        i += 1
+    return wav_bytes(np.concatenate(pieces), sample_rate), " ".join(words)
+
+
+def post_raw_audio(url, audio, content_type="audio/wav"):
+    """Posts audio as the request body; returns (seconds to transcript, total seconds, events)."""
+    request = urllib.request.Request(url, data=audio, headers={"Content-Type": content_type})
+    start = time.perf_counter()
+    first, events = None, []
+    with urllib.request.urlopen(request, timeout=600) as resp:
+        for line in resp:
+            if line.startswith(b"data: "):
+                events.append(json.loads(line[6:]))
+                first = first or time.perf_counter() - start
+    return first, time.perf_counter() - start, events
+
+
+def run_long_audio_check(app_module, fake_url, seconds):
+    audio, expected = tone_recording(seconds)
+    print(f"Recording: {seconds:.0f}s of audio, {len(audio) / 1e6:.1f} MB WAV")
+    results = {}
+    for mode in ["off", "on"]:
+        port = free_port()
+        app = start_app(app_module, fake_url, port, {"TRANSCRIBE_SPLIT": mode, "ANSWER_CACHE_BACKEND": "off"})
+        try:
+            url = f"http://127.0.0.1:{port}/api/voice/stream?session_id={uuid.uuid4().hex}"
+            urllib.request.urlopen(urllib.request.Request(f"{fake_url}/stats/reset", method="POST")).close()
+            first, total, events = post_raw_audio(url, audio)
+            with urllib.request.urlopen(f"{fake_url}/stats") as resp:
+                calls = json.loads(resp.read())["requests"].get("/v1/audio/transcriptions", 0)
+            transcript = events[0]["text"] if events and events[0]["type"] == "transcript" else ""
+            results[mode] = (first, total, calls, transcript == expected)
+        finally:
+            app.terminate()
+            app.wait()
+    print(f"{'split':<8}{'transcript s':>14}{'total s':>10}{'whisper calls':>15}{'in order':>10}")
+    for mode, (first, total, calls, correct) in results.items():
+        print(f"{mode:<8}{first:>14.2f}{total:>10.2f}{calls:>15}{'yes' if correct else 'no':>10}")
+    whole, split = results["off"], results["on"]
+    faster = split[3] and whole[3] and split[0] < whole[0] / 2
+    print("✅ Split transcription is faster and stitched in order" if faster
+          else "❌ Split transcription did not beat whole-file transcription")
+
+
+def run_burst(base_url, concurrency):
+    questions = [f"What does the RS-1 zone allow? (variant {i})" for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda q: post_query(base_url, q), questions))
+    wall = time.perf_counter() - start
+    return wall, [latency for latency, _ in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrency benchmark for the RAG API")
+    parser.add_argument("--app", default="main", help="Module exposing the FastAPI app")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.3, help="Artificial latency per upstream call")
+    parser.add_argument("--voice", action="store_true", help="Compare upstream calls per voice message")
+    parser.add_argument("--long-audio", type=float, metavar="SECONDS",
+                        help="Compare whole-file and split transcription of a long recording")
+    parser.add_argument("--transcription-rate", type=float, default=0.05,
+                        help="Fake Whisper seconds per second of audio (with --long-audio)")
+    args = parser.parse_args()
+
+    fake = start_fake_server(latency=args.latency, transcription_rate=args.transcription_rate)
+    fake_url = f"http://127.0.0.1:{fake.server_port}"
+    if args.long_audio:
+        try:
+            run_long_audio_check(args.app, fake_url, args.long_audio)
+        finally:
+            fake.shutdown()
+        return
+    if args.voice:
+        try:
+            run_voice_check(args.app, fake_url)
+        finally:
+            fake.shutdown()
+        return
+
+    port = free_port()
+    app = start_app(args.app, fake_url, port)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        single, _ = post_query(base_url, "warm up")
+        single, _ = post_query(base_url, "What does the RS-1 zone allow?")
+        urllib.request.urlopen(urllib.request.Request(f"{fake_url}/stats/reset", method="POST")).close()
+
+        wall, latencies = run_burst(base_url, args.concurrency)
+        with urllib.request.urlopen(f"{fake_url}/stats") as resp:
+            upstream = json.loads(resp.read())
+
+        serial_estimate = single * args.concurrency
+        print(f"Single request latency : {single:.3f}s")
+        print(f"Burst of {args.concurrency} requests   : {wall:.3f}s wall "
+              f"(serial would be ~{serial_estimate:.3f}s)")
+        print(f"Per-request latency    : median {statistics.median(latencies):.3f}s, max {max(latencies):.3f}s")
+        print(f"Upstream peak in-flight: {upstream['peak_in_flight']}")
+        print(f"Upstream calls         : {upstream['requests']}")
+        overlapped = upstream["peak_in_flight"] > 1 and wall < serial_estimate / 2
+        print("✅ Requests overlapped" if overlapped else "❌ Requests ran one after another")
+    finally:
+        app.terminate()
+        app.wait()
+        fake.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,681 @@
+import argparse
+import heapq
+import json
+import math
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.runnables.config import run_in_executor
+from langchain_core.vectorstores import VectorStore
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+# In-process vector index, a drop-in for the Pinecone and Chroma stores.
+# Vectors are L2-normalised and scored by cosine similarity. The default is
+# an exact NumPy scan ("flat"). The HNSW graph is pure Python: it takes
+# minutes to build (about 180 s for 50k vectors of 256 dims), and its queries
+# only beat the scan above roughly 30k vectors (2.5 ms vs 6.6 ms at 50k,
+# 2.6 ms vs 13 ms at 100k, per bench_vector_index.py). So it is opt-in:
+# "hnsw" always builds it, "auto" once the index reaches LOCAL_INDEX_HNSW_MIN.
+# On disk an index is a directory of .npy files that are memory-mapped on
+# load, so a cold start only reads a small header. Texts are read per hit,
+# and ids and metadata are read the first time they are needed.
+
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "local_index")
+LOCAL_INDEX_MODE = os.getenv("LOCAL_INDEX_MODE", "flat")  # flat | auto | hnsw
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float32")  # float32 | int8
+# In auto mode, an HNSW graph is built once the index holds this many vectors
+LOCAL_INDEX_HNSW_MIN = int(os.getenv("LOCAL_INDEX_HNSW_MIN", "50000"))
+HNSW_M = int(os.getenv("LOCAL_INDEX_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("LOCAL_INDEX_HNSW_EF_CONSTRUCTION", "100"))
+HNSW_EF_SEARCH = int(os.getenv("LOCAL_INDEX_HNSW_EF_SEARCH", "64"))
+
+_FORMAT_VERSION = 1
+_SCAN_BLOCK = 16384
+_MASK_CACHE_SIZE = 32
+_EMPTY = np.empty(0, dtype=np.int32)
+
+
+def _normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _quantize(vectors):
+    # Symmetric per-row int8: vector ~= codes * scale
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _grow(array, rows, fill=0):
+    # Amortised growth for the row-appendable arrays (also un-memmaps them)
+    if array is not None and len(array) >= rows:
+        return array
+    capacity = max(rows, 2 * (0 if array is None else len(array)), 1024)
+    grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def matches_filter(metadata, where):
+    """Pinecone/Chroma-style metadata filter: equality, $eq, $ne, $in, $nin,
+    $gt, $gte, $lt, $lte, and $and / $or over lists of filters."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, operand in condition.items():
+            if op == "$eq":
+                ok = value == operand
+            elif op == "$ne":
+                ok = value != operand
+            elif op == "$in":
+                ok = value in operand
+            elif op == "$nin":
+                ok = value not in operand
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                try:
+                    ok = {"$gt": value > operand, "$gte": value >= operand,
+                          "$lt": value < operand, "$lte": value <= operand}[op]
+                except TypeError:
+                    ok = False
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+            if not ok:
+                return False
+    return True
+
+
+class _TextFile:
+    """Read-only view of texts.jsonl; each text is read when it is needed."""
+
+    def __init__(self, path, offsets):
+        self.path = path
+        self.offsets = offsets
+        self._local = threading.local()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        f = getattr(self._local, "file", None)
+        if f is None:
+            f = self._local.file = open(self.path, "rb")
+        f.seek(int(self.offsets[row]))
+        return json.loads(f.read(int(self.offsets[row + 1] - self.offsets[row])))
+
+
+class HNSWGraph:
+    """Hierarchical navigable small-world graph over the index rows.
+
+    Layer 0 is a dense ``(rows, 2*M)`` int32 array padded with -1, so it can
+    be memory-mapped. The sparse upper layers are dicts. ``score(query, rows)``
+    returns the similarities of ``rows`` to ``query``; ``rows(ids)`` returns
+    the vectors.
+    """
+
+    def __init__(self, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, seed=0):
+        self.m = m
+        self.m0 = 2 * m
+        self.ef_construction = ef_construction
+        self.level_mult = 1 / math.log(m)
+        self.rng = np.random.default_rng(seed)
+        self.entry_point = -1
+        self.max_level = -1
+        self.levels = np.zeros(0, dtype=np.int8)
+        self.layer0 = np.full((0, self.m0), -1, dtype=np.int32)
+        self.upper = []
+
+    def neighbors(self, level, node):
+        if level == 0:
+            row = self.layer0[node]
+            return row[row >= 0]
+        return self.upper[level - 1].get(node, _EMPTY)
+
+    def search_layer(self, score, query, entry_points, ef, level, skip=None):
+        visited = set(entry_points)
+        sims = score(query, np.asarray(entry_points)).tolist()
+        candidates = [(-s, p) for s, p in zip(sims, entry_points)]
+        heapq.heapify(candidates)
+        results = list(zip(sims, entry_points))
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if len(results) >= ef and -neg_sim < results[0][0]:
+                break
+            fresh = [n for n in self.neighbors(level, node).tolist() if n not in visited and n != skip]
+            if not fresh:
+                continue
+            visited.update(fresh)
+            for sim, n in zip(score(query, np.asarray(fresh)).tolist(), fresh):
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, n))
+                    heapq.heappush(results, (sim, n))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return sorted(results, reverse=True)
+
+    def search(self, score, query, k, ef):
+        """Returns up to ``max(ef, k)`` ``(similarity, row)`` pairs, best first."""
+        if self.entry_point < 0:
+            return []
+        entry = [self.entry_point]
+        for level in range(self.max_level, 0, -1):
+            entry = [self.search_layer(score, query, entry, 1, level)[0][1]]
+        return self.search_layer(score, query, entry, max(ef, k), 0)
+
+    def insert(self, node, rows, score):
+        level = int(-math.log(1.0 - self.rng.random()) * self.level_mult)
+        self.levels = _grow(self.levels, node + 1)
+        self.layer0 = _grow(self.layer0, node + 1, fill=-1)
+        self.levels[node] = level
+        while len(self.upper) < level:
+            self.upper.append({})
+        for upper_level in range(1, level + 1):
+            self.upper[upper_level - 1][node] = _EMPTY
+        if self.entry_point < 0:
+            self.entry_point, self.max_level = node, level
+            return
+
+        query = rows(np.array([node]))[0]
+        entry = [self.entry_point]
+        for upper_level in range(self.max_level, level, -1):
+            entry = [self.search_layer(score, query, entry, 1, upper_level, skip=node)[0][1]]
+        for layer in range(min(level, self.max_level), -1, -1):
+            found = self.search_layer(score, query, entry, self.ef_construction, layer, skip=node)
+            self._set_links(layer, node, self._select(rows, found, self.m))
+            for neighbor in self._links(layer, node):
+                links = self._links(layer, neighbor)
+                limit = self.m0 if layer == 0 else self.m
+                if len(links) < limit:
+                    self._set_links(layer, neighbor, np.append(links, node))
+                else:
+                    # Over capacity: re-pick the neighbour's links among old + new
+                    pool = np.append(links, node)
+                    sims = score(rows(np.array([neighbor]))[0], pool).tolist()
+                    ranked = sorted(zip(sims, pool.tolist()), reverse=True)
+                    self._set_links(layer, neighbor, self._select(rows, ranked, limit))
+            entry = [n for _, n in found]
+        if level > self.max_level:
+            self.entry_point, self.max_level = node, level
+
+    def _links(self, level, node):
+        return self.neighbors(level, node)
+
+    def _set_links(self, level, node, links):
+        links = np.asarray(links, dtype=np.int32)
+        if level == 0:
+            self.layer0[node] = -1
+            self.layer0[node, :len(links)] = links
+        else:
+            self.upper[level - 1][node] = links
+
+    @staticmethod
+    def _select(rows, ranked, m):
+        # HNSW neighbour heuristic: keep a candidate only if it is closer to
+        # the new node than to any neighbour already kept, which spreads links
+        # across clusters; then top up with the closest pruned candidates
+        if len(ranked) <= m:
+            return [n for _, n in ranked]
+        vectors = rows(np.array([n for _, n in ranked]))
+        gram = vectors @ vectors.T
+        # closest[i]: similarity of candidate i to its nearest kept neighbour
+        closest = np.full(len(ranked), -np.inf, dtype=np.float32)
+        kept = []
+        pruned = []
+        for i, (sim, node) in enumerate(ranked):
+            if len(kept) >= m:
+                break
+            if closest[i] > sim:
+                pruned.append(node)
+            else:
+                kept.append(i)
+                np.maximum(closest, gram[i], out=closest)
+        selected = [ranked[i][1] for i in kept]
+        return selected + pruned[:m - len(selected)]
+
+    def save(self, path, count):
+        np.save(os.path.join(path, "hnsw_levels.npy"), self.levels[:count])
+        np.save(os.path.join(path, "hnsw_layer0.npy"), self.layer0[:count])
+        upper = [
+            np.concatenate([[level, node], np.pad(links, (0, self.m - len(links)), constant_values=-1)])
+            for level, layer in enumerate(self.upper, start=1)
+            for node, links in layer.items()
+        ]
+        np.save(os.path.join(path, "hnsw_upper.npy"),
+                np.array(upper, dtype=np.int32).reshape(-1, self.m + 2))
+        return {"m": self.m, "ef_construction": self.ef_construction,
+                "entry_point": self.entry_point, "max_level": self.max_level}
+
+    @classmethod
+    def load(cls, path, header):
+        graph = cls(header["m"], header["ef_construction"])
+        graph.entry_point = header["entry_point"]
+        graph.max_level = header["max_level"]
+        graph.levels = np.load(os.path.join(path, "hnsw_levels.npy"), mmap_mode="r")
+        graph.layer0 = np.load(os.path.join(path, "hnsw_layer0.npy"), mmap_mode="r")
+        graph.upper = [{} for _ in range(max(graph.max_level, 0))]
+        for row in np.load(os.path.join(path, "hnsw_upper.npy")):
+            links = row[2:]
+            graph.upper[row[0] - 1][int(row[1])] = links[links >= 0]
+        return graph
+
+
+class LocalVectorIndex(VectorStore):
+    """LangChain ``VectorStore`` backed by an in-process NumPy index.
+
+    ``mode`` is ``flat`` (exact scan, the default), ``hnsw`` (approximate
+    graph search) or ``auto`` (flat until ``hnsw_min`` vectors). ``dtype`` is ``float32``, or
+    ``int8`` for 4x smaller vectors with per-row scales. Adds and deletes
+    happen in memory; call ``save()`` to persist them.
+    """
+
+    def __init__(self, embedding, path=None, mode=LOCAL_INDEX_MODE, dtype=LOCAL_INDEX_DTYPE,
+                 hnsw_min=LOCAL_INDEX_HNSW_MIN, ef_search=HNSW_EF_SEARCH):
+        if mode not in ("auto", "flat", "hnsw"):
+            raise ValueError(f"Unknown local index mode: {mode}")
+        if dtype not in ("float32", "int8"):
+            raise ValueError(f"Unknown local index dtype: {dtype}")
+        self._embedding = embedding
+        self.path = path
+        self.mode = mode
+        self.dtype = dtype
+        self.hnsw_min = hnsw_min
+        self.ef_search = ef_search
+        self.dim = None
+        self._size = 0
+        self._codes = None
+        self._scales = None
+        self._deleted = np.zeros(0, dtype=bool)
+        self._graph = None
+        self._texts = []
+        self._metadatas = []
+        self._ids = []
+        self._id_to_row = None
+        self._lazy = {}
+        self._mask_cache = {}
+        self._lock = threading.RLock()
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def __len__(self):
+        return self._size - int(self._deleted[:self._size].sum())
+
+    # Persistence
+    @classmethod
+    def load(cls, path, embedding, ef_search=HNSW_EF_SEARCH, mode=None):
+        header_path = os.path.join(path, "index.json")
+        if not os.path.exists(header_path):
+            raise FileNotFoundError(
+                f"No local vector index at '{path}'. Build one with "
+                f"`python local_index.py --from-chroma <dir> --out {path}` or "
+                f"`VECTOR_BACKEND=local python local_pdf_preprocessing.py`."
+            )
+        with open(header_path) as f:
+            header = json.load(f)
+        if header.get("version") != _FORMAT_VERSION:
+            raise ValueError(f"Unsupported local index format: {header.get('version')}")
+        index = cls(embedding, path=path, mode=mode or header["mode"], dtype=header["dtype"],
+                    hnsw_min=header.get("hnsw_min", LOCAL_INDEX_HNSW_MIN), ef_search=ef_search)
+        index.dim = header["dim"]
+        index._size = header["count"]
+        index._codes = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        if index.dtype == "int8":
+            index._scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+        index._deleted = np.zeros(index._size, dtype=bool)
+        if header.get("hnsw"):
+            index._graph = HNSWGraph.load(path, header["hnsw"])
+        index._texts = _TextFile(os.path.join(path, "texts.jsonl"),
+                                 np.load(os.path.join(path, "texts_offsets.npy"), mmap_mode="r"))
+        index._ids = None
+        index._metadatas = None
+        return index
+
+    def save(self, path=None):
+        """Writes the index to ``path`` (default: where it was loaded from).
+
+        Deleted rows are dropped, and the graph is rebuilt if any were. The
+        new directory is swapped in with renames, so readers never see a
+        half-written index.
+        """
+        path = path or self.path or LOCAL_INDEX_PATH
+        with self._lock:
+            if self._deleted[:self._size].any():
+                self._compact()
+            ids, texts, metadatas = self._id_list(), self._text_list(), self._metadata_list()
+            tmp_path = f"{path}.tmp-{os.getpid()}"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+            count = self._size
+            dim = self.dim or 0
+            codes = self._codes[:count] if self._codes is not None else np.zeros(
+                (0, dim), dtype=np.int8 if self.dtype == "int8" else np.float32)
+            np.save(os.path.join(tmp_path, "vectors.npy"), codes)
+            if self.dtype == "int8":
+                scales = self._scales[:count] if self._scales is not None else np.zeros(0, np.float32)
+                np.save(os.path.join(tmp_path, "scales.npy"), scales)
+            offsets = [0]
+            with open(os.path.join(tmp_path, "texts.jsonl"), "wb") as f:
+                for text in texts:
+                    line = json.dumps(text).encode("utf-8") + b"\n"
+                    f.write(line)
+                    offsets.append(offsets[-1] + len(line))
+            np.save(os.path.join(tmp_path, "texts_offsets.npy"), np.array(offsets, dtype=np.int64))
+            with open(os.path.join(tmp_path, "ids.json"), "w") as f:
+                json.dump(ids, f)
+            with open(os.path.join(tmp_path, "metadata.json"), "w") as f:
+                json.dump(metadatas, f)
+            header = {"version": _FORMAT_VERSION, "dim": self.dim, "count": count, "mode": self.mode,
+                      "dtype": self.dtype, "hnsw_min": self.hnsw_min, "metric": "cosine",
+                      "hnsw": self._graph.save(tmp_path, count) if self._graph is not None else None}
+            with open(os.path.join(tmp_path, "index.json"), "w") as f:
+                json.dump(header, f, indent=1)
+
+            old_path = f"{path}.old-{os.getpid()}"
+            if os.path.exists(path):
+                os.replace(path, old_path)
+            os.replace(tmp_path, path)
+            shutil.rmtree(old_path, ignore_errors=True)
+            # Texts now live in memory; the directory they came from may be gone
+            self._texts = texts
+            self.path = path
+
+    # Lazily loaded columns
+    def _load_json(self, name):
+        if name not in self._lazy:
+            with open(os.path.join(self.path, name)) as f:
+                self._lazy[name] = json.load(f)
+        return self._lazy[name]
+
+    def _id_list(self):
+        if self._ids is None:
+            with self._lock:
+                if self._ids is None:
+                    self._ids = self._load_json("ids.json")
+        return self._ids
+
+    def _metadata_list(self):
+        if self._metadatas is None:
+            with self._lock:
+                if self._metadatas is None:
+                    self._metadatas = self._load_json("metadata.json")
+        return self._metadatas
+
+    def _text_list(self):
+        if isinstance(self._texts, _TextFile):
+            self._texts = [self._texts[row] for row in range(len(self._texts))]
+        return self._texts
+
+    def _row_of(self):
+        if self._id_to_row is None:
+            self._id_to_row = {
+                doc_id: row for row, doc_id in enumerate(self._id_list()) if not self._deleted[row]
+            }
+        return self._id_to_row
+
+    # Vector access
+    def _rows(self, rows):
+        if self.dtype == "int8":
+            return self._codes[rows].astype(np.float32) * self._scales[rows, None]
+        return np.asarray(self._codes[rows])
+
+    def _score(self, query, rows):
+        return self._rows(rows) @ query
+
+    def _scan(self, query, rows=None):
+        # Exact scores for every row (or just ``rows``), in blocks so int8
+        # codes are dequantised a block at a time
+        count = self._size if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, _SCAN_BLOCK):
+            end = min(start + _SCAN_BLOCK, count)
+            block = slice(start, end) if rows is None else rows[start:end]
+            if self.dtype == "int8":
+                scores[start:end] = (self._codes[block].astype(np.float32) @ query) * self._scales[block]
+            else:
+                scores[start:end] = self._codes[block] @ query
+        return scores
+
+    # Writes
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        return self.add_embeddings(texts, self._embedding.embed_documents(texts), metadatas, ids)
+
+    async def aadd_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        vectors = await self._embedding.aembed_documents(texts)
+        return await run_in_executor(None, self.add_embeddings, texts, vectors, metadatas, ids)
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None):
+        """Adds precomputed vectors. Existing ids are replaced."""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = [dict(m or {}) for m in metadatas] if metadatas else [{} for _ in texts]
+        ids = [str(i) if i is not None else str(uuid.uuid4()) for i in ids] if ids else \
+            [str(uuid.uuid4()) for _ in texts]
+        vectors = _normalize(embeddings)
+        if len(set(ids)) != len(ids):
+            # Repeated ids within one batch: the last occurrence wins
+            last = list({doc_id: i for i, doc_id in enumerate(ids)}.values())
+            texts, metadatas, ids = [texts[i] for i in last], [metadatas[i] for i in last], [ids[i] for i in last]
+            vectors = vectors[last]
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            self.delete([doc_id for doc_id in ids if doc_id in self._row_of()])
+            start, end = self._size, self._size + len(texts)
+            if self.dtype == "int8":
+                codes, scales = _quantize(vectors)
+                self._codes = _grow(self._codes if self._codes is not None
+                                    else np.zeros((0, self.dim), np.int8), end)
+                self._scales = _grow(self._scales if self._scales is not None
+                                     else np.zeros(0, np.float32), end)
+                self._codes[start:end] = codes
+                self._scales[start:end] = scales
+            else:
+                self._codes = _grow(self._codes if self._codes is not None
+                                    else np.zeros((0, self.dim), np.float32), end)
+                self._codes[start:end] = vectors
+            self._deleted = _grow(self._deleted, end)
+            self._deleted[start:end] = False
+            self._text_list().extend(texts)
+            self._metadata_list().extend(metadatas)
+            self._id_list().extend(ids)
+            for row, doc_id in enumerate(ids, start=start):
+                self._row_of()[doc_id] = row
+            self._size = end
+            self._mask_cache.clear()
+            if self._graph is not None:
+                for row in range(start, end):
+                    self._graph.insert(row, self._rows, self._score)
+            elif self.mode == "hnsw" or (self.mode == "auto" and len(self) >= self.hnsw_min):
+                self.build_graph()
+        return ids
+
+    def build_graph(self, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION):
+        with self._lock:
+            self._graph = HNSWGraph(m, ef_construction)
+            for row in range(self._size):
+                self._graph.insert(row, self._rows, self._score)
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return True
+        with self._lock:
+            row_of = self._row_of()
+            for doc_id in ids:
+                row = row_of.pop(doc_id, None)
+                if row is not None:
+                    self._deleted[row] = True
+            self._mask_cache.clear()
+        return True
+
+    def _compact(self):
+        keep = np.flatnonzero(~self._deleted[:self._size])
+        self._codes = np.array(self._codes[keep])
+        if self._scales is not None:
+            self._scales = np.array(self._scales[keep])
+        texts, metadatas, ids = self._text_list(), self._metadata_list(), self._id_list()
+        self._texts = [texts[row] for row in keep]
+        self._metadatas = [metadatas[row] for row in keep]
+        self._ids = [ids[row] for row in keep]
+        self._size = len(keep)
+        self._deleted = np.zeros(self._size, dtype=bool)
+        self._id_to_row = None
+        self._mask_cache.clear()
+        if self._graph is not None:
+            self.build_graph(self._graph.m, self._graph.ef_construction)
+
+    # Reads
+    def get_by_ids(self, ids):
+        row_of = self._row_of()
+        return [self._document(row_of[doc_id]) for doc_id in ids if doc_id in row_of]
+
+    def _document(self, row):
+        return Document(id=self._id_list()[row], page_content=self._texts[row],
+                        metadata=dict(self._metadata_list()[row]))
+
+    def _live_mask(self, where):
+        count = self._size
+        mask = ~self._deleted[:count]
+        if where:
+            key = json.dumps(where, sort_keys=True, default=str)
+            cached = self._mask_cache.get(key)
+            if cached is None or len(cached) != count:
+                metadatas = self._metadata_list()
+                cached = np.fromiter((matches_filter(metadatas[row], where) for row in range(count)),
+                                     dtype=bool, count=count)
+                if len(self._mask_cache) >= _MASK_CACHE_SIZE:
+                    self._mask_cache.pop(next(iter(self._mask_cache)))
+                self._mask_cache[key] = cached
+            mask = mask & cached
+        return mask
+
+    def search_rows(self, embedding, k=4, filter=None, ef=None):
+        """Returns up to ``k`` ``(row, similarity)`` pairs, best first."""
+        if self._size == 0:
+            return []
+        query = _normalize(embedding)[0]
+        mask = self._live_mask(filter)
+        live = int(mask.sum())
+        if live == 0:
+            return []
+        # The graph only pays off while most rows pass the filter; for narrow
+        # filters, an exact scan of the matching rows is cheaper and exact
+        if self._graph is not None and live * 10 >= self._size:
+            ef = max(ef or self.ef_search, k)
+            while True:
+                hits = [(row, sim) for sim, row in self._graph.search(self._score, query, k, ef) if mask[row]]
+                if len(hits) >= k or ef >= self._size:
+                    return hits[:k]
+                ef *= 4
+        rows = None if live == self._size else np.flatnonzero(mask)
+        scores = self._scan(query, rows)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(top_row if rows is None else rows[top_row]), float(scores[top_row])) for top_row in top]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [(self._document(row), score) for row, score in self.search_rows(embedding, k, filter)]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    async def asimilarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        # Embed on the event loop with the async client; search off it
+        embedding = await self._embedding.aembed_query(query)
+        return await run_in_executor(None, self.similarity_search_with_score_by_vector, embedding, k, filter)
+
+    async def asimilarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k, filter)]
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k=4, fetch_k=20, lambda_mult=0.5,
+                                                filter=None, **kwargs):
+        hits = self.search_rows(embedding, fetch_k, filter)
+        if not hits:
+            return []
+        rows = np.array([row for row, _ in hits])
+        picked = maximal_marginal_relevance(_normalize(embedding)[0], self._rows(rows),
+                                            lambda_mult=lambda_mult, k=k)
+        return [self._document(int(rows[i])) for i in picked]
+
+    def max_marginal_relevance_search(self, query, k=4, fetch_k=20, lambda_mult=0.5, filter=None, **kwargs):
+        return self.max_marginal_relevance_search_by_vector(
+            self._embedding.embed_query(query), k, fetch_k, lambda_mult, filter
+        )
+
+    def _select_relevance_score_fn(self):
+        return self._cosine_relevance_score_fn
+
+    @staticmethod
+    def _cosine_relevance_score_fn(similarity):
+        # Scores are cosine similarities already; map [-1, 1] onto [0, 1]
+        return (similarity + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, path=None, **kwargs):
+        index = cls(embedding, path=path, **kwargs)
+        index.add_texts(texts, metadatas, ids)
+        if path:
+            index.save(path)
+        return index
+
+
+def build_from_chroma(chroma_dir, out_path, mode=LOCAL_INDEX_MODE, dtype=LOCAL_INDEX_DTYPE):
+    """Copies an existing Chroma store into a local index without re-embedding."""
+    import chromadb
+
+    collection_client = chromadb.PersistentClient(path=chroma_dir)
+    index = LocalVectorIndex(None, path=out_path, mode=mode, dtype=dtype)
+    for collection in collection_client.list_collections():
+        if isinstance(collection, str):
+            collection = collection_client.get_collection(collection)
+        total = collection.count()
+        for offset in range(0, total, 1000):
+            batch = collection.get(include=["embeddings", "documents", "metadatas"], offset=offset, limit=1000)
+            if len(batch["ids"]):
+                index.add_embeddings(batch["documents"], batch["embeddings"], batch["metadatas"], batch["ids"])
+    index.save(out_path)
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a local vector index from a Chroma store")
+    parser.add_argument("--from-chroma", required=True, help="Chroma persist directory, e.g. persisted_rags")
+    parser.add_argument("--out", default=LOCAL_INDEX_PATH)
+    parser.add_argument("--mode", default=LOCAL_INDEX_MODE, choices=["auto", "flat", "hnsw"])
+    parser.add_argument("--dtype", default=LOCAL_INDEX_DTYPE, choices=["float32", "int8"])
+    args = parser.parse_args()
+
+    built = build_from_chroma(args.from_chroma, args.out, args.mode, args.dtype)
+    print(f"✅ {len(built)} vectors written to {args.out} "
+          f"({'hnsw' if built._graph is not None else 'flat'}, {built.dtype})")
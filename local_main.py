@@ -1,27 +1,128 @@
 import os
-from datetime import datetime
-from fastapi import FastAPI, Request, Form, UploadFile, File, Query
-from fastapi.responses import HTMLResponse, JSONResponse
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import NamedTuple
+from fastapi import FastAPI, Request, Query
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware import Middleware
 from dotenv import load_dotenv
-from langchain_community.vectorstores import Chroma
-from langchain_openai.embeddings import OpenAIEmbeddings
-from langchain_openai import ChatOpenAI
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from openai import OpenAI
-import tempfile
+from session_memory import build_session_store
+from intent_router import build_intent_router, canned_reply, get_time_based_greeting
+from audio_pipeline import AudioTooLarge, AudioTranscriber, filename_for
+from metrics import (CONTENT_TYPE, METRICS_ENABLED, MetricsMiddleware, answer_cache_collector, in_flight,
+                     registry, stage)
+from rag_core import ANSWER_TAG, FALLBACK_MESSAGE, is_fallback, sse_event, stream_chain_answer
+from startup import LazyResource, WarmUp, readiness
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
+# chroma, or local for the in-process index built by local_index.py
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# Sent through the retriever once at warm-up; empty to skip
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "zoning")
+
+# Clients, vector store and chain are built on first use (see startup.py)
+def build_transcriber():
+    from openai import OpenAI
+
+    return AudioTranscriber(OpenAI(api_key=OPENAI_API_KEY))
+
+class RagPipeline(NamedTuple):
+    embedding: object
+    vectorstore: object
+    chain: object
+    config: dict
+    answer_cache: object
+
+def build_rag():
+    from langchain.chains import ConversationalRetrievalChain
+    from langchain_openai import ChatOpenAI
+    from langchain_openai.embeddings import OpenAIEmbeddings
+    from answer_cache import QueryEmbeddingMemo, build_answer_cache
+    from compact_vectors import compact_embeddings
+    from embedding_cache import cached_embeddings
+    from hybrid_retrieval import build_retriever
+    from local_index import LOCAL_INDEX_DTYPE, LOCAL_INDEX_PATH, LocalVectorIndex
+    from metrics_callbacks import chain_config, timed_embeddings
+
+    # Wrapped so the question vector computed for the answer cache is reused
+    # by the retriever, and repeated questions are served from the on-disk cache
+    embedding = QueryEmbeddingMemo(cached_embeddings(timed_embeddings(OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY))))
+    # The index may hold shortened or int8 vectors (EMBEDDING_DIMENSIONS,
+    # LOCAL_INDEX_DTYPE); the answer cache keeps using the full ones
+    if VECTOR_BACKEND == "local":
+        vectorstore = LocalVectorIndex.load(LOCAL_INDEX_PATH, compact_embeddings(
+            embedding, quantized=LOCAL_INDEX_DTYPE == "int8"))
+    else:
+        from langchain_community.vectorstores import Chroma
+
+        vectorstore = Chroma(
+            persist_directory="persisted_rags",
+            embedding_function=compact_embeddings(embedding)
+        )
+
+    chain = ConversationalRetrievalChain.from_llm(
+        llm=ChatOpenAI(
+            model_name="gpt-4o-mini",
+            openai_api_key=OPENAI_API_KEY,
+            temperature=0,
+            max_tokens=300,
+            # Usage on the last streamed chunk, for the token counters
+            stream_usage=True,
+            tags=[ANSWER_TAG]
+        ),
+        condense_question_llm=ChatOpenAI(
+            model_name="gpt-4o-mini",
+            openai_api_key=OPENAI_API_KEY,
+            temperature=0,
+            max_tokens=300,
+            stream_usage=True
+        ),
+        # Dense-only or hybrid BM25 + dense, per RETRIEVAL_MODE
+        retriever=build_retriever(vectorstore, VECTOR_BACKEND)
+    )
+
+    answer_cache = build_answer_cache()
+    if answer_cache is not None:
+        registry.collectors.append(answer_cache_collector(answer_cache))
+    return RagPipeline(embedding, vectorstore, chain, chain_config(), answer_cache)
+
+transcriber = LazyResource("transcriber", build_transcriber)
+rag = LazyResource("rag", build_rag)
+
+async def warm_up():
+    pipeline = await rag.aget()
+    await transcriber.aget()
+    if WARMUP_QUERY:
+        await asyncio.to_thread(pipeline.vectorstore.similarity_search, WARMUP_QUERY, k=1)
+
+warmup = WarmUp(warm_up)
+
+async def get_pipeline():
+    # Requests that arrive before warm-up finishes wait for it (or start it, in lazy mode)
+    if not warmup.done:
+        await warmup.wait()
+    return rag.get()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warmup.on_startup()
+    yield
+    await warmup.on_shutdown()
+    # In-flight requests have finished by now
+    if rag.ready and rag.get().answer_cache is not None:
+        rag.get().answer_cache.close()
+    sessions.close()
 
 # Init FastAPI and templates
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
@@ -34,49 +135,107 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load vector store and RAG chains
-vectorstore = Chroma(
-    persist_directory="persisted_rags",
-    embedding_function=OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-)
+# Per-stage latency histograms, token counts and in-flight gauges for /metrics
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-chatbot_chain = ConversationalRetrievalChain.from_llm(
-    llm=ChatOpenAI(
-        model_name="gpt-4o-mini",
-        openai_api_key=OPENAI_API_KEY,
-        temperature=0,
-        max_tokens=300
-    ),
-    retriever=vectorstore.as_retriever(search_kwargs={"k": 5}),
-    memory=memory
-)
+# Conversation history lives per client session, not on the chain. With
+# SESSION_BACKEND=sqlite or redis it is shared by all worker processes.
+sessions = build_session_store()
 
-# Fallback-aware RAG response
-def get_rag_response(question):
-    greetings = ["hi", "hello", "hey", "what's up", "how are you", "good morning", "good evening"]
-    if question.strip().lower() in greetings:
-        return get_time_based_greeting()
+# Greetings, thanks and small talk get a templated reply without touching the chain
+intent_router = build_intent_router()
 
-    response = chatbot_chain.invoke({"question": question, "chat_history": []})
-    fallback_phrases = [
-        "I don't know", "I'm not sure", "I cannot answer that",
-        "Sorry, I don't know", "I do not have enough information"
-    ]
-    if any(phrase.lower() in response['answer'].lower() for phrase in fallback_phrases):
-        return "I have no idea about this thing. I am trained on very limited data, that is why I can't answer that question."
-    return response['answer']
-
-# Time-based greeting message
-def get_time_based_greeting():
-    hour = datetime.now().hour
-    if hour < 12:
-        greeting = "🌅 Good morning"
-    elif 12 <= hour < 18:
-        greeting = "🌞 Good afternoon"
+
+def fast_reply(question, history):
+    # In a conversation, short messages are usually follow-ups: rules only
+    if intent_router is None:
+        return None
+    return canned_reply(intent_router.route(question, has_history=bool(history)), get_time_based_greeting())
+
+
+ERROR_MESSAGE = "An error occurred while processing your question."
+
+# Answer-cache lookup. Only standalone questions (no earlier turns in the
+# session) are cached, since follow-ups depend on the conversation.
+def lookup_cached_answer(question, history, pipeline):
+    answer_cache = pipeline.answer_cache
+    if answer_cache is None or history:
+        return None, None
+    answer = answer_cache.lookup_exact(question)
+    if answer is not None:
+        return answer, None
+    question_embedding = pipeline.embedding.embed_query(question)
+    return answer_cache.lookup_semantic(question_embedding), question_embedding
+
+# Same, for the streaming path: nothing here may block the event loop
+async def alookup_cached_answer(question, history, pipeline):
+    answer_cache = pipeline.answer_cache
+    if answer_cache is None or history:
+        return None, None
+    answer = await answer_cache.alookup_exact(question)
+    if answer is not None:
+        return answer, None
+    question_embedding = await pipeline.embedding.aembed_query(question)
+    return await answer_cache.alookup_semantic(question_embedding), question_embedding
+
+# Fallback-aware RAG response. Callers await get_pipeline() first, so the
+# pipeline is built by then.
+def get_rag_response(question, session_id=None):
+    history = sessions.get_history(session_id)
+    reply = fast_reply(question, history)
+    if reply is not None:
+        return reply
+
+    pipeline = rag.get()
+    with stage("cache_lookup"):
+        cached, question_embedding = lookup_cached_answer(question, history, pipeline)
+    if cached is not None:
+        sessions.append(session_id, question, cached)
+        return cached
+
+    with in_flight("rag"):
+        response = pipeline.chain.invoke({"question": question, "chat_history": history}, pipeline.config)
+    if is_fallback(response['answer']):
+        answer = FALLBACK_MESSAGE
     else:
-        greeting = "🌇 Good evening"
-    return greeting
+        answer = response['answer']
+        if pipeline.answer_cache is not None and not history:
+            pipeline.answer_cache.store(question, answer, question_embedding)
+    sessions.append(session_id, question, answer)
+    return answer
+
+# Streaming variant: yields token events as the answer LLM produces them
+async def stream_rag_response(question, session_id=None):
+    try:
+        history = await sessions.aget_history(session_id)
+        reply = fast_reply(question, history)
+        if reply is not None:
+            yield {"type": "token", "text": reply}
+            yield {"type": "done", "answer": reply}
+            return
+
+        pipeline = await get_pipeline()
+        with stage("cache_lookup"):
+            cached, question_embedding = await alookup_cached_answer(question, history, pipeline)
+        if cached is not None:
+            await sessions.aappend(session_id, question, cached)
+            yield {"type": "token", "text": cached}
+            yield {"type": "done", "answer": cached}
+            return
+
+        inputs = {"question": question, "chat_history": history}
+        with in_flight("rag"):
+            async for event in stream_chain_answer(pipeline.chain, inputs, pipeline.config):
+                if event["type"] == "done":
+                    await sessions.aappend(session_id, question, event["answer"])
+                    if pipeline.answer_cache is not None and not history and event["answer"] != FALLBACK_MESSAGE:
+                        await pipeline.answer_cache.astore(question, event["answer"], question_embedding)
+                yield event
+    except Exception as e:
+        logger.error(f"Error in stream_rag_response: {str(e)}")
+        yield {"type": "replace", "text": ERROR_MESSAGE}
+        yield {"type": "done", "answer": ERROR_MESSAGE}
 
 # Initial welcome messages
 @app.get("/", response_class=HTMLResponse)
@@ -96,21 +255,104 @@ async def serve_ui(request: Request, ended: bool = Query(False)):
 async def query_api(request: Request):
     form_data = await request.form()
     message = form_data.get("message")
+    session_id = form_data.get("session_id")
     if not message:
         return JSONResponse(status_code=400, content={"error": "Message is required"})
-    answer = get_rag_response(message)
+    await get_pipeline()
+    # Session store, answer cache and chain calls all block; keep them off the event loop
+    answer = await asyncio.to_thread(get_rag_response, message, session_id)
     return JSONResponse({"answer": answer})
 
+@app.post("/api/query/stream")
+async def query_stream_api(request: Request):
+    form_data = await request.form()
+    message = form_data.get("message")
+    session_id = form_data.get("session_id")
+    if not message:
+        return JSONResponse(status_code=400, content={"error": "Message is required"})
+
+    async def event_stream():
+        async for event in stream_rag_response(message, session_id):
+            yield sse_event(event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    answer_cache = (await get_pipeline()).answer_cache
+    if answer_cache is None:
+        return JSONResponse({"enabled": False})
+    return JSONResponse({"enabled": True, **answer_cache.stats()})
+
+# Liveness, and readiness once the chain is built and warmed (503 until then)
+@app.get("/api/health")
+async def health_api():
+    return JSONResponse({"status": "ok"})
+
+@app.get("/api/ready")
+async def ready_api():
+    if not warmup.done:
+        warmup.start()
+    payload, status = readiness(warmup, rag, transcriber)
+    return JSONResponse(status_code=status, content=payload)
+
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def metrics_api():
+    if not METRICS_ENABLED:
+        return JSONResponse(status_code=404, content={"error": "Metrics are disabled"})
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
+
+# Raw audio bodies are transcribed while they arrive, as on /api/voice/stream
 @app.post("/api/transcribe")
-async def transcribe_audio(file: UploadFile = File(...)):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp:
-        tmp.write(file.file.read())
-        tmp_path = tmp.name
-
-    with open(tmp_path, "rb") as f:
-        transcript = client.audio.transcriptions.create(model="whisper-1", file=f)
-
-    os.remove(tmp_path)
-    question = transcript.text
-    answer = get_rag_response(question)
-    return JSONResponse({"query": question, "answer": answer})
\ No newline at end of file
+async def transcribe_audio(request: Request, session_id: str = Query(None)):
+    content_type = request.headers.get("content-type", "")
+    try:
+        with stage("transcribe"):
+            if content_type.startswith("multipart/form-data"):
+                form = await request.form()
+                session_id = form.get("session_id") or session_id
+                question = await (await transcriber.aget()).transcribe_upload(form["file"])
+            else:
+                question = await (await transcriber.aget()).transcribe_stream(request.stream(),
+                                                                              filename_for(content_type))
+    except AudioTooLarge as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    await get_pipeline()
+    answer = await asyncio.to_thread(get_rag_response, question, session_id)
+    return JSONResponse({"query": question, "answer": answer})
+
+# Voice pipeline: one transcription, then one retrieval and one generation,
+# streamed as SSE with the transcript first. A raw audio body (instead of
+# multipart) is split and transcribed while the upload is still arriving.
+@app.post("/api/voice/stream")
+async def voice_stream_api(request: Request, session_id: str = Query(None)):
+    content_type = request.headers.get("content-type", "")
+    try:
+        with stage("transcribe"):
+            if content_type.startswith("multipart/form-data"):
+                form = await request.form()
+                session_id = form.get("session_id") or session_id
+                question = await (await transcriber.aget()).transcribe_upload(form["file"])
+            else:
+                question = await (await transcriber.aget()).transcribe_stream(request.stream(),
+                                                                              filename_for(content_type))
+    except AudioTooLarge as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    if not question.strip():
+        return JSONResponse(status_code=400, content={"error": "No speech detected"})
+
+    async def event_stream():
+        yield sse_event({"type": "transcript", "text": question})
+        async for event in stream_rag_response(question, session_id):
+            yield sse_event(event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,39 +1,81 @@
 # preprocess_pdf.py
 import os
 from dotenv import load_dotenv
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai.embeddings import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
+from answer_cache import bump_index_version
+from compact_vectors import CompactEmbeddings, compact_embeddings
+from embedding_cache import cached_embeddings
+from hierarchical_chunking import CHUNKING, ParentStore
+from hybrid_retrieval import BM25Index, bm25_index_path
+from ingestion import chunk_id, iter_pdf_chunks
+from local_index import LOCAL_INDEX_DTYPE, LOCAL_INDEX_PATH, LocalVectorIndex
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# chroma, or local to build the in-process index at LOCAL_INDEX_PATH
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
 
-# 1. Set up better text splitter
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=150
-)
-
-# 2. Load multiple PDFs
-pdf_folder = "data"
-all_documents = []
-
-for filename in os.listdir(pdf_folder):
-    if filename.endswith(".pdf"):
-        path = os.path.join(pdf_folder, filename)
-        print(f"📄 Processing: {filename}")
-        loader = PyPDFLoader(path)
-        docs = loader.load_and_split(text_splitter=text_splitter)
-        for doc in docs:
-            doc.metadata["source"] = filename
-        all_documents.extend(docs)
-
-# 3. Build and save vectorstore
-print(f"🧠 Total chunks: {len(all_documents)}")
-vectorstore = Chroma.from_documents(
-    all_documents,
-    embedding=OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY),
-    persist_directory="persisted_rags"
-)
-print("✅ Vector store created and saved.")
\ No newline at end of file
+# 1. Text splitter settings
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+BATCH_SIZE = 100
+
+
+def main():
+    # 2. Open the vectorstore; stable chunk ids make re-runs upsert instead of duplicating
+    # Unchanged chunks are served from the embedding cache on re-runs
+    # EMBEDDING_DIMENSIONS and an int8 local index store compact vectors; the
+    # full ones are kept in the rescoring sidecar
+    embedding = compact_embeddings(cached_embeddings(OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)),
+                                   quantized=VECTOR_BACKEND == "local" and LOCAL_INDEX_DTYPE == "int8")
+    if VECTOR_BACKEND == "local":
+        if os.path.exists(os.path.join(LOCAL_INDEX_PATH, "index.json")):
+            vectorstore = LocalVectorIndex.load(LOCAL_INDEX_PATH, embedding)
+        else:
+            vectorstore = LocalVectorIndex(embedding, path=LOCAL_INDEX_PATH)
+    else:
+        vectorstore = Chroma(persist_directory="persisted_rags", embedding_function=embedding)
+
+    # 3. Parse PDFs in worker processes and add chunks as they arrive
+    pdf_folder = "data"
+    filenames = sorted(filename for filename in os.listdir(pdf_folder) if filename.endswith(".pdf"))
+    pending = []
+    total_chunks = 0
+    # Lexical index for hybrid retrieval, rebuilt alongside the vectors
+    bm25 = BM25Index()
+    # CHUNKING=structured indexes child chunks and keeps their parent sections
+    parent_store = None
+    if CHUNKING == "structured":
+        parent_store = ParentStore()
+        for source in parent_store.sources() - set(filenames):
+            parent_store.remove(source)
+    current_file = None
+    for filename, docs, file_done in iter_pdf_chunks(pdf_folder, filenames, CHUNK_SIZE, CHUNK_OVERLAP,
+                                                     parent_store=parent_store):
+        if filename != current_file:
+            print(f"📄 Processing: {filename}")
+            current_file = filename
+        pending.extend(docs)
+        total_chunks += len(docs)
+        bm25.add_documents((chunk_id(doc), doc) for doc in docs)
+        while len(pending) >= BATCH_SIZE or (file_done and pending):
+            batch, pending = pending[:BATCH_SIZE], pending[BATCH_SIZE:]
+            batch_by_id = {chunk_id(doc): doc for doc in batch}
+            vectorstore.add_documents(list(batch_by_id.values()), ids=list(batch_by_id))
+        if file_done and parent_store is not None:
+            parent_store.commit(filename)
+
+    if VECTOR_BACKEND == "local":
+        vectorstore.save()
+    bm25.save(bm25_index_path(VECTOR_BACKEND))
+    if isinstance(embedding, CompactEmbeddings):
+        embedding.store.save()
+    print(f"🧠 Total chunks: {total_chunks}")
+    # Cached answers were built from the old index
+    bump_index_version()
+    print("✅ Vector store created and saved.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,23 @@
 import os
+import asyncio
 import logging
-from datetime import datetime
-from fastapi import FastAPI, Request, Form, UploadFile, File, Query
-from fastapi.responses import HTMLResponse, JSONResponse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import NamedTuple
+from fastapi import FastAPI, Request, Query
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from langchain_pinecone import PineconeVectorStore
-from langchain_openai.embeddings import OpenAIEmbeddings
-from langchain_openai import ChatOpenAI
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from pinecone import Pinecone
-from openai import OpenAI
+from session_memory import build_session_store
+from intent_router import build_intent_router, canned_reply, get_time_based_greeting
+from admission import AdmissionController, Coalescer, Overloaded, coalesce_key
+from audio_pipeline import AudioTooLarge, AudioTranscriber, filename_for
+from metrics import (CONTENT_TYPE, METRICS_ENABLED, MetricsMiddleware, answer_cache_collector, in_flight,
+                     registry, stage)
+from rag_core import ANSWER_TAG, FALLBACK_MESSAGE, is_fallback, sse_event, stream_chain_answer
+from startup import LazyResource, WarmUp, readiness
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -25,36 +29,186 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
 PINECONE_NAMESPACE = os.getenv("PINECONE_NAMESPACE", "default")
+# pinecone, or local for the in-process index built by local_index.py
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+# Names the vector store for its BM25 index (as preprocess_pdf.py / local_pdf_preprocessing.py do)
+VECTOR_STORE = "local" if VECTOR_BACKEND == "local" else f"pinecone-{PINECONE_INDEX_NAME}-{PINECONE_NAMESPACE}"
+# Bounded pool for any LangChain step that has no native async implementation
+RAG_EXECUTOR_WORKERS = int(os.getenv("RAG_EXECUTOR_WORKERS", "16"))
+# Pooled connections to the OpenAI API, per worker process (serve.py can split a total)
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+# Sent through the retriever once at warm-up to open the pooled connections; empty to skip
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "zoning")
 
 # Verify environment variables
 required_env_vars = {
-    "OPENAI_API_KEY": OPENAI_API_KEY,
-    "PINECONE_API_KEY": PINECONE_API_KEY,
-    "PINECONE_INDEX_NAME": PINECONE_INDEX_NAME
+    "OPENAI_API_KEY": OPENAI_API_KEY
 }
+if VECTOR_BACKEND == "pinecone":
+    required_env_vars.update({
+        "PINECONE_API_KEY": PINECONE_API_KEY,
+        "PINECONE_INDEX_NAME": PINECONE_INDEX_NAME
+    })
 for var_name, var_value in required_env_vars.items():
     if not var_value:
         logger.error(f"Missing required environment variable: {var_name}")
         raise ValueError(f"Missing required environment variable: {var_name}")
 
-# Initialize OpenAI client
-try:
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    logger.info("OpenAI client initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize OpenAI client: {str(e)}")
-    raise
-
-# Initialize Pinecone
-try:
-    pc = Pinecone(api_key=required_env_vars["PINECONE_API_KEY"])
-    logger.info("Pinecone initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize Pinecone: {str(e)}")
-    raise
+# The clients, vector store and chain are built on first use, not at import,
+# so a worker can start serving health checks straight away (see startup.py).
+# Each worker process builds its own, after it has started.
+def build_http_pool():
+    # One connection pool shared by every OpenAI client in this worker
+    import httpx
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                            max_keepalive_connections=OPENAI_MAX_CONNECTIONS),
+        timeout=httpx.Timeout(600.0, connect=5.0)
+    )
+
+def build_transcriber():
+    from openai import AsyncOpenAI
+
+    try:
+        client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_pool.get())
+        logger.info("OpenAI client initialized successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize OpenAI client: {str(e)}")
+        raise
+    # Splits long recordings at silences and transcribes the pieces concurrently
+    return AudioTranscriber(client)
+
+class RagPipeline(NamedTuple):
+    embedding: object
+    vectorstore: object
+    chain: object
+    # Callbacks etc. passed on every chain call
+    config: dict
+    answer_cache: object
+
+def build_rag():
+    from langchain.chains import ConversationalRetrievalChain
+    from langchain_openai import ChatOpenAI
+    from langchain_openai.embeddings import OpenAIEmbeddings
+    from answer_cache import QueryEmbeddingMemo, build_answer_cache
+    from compact_vectors import compact_embeddings
+    from embedding_cache import cached_embeddings
+    from hybrid_retrieval import build_retriever
+    from local_index import LOCAL_INDEX_DTYPE, LOCAL_INDEX_PATH, LocalVectorIndex
+    from metrics_callbacks import chain_config, timed_embeddings
+
+    try:
+        # Wrapped so the question vector computed for the answer cache is reused
+        # by the retriever, and repeated questions are served from the on-disk cache
+        embedding = QueryEmbeddingMemo(cached_embeddings(timed_embeddings(OpenAIEmbeddings(
+            api_key=required_env_vars["OPENAI_API_KEY"],
+            model="text-embedding-3-small",
+            # Queries are short, so skip the tiktoken pass that splits long inputs
+            check_embedding_ctx_length=False,
+            http_async_client=http_pool.get()
+        ))))
+        # The index may hold shortened or int8 vectors (EMBEDDING_DIMENSIONS,
+        # LOCAL_INDEX_DTYPE); the answer cache keeps using the full ones
+        if VECTOR_BACKEND == "local":
+            vectorstore = LocalVectorIndex.load(LOCAL_INDEX_PATH, compact_embeddings(
+                embedding, quantized=LOCAL_INDEX_DTYPE == "int8"))
+        else:
+            from langchain_pinecone import PineconeVectorStore
+
+            vectorstore = PineconeVectorStore(
+                index_name=required_env_vars["PINECONE_INDEX_NAME"],
+                embedding=compact_embeddings(embedding),
+                namespace=PINECONE_NAMESPACE,
+                pinecone_api_key=required_env_vars["PINECONE_API_KEY"]
+            )
+        logger.info(f"Vector store initialized successfully ({VECTOR_BACKEND})")
+    except Exception as e:
+        logger.error(f"Failed to initialize vector store: {str(e)}")
+        raise
+
+    try:
+        chain = ConversationalRetrievalChain.from_llm(
+            llm=ChatOpenAI(
+                model_name="gpt-4o-mini",
+                openai_api_key=OPENAI_API_KEY,
+                temperature=0,
+                max_tokens=300,
+                # Usage on the last streamed chunk, for the token counters
+                stream_usage=True,
+                tags=[ANSWER_TAG],
+                http_async_client=http_pool.get()
+            ),
+            condense_question_llm=ChatOpenAI(
+                model_name="gpt-4o-mini",
+                openai_api_key=OPENAI_API_KEY,
+                temperature=0,
+                max_tokens=300,
+                stream_usage=True,
+                http_async_client=http_pool.get()
+            ),
+            # Dense-only or hybrid BM25 + dense, per RETRIEVAL_MODE
+            retriever=build_retriever(vectorstore, VECTOR_STORE)
+        )
+        logger.info("ConversationalRetrievalChain initialized successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize ConversationalRetrievalChain: {str(e)}")
+        raise
+
+    answer_cache = build_answer_cache()
+    if answer_cache is not None:
+        registry.collectors.append(answer_cache_collector(answer_cache))
+    return RagPipeline(embedding, vectorstore, chain, chain_config(), answer_cache)
+
+http_pool = LazyResource("http_pool", build_http_pool)
+transcriber = LazyResource("transcriber", build_transcriber)
+rag = LazyResource("rag", build_rag)
+# Keeps the Pinecone asyncio session open from warm-up until shutdown, so
+# queries reuse pooled connections
+resources = AsyncExitStack()
+pinecone_session = None
+
+async def warm_up():
+    global pinecone_session
+    pipeline = await rag.aget()
+    await transcriber.aget()
+    if VECTOR_BACKEND == "pinecone" and pinecone_session is None:
+        pinecone_session = await resources.enter_async_context(pipeline.vectorstore)
+    if WARMUP_QUERY:
+        await pipeline.vectorstore.asimilarity_search(WARMUP_QUERY, k=1)
+
+warmup = WarmUp(warm_up)
+
+async def get_pipeline():
+    # Requests that arrive before warm-up finishes wait for it (or start it, in lazy mode)
+    if not warmup.done:
+        await warmup.wait()
+    return rag.get()
+
+# Cap the default executor so sync fallbacks can't spawn unbounded threads,
+# and start warming up per STARTUP_MODE
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=RAG_EXECUTOR_WORKERS, thread_name_prefix="rag")
+    loop.set_default_executor(executor)
+    async with resources:
+        await warmup.on_startup()
+        yield
+        await warmup.on_shutdown()
+    await close_connections()
+    executor.shutdown(wait=False)
+
+# Runs after the server has drained in-flight requests
+async def close_connections():
+    if http_pool.ready:
+        await http_pool.get().aclose()
+    if rag.ready and rag.get().answer_cache is not None:
+        rag.get().answer_cache.close()
+    sessions.close()
 
 # Init FastAPI and templates
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
@@ -65,71 +219,179 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # So the React app can read when to retry after a 429/503
+    expose_headers=["Retry-After"],
 )
 
-# Load vector store and RAG chain
-try:
-    embedding = OpenAIEmbeddings(
-        api_key=required_env_vars["OPENAI_API_KEY"],
-        model="text-embedding-3-small"
-    )
-    vectorstore = PineconeVectorStore(
-        index_name=required_env_vars["PINECONE_INDEX_NAME"],
-        embedding=embedding,
-        namespace=PINECONE_NAMESPACE,
-        pinecone_api_key=required_env_vars["PINECONE_API_KEY"]
-    )
-    logger.info("Vector store initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize vector store: {str(e)}")
-    raise
-
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-try:
-    chatbot_chain = ConversationalRetrievalChain.from_llm(
-        llm=ChatOpenAI(
-            model_name="gpt-4o-mini",
-            openai_api_key=OPENAI_API_KEY,
-            temperature=0,
-            max_tokens=300
-        ),
-        retriever=vectorstore.as_retriever(search_kwargs={"k": 5}),
-        memory=memory
-    )
-    logger.info("ConversationalRetrievalChain initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize ConversationalRetrievalChain: {str(e)}")
-    raise
+# Per-stage latency histograms, token counts and in-flight gauges for /metrics
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Conversation history lives per client session, not on the chain. With
+# SESSION_BACKEND=sqlite or redis it is shared by all worker processes.
+sessions = build_session_store()
+
+# Bounded concurrency for chain runs, with a deadline-aware queue in front
+admission = AdmissionController()
+coalescer = Coalescer()
+
+# Greetings, thanks and small talk get a templated reply without touching the chain
+intent_router = build_intent_router()
+
+
+def fast_reply(question, history):
+    # In a conversation, short messages are usually follow-ups: rules only
+    if intent_router is None:
+        return None
+    return canned_reply(intent_router.route(question, has_history=bool(history)), get_time_based_greeting())
+
+
+ERROR_MESSAGE = "An error occurred while processing your question."
+
+# Answer-cache lookup. Only standalone questions (no earlier turns in the
+# session) are cached, since follow-ups depend on the conversation.
+async def lookup_cached_answer(question, history, pipeline):
+    answer_cache = pipeline.answer_cache
+    if answer_cache is None or history:
+        return None, None
+    answer = await answer_cache.alookup_exact(question)
+    if answer is not None:
+        return answer, None
+    question_embedding = await pipeline.embedding.aembed_query(question)
+    return await answer_cache.alookup_semantic(question_embedding), question_embedding
+
+# Cached answer, or one chain run inside an admission slot
+async def answer_question(question, history, pipeline):
+    with stage("cache_lookup"):
+        cached, question_embedding = await lookup_cached_answer(question, history, pipeline)
+    if cached is not None:
+        return cached
 
-# Fallback-aware RAG response
-def get_rag_response(question):
-    greetings = ["hi", "hello", "hey", "what's up", "how are you", "good morning", "good evening"]
-    if question.strip().lower() in greetings:
-        return get_time_based_greeting()
+    async with admission.slot():
+        with in_flight("rag"):
+            response = await pipeline.chain.ainvoke({"question": question, "chat_history": history},
+                                                    pipeline.config)
+    if is_fallback(response['answer']):
+        return FALLBACK_MESSAGE
+    answer = response['answer']
+    if pipeline.answer_cache is not None and not history:
+        await pipeline.answer_cache.astore(question, answer, question_embedding)
+    return answer
 
+# Fallback-aware RAG response. Raises Overloaded when the server is saturated.
+async def get_rag_response(question, session_id=None):
     try:
-        response = chatbot_chain.invoke({"question": question, "chat_history": []})
-        fallback_phrases = [
-            "I don't know", "I'm not sure", "I cannot answer that",
-            "Sorry, I don't know", "I do not have enough information"
-        ]
-        if any(phrase.lower() in response['answer'].lower() for phrase in fallback_phrases):
-            return "I have no idea about this thing. I am trained on very limited data, that is why I can't answer that question."
-        return response['answer']
+        history = await sessions.aget_history(session_id)
+        reply = fast_reply(question, history)
+        if reply is not None:
+            return reply
+
+        pipeline = await get_pipeline()
+        if history:
+            answer = await answer_question(question, history, pipeline)
+        else:
+            # The same standalone question asked by several clients at once
+            # is answered by one run
+            answer = await coalescer.run(coalesce_key(question),
+                                         lambda: answer_question(question, history, pipeline))
+        await sessions.aappend(session_id, question, answer)
+        return answer
+    except Overloaded:
+        raise
     except Exception as e:
         logger.error(f"Error in get_rag_response: {str(e)}")
-        return "An error occurred while processing your question."
-
-# Time-based greeting message
-def get_time_based_greeting():
-    hour = datetime.now().hour
-    if hour < 12:
-        greeting = "🌅 Good morning"
-    elif 12 <= hour < 18:
-        greeting = "🌞 Good afternoon"
-    else:
-        greeting = "🌇 Good evening"
-    return greeting
+        return ERROR_MESSAGE
+
+# Streaming variant. Everything that can answer without the chain (fast
+# replies, the answer cache) runs before the response starts, and only a
+# chain run takes an admission slot: an overloaded server refuses it with
+# 429/503 instead of a broken stream, and never refuses a greeting or a
+# cached answer. Raises Overloaded; returns the events to stream.
+async def open_rag_stream(question, session_id=None):
+    try:
+        history = await sessions.aget_history(session_id)
+        reply = fast_reply(question, history)
+        if reply is not None:
+            return answer_events(reply)
+
+        pipeline = await get_pipeline()
+        with stage("cache_lookup"):
+            cached, question_embedding = await lookup_cached_answer(question, history, pipeline)
+        if cached is not None:
+            await sessions.aappend(session_id, question, cached)
+            return answer_events(cached)
+
+        if history:
+            permit = await admission.acquire()
+            events = chain_events(question, history, pipeline, question_embedding, permit)
+        else:
+            # The same standalone question streamed to several clients at
+            # once is answered by one run, and only that run takes a slot
+            key = coalesce_key(question)
+            permit = None if coalescer.streaming(key) else await admission.acquire()
+            if permit is not None and coalescer.streaming(key):
+                # Another client started the run while this one waited
+                permit.release()
+            events = coalescer.stream(key, lambda: chain_events(question, history, pipeline,
+                                                                question_embedding, permit))
+        return session_events(events, question, session_id)
+    except Overloaded:
+        raise
+    except Exception as e:
+        logger.error(f"Error in open_rag_stream: {str(e)}")
+        return error_events()
+
+async def answer_events(answer):
+    yield {"type": "token", "text": answer}
+    yield {"type": "done", "answer": answer}
+
+async def error_events():
+    yield {"type": "replace", "text": ERROR_MESSAGE}
+    yield {"type": "done", "answer": ERROR_MESSAGE}
+
+# One chain run, streamed; frees its admission slot when it ends
+async def chain_events(question, history, pipeline, question_embedding, permit):
+    inputs = {"question": question, "chat_history": history}
+    try:
+        with in_flight("rag"):
+            async for event in stream_chain_answer(pipeline.chain, inputs, pipeline.config):
+                if (event["type"] == "done" and pipeline.answer_cache is not None and not history
+                        and event["answer"] != FALLBACK_MESSAGE):
+                    await pipeline.answer_cache.astore(question, event["answer"], question_embedding)
+                yield event
+    finally:
+        permit.release()
+
+# Relays a chain stream to one client and records the turn in its session
+async def session_events(events, question, session_id):
+    try:
+        async for event in events:
+            if event["type"] == "done":
+                await sessions.aappend(session_id, question, event["answer"])
+            yield event
+    except Exception as e:
+        logger.error(f"Error in session_events: {str(e)}")
+        async for event in error_events():
+            yield event
+    finally:
+        await events.aclose()
+
+def overloaded_response(error):
+    return JSONResponse(status_code=error.status_code, content={"error": str(error)}, headers=error.headers())
+
+def sse_response(events):
+    async def event_stream():
+        try:
+            async for event in events:
+                yield sse_event(event)
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Initial welcome messages
 @app.get("/", response_class=HTMLResponse)
@@ -150,25 +412,118 @@ async def serve_ui(request: Request, ended: bool = Query(False)):
 async def query_api(request: Request):
     form_data = await request.form()
     message = form_data.get("message")
+    session_id = form_data.get("session_id")
     if not message:
         return JSONResponse(status_code=400, content={"error": "Message is required"})
-    answer = get_rag_response(message)
+    try:
+        answer = await get_rag_response(message, session_id)
+    except Overloaded as e:
+        return overloaded_response(e)
     return JSONResponse({"answer": answer})
 
-@app.post("/api/transcribe")
-async def transcribe_audio(file: UploadFile = File(...)):
+@app.post("/api/query/stream")
+async def query_stream_api(request: Request):
+    form_data = await request.form()
+    message = form_data.get("message")
+    session_id = form_data.get("session_id")
+    if not message:
+        return JSONResponse(status_code=400, content={"error": "Message is required"})
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp:
-            tmp.write(file.file.read())
-            tmp_path = tmp.name
+        events = await open_rag_stream(message, session_id)
+    except Overloaded as e:
+        return overloaded_response(e)
+    return sse_response(events)
+
+@app.get("/api/admission/stats")
+async def admission_stats():
+    return JSONResponse({**admission.stats(), "coalescing": len(coalescer)})
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    answer_cache = (await get_pipeline()).answer_cache
+    if answer_cache is None:
+        return JSONResponse({"enabled": False})
+    return JSONResponse({"enabled": True, **answer_cache.stats()})
+
+# Liveness: the process is up and serving
+@app.get("/api/health")
+async def health_api():
+    return JSONResponse({"status": "ok"})
+
+# Readiness: clients built and connections warmed (503 until then). A probe
+# also (re)starts the warm-up, so lazy mode and failed warm-ups recover.
+@app.get("/api/ready")
+async def ready_api():
+    if not warmup.done:
+        warmup.start()
+    payload, status = readiness(warmup, rag, transcriber)
+    return JSONResponse(status_code=status, content=payload)
 
-        with open(tmp_path, "rb") as f:
-            transcript = client.audio.transcriptions.create(model="whisper-1", file=f)
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def metrics_api():
+    if not METRICS_ENABLED:
+        return JSONResponse(status_code=404, content={"error": "Metrics are disabled"})
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
 
-        os.remove(tmp_path)
-        question = transcript.text
-        answer = get_rag_response(question)
+# Like /api/voice/stream, a raw audio body is transcribed while it arrives;
+# a multipart form is parsed (and spooled) first
+@app.post("/api/transcribe")
+async def transcribe_audio(request: Request, session_id: str = Query(None)):
+    try:
+        content_type = request.headers.get("content-type", "")
+        with stage("transcribe"):
+            if content_type.startswith("multipart/form-data"):
+                form = await request.form()
+                session_id = form.get("session_id") or session_id
+                question = await (await transcriber.aget()).transcribe_upload(form["file"])
+            else:
+                question = await (await transcriber.aget()).transcribe_stream(request.stream(),
+                                                                              filename_for(content_type))
+        answer = await get_rag_response(question, session_id)
         return JSONResponse({"query": question, "answer": answer})
+    except AudioTooLarge as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Error in transcribe_audio: {str(e)}")
-        return JSONResponse(status_code=500, content={"error": "Failed to process audio"})
\ No newline at end of file
+        return JSONResponse(status_code=500, content={"error": "Failed to process audio"})
+
+# Voice pipeline: one transcription, then one retrieval and one generation,
+# streamed as SSE. The transcript event comes first so the client can show
+# what was heard while the answer is generated. A raw audio body (instead of
+# multipart) is split and transcribed while the upload is still arriving.
+@app.post("/api/voice/stream")
+async def voice_stream_api(request: Request, session_id: str = Query(None)):
+    try:
+        content_type = request.headers.get("content-type", "")
+        with stage("transcribe"):
+            if content_type.startswith("multipart/form-data"):
+                form = await request.form()
+                session_id = form.get("session_id") or session_id
+                question = await (await transcriber.aget()).transcribe_upload(form["file"])
+            else:
+                question = await (await transcriber.aget()).transcribe_stream(request.stream(),
+                                                                              filename_for(content_type))
+    except AudioTooLarge as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    except Exception as e:
+        logger.error(f"Error in voice_stream_api: {str(e)}")
+        return JSONResponse(status_code=500, content={"error": "Failed to process audio"})
+    if not question.strip():
+        return JSONResponse(status_code=400, content={"error": "No speech detected"})
+    try:
+        events = await open_rag_stream(question, session_id)
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    async def voice_events():
+        yield {"type": "transcript", "text": question}
+        try:
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+
+    return sse_response(voice_events())
@@ -0,0 +1,266 @@
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Request-level latency instrumentation for the FastAPI apps.
+# Stages of a RAG request (condense, embed, retrieve, vector_query,
+# generate, transcribe) are timed into histograms and rendered in the
+# Prometheus text format on /metrics. With SERVER_TIMING=on, the stages that
+# finished before the response headers went out are also sent back in a
+# Server-Timing header. No client library is needed, and with METRICS=off
+# every hook is a no-op. The LangChain hooks are in metrics_callbacks.py, so
+# importing this module stays cheap.
+
+METRICS = os.getenv("METRICS", "on")  # on | off
+SERVER_TIMING = os.getenv("SERVER_TIMING", "off")  # on | off
+METRICS_ENABLED = METRICS == "on"
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+# Seconds; spans a cached lookup (~1ms) to a long Whisper call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels):
+        self.inc(*labels, amount=-1)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket counts (not cumulative), then sum and count
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                labels = _format_labels((*self.labels, "le"), (*key, bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        # Callables returning extra exposition lines, read at scrape time
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+STAGE_SECONDS = registry.register(Histogram(
+    "rag_stage_seconds", "Time spent in each stage of a request", ["stage"]))
+REQUEST_SECONDS = registry.register(Histogram(
+    "rag_request_seconds", "End-to-end HTTP request time, to the last body byte", ["route"]))
+REQUESTS = registry.register(Counter(
+    "rag_requests_total", "HTTP requests by route and status", ["route", "status"]))
+IN_FLIGHT = registry.register(Gauge(
+    "rag_in_flight", "HTTP requests being served, and RAG chain runs among them", ["kind"]))
+LLM_TOKENS = registry.register(Counter(
+    "rag_llm_tokens_total", "LLM tokens by stage and kind", ["stage", "kind"]))
+
+
+class RequestTrace:
+    """Stage timings of one request, in completion order."""
+
+    __slots__ = ("stages",)
+
+    def __init__(self):
+        self.stages = []
+
+    def add(self, stage, seconds):
+        self.stages.append((stage, seconds))
+
+    def total(self, stage):
+        return sum(seconds for name, seconds in self.stages if name == stage)
+
+    def server_timing(self):
+        # Repeated stages (e.g. one embed per retrieval) are summed
+        totals = {}
+        for stage, seconds in self.stages:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+_current_trace = contextvars.ContextVar("rag_request_trace", default=None)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def record_stage(stage, seconds):
+    if not METRICS_ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+class stage:
+    """Times a block: ``with stage("transcribe"): ...``. Works around awaits."""
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_stage(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class in_flight:
+    """Counts a block in the ``rag_in_flight`` gauge while it runs."""
+
+    __slots__ = ("kind",)
+
+    def __init__(self, kind):
+        self.kind = kind
+
+    def __enter__(self):
+        if METRICS_ENABLED:
+            IN_FLIGHT.inc(self.kind)
+        return self
+
+    def __exit__(self, *exc):
+        if METRICS_ENABLED:
+            IN_FLIGHT.dec(self.kind)
+        return False
+
+
+def answer_cache_collector(answer_cache):
+    """Exposes ``AnswerCache.stats()`` counters at scrape time."""
+    def collect():
+        stats = answer_cache.stats()
+        return [
+            "# HELP rag_answer_cache_lookups_total Answer-cache lookups by result",
+            "# TYPE rag_answer_cache_lookups_total counter",
+            f'rag_answer_cache_lookups_total{{result="exact_hit"}} {stats["exact_hits"]}',
+            f'rag_answer_cache_lookups_total{{result="semantic_hit"}} {stats["semantic_hits"]}',
+            f'rag_answer_cache_lookups_total{{result="miss"}} {stats["misses"]}',
+            "# HELP rag_answer_cache_entries Answers currently cached",
+            "# TYPE rag_answer_cache_entries gauge",
+            f"rag_answer_cache_entries {stats['entries']}",
+        ]
+    return collect
+
+
+class MetricsMiddleware:
+    """ASGI middleware: in-flight gauge, per-route latency and status counts.
+
+    It also opens the request trace the stage timers write to. When
+    SERVER_TIMING=on, the trace goes out as a Server-Timing header. Streamed
+    responses send their headers first, so they only carry the stages done by
+    then (e.g. transcription).
+    """
+
+    def __init__(self, app, server_timing=SERVER_TIMING == "on"):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing and trace.stages:
+                    headers = [*message.get("headers", []),
+                               (b"server-timing", trace.server_timing().encode("latin-1"))]
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        IN_FLIGHT.inc("http")
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            IN_FLIGHT.dec("http")
+            _current_trace.reset(token)
+            # Routing has run by now; label by the route template, not the raw path
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - started, route)
+            REQUESTS.inc(route, str(status))
+
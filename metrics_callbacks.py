@@ -0,0 +1,126 @@
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+
+from metrics import LLM_TOKENS, METRICS_ENABLED, current_trace, record_stage, stage
+from rag_core import ANSWER_TAG
+
+# LangChain side of metrics.py: a callback handler that times the chain's
+# LLM and retriever runs, and a wrapper that times embedding calls. Kept
+# apart so the apps can defer the LangChain import until the chain is built.
+
+
+def _token_usage(response):
+    # Chat models put usage on the message; older paths only in llm_output
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+class StageTimer(BaseCallbackHandler):
+    """LangChain callbacks that time the chain's LLM and retriever runs.
+
+    The LLM tagged ``ANSWER_TAG`` is the ``generate`` stage and any other LLM
+    is ``condense``. A retrieval is recorded as ``retrieve``, and again as
+    ``vector_query`` minus the embedding time spent inside it.
+    """
+
+    # Timing must not hop to a thread, or the contextvar trace is lost
+    run_inline = True
+
+    def __init__(self):
+        # Keyed by run_id, so one instance serves concurrent requests
+        self._started = {}
+        # Retriever runs nested, at any depth, inside a timed retriever
+        self._nested = set()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+        self._started[run_id] = (time.perf_counter(), "generate" if ANSWER_TAG in (tags or []) else "condense")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, tags=None, **kwargs):
+        self.on_chat_model_start(serialized, prompts, run_id=run_id, tags=tags)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        record_stage(started[1], time.perf_counter() - started[0])
+        prompt_tokens, completion_tokens = _token_usage(response)
+        if prompt_tokens:
+            LLM_TOKENS.inc(started[1], "prompt", amount=prompt_tokens)
+        if completion_tokens:
+            LLM_TOKENS.inc(started[1], "completion", amount=completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id in self._started or parent_run_id in self._nested:
+            # Wrapped by a retriever that is already timed (e.g. context
+            # compression around parent-child around the vector store)
+            self._nested.add(run_id)
+            return
+        trace = current_trace()
+        self._started[run_id] = (time.perf_counter(), trace.total("embed") if trace is not None else 0.0)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._nested.discard(run_id)
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started[0]
+        record_stage("retrieve", elapsed)
+        trace = current_trace()
+        if trace is not None:
+            record_stage("vector_query", max(0.0, elapsed - (trace.total("embed") - started[1])))
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._nested.discard(run_id)
+        self._started.pop(run_id, None)
+
+
+_stage_timer = StageTimer()
+
+
+def chain_config():
+    """``config`` for chain calls: the stage timer, or nothing with METRICS=off."""
+    return {"callbacks": [_stage_timer]} if METRICS_ENABLED else {}
+
+
+class TimedEmbeddings(Embeddings):
+    """Records each call to the wrapped embedding model as the ``embed`` stage.
+
+    Wrap the model itself, inside any cache, so only real API calls count.
+    """
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def __getattr__(self, name):
+        # model, dimensions, ... for the caches that key on them
+        return getattr(self.embeddings, name)
+
+    def embed_documents(self, texts):
+        with stage("embed"):
+            return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        with stage("embed"):
+            return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text):
+        with stage("embed"):
+            return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text):
+        with stage("embed"):
+            return await self.embeddings.aembed_query(text)
+
+
+def timed_embeddings(embeddings):
+    return TimedEmbeddings(embeddings) if METRICS_ENABLED else embeddings
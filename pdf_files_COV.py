@@ -1,9 +1,24 @@
-import requests
+import argparse
+import asyncio
+import hashlib
+import json
 import os
 import time
-from urllib.parse import urljoin
+from email.utils import formatdate
+from urllib.parse import unquote, urljoin, urlsplit
+
+import httpx
 from bs4 import BeautifulSoup
 
+# Concurrent, polite crawler for the City of Vancouver PDFs.
+# Downloads share one bounded connection pool. Each host gets at most
+# CRAWL_PER_HOST requests at a time, spaced at least CRAWL_HOST_DELAY seconds
+# apart. A manifest next to the PDFs keeps each URL's ETag, Last-Modified and
+# content hash: re-runs send conditional GETs and skip unchanged files (304).
+# Downloads go to a .part file and continue with a Range request after an
+# interruption, in the same run or the next one. With --ingest, new and
+# changed files are handed to the incremental ingestion in preprocess_pdf.py.
+
 PDF_LINKS = [
     "https://bylaws.vancouver.ca/zoning/zoning-by-law-consolidated.pdf",
     "https://council.vancouver.ca/20171128/documents/rr1appendixa.pdf",
@@ -12,42 +27,301 @@ PDF_LINKS = [
 ]
 
 BROCHURE_PAGE = "https://vancouver.ca/home-property-development/development-and-building-services-centre-brochures.aspx"
-BASE_FOLDER = "City_of_Vancouver_PDFs"
-os.makedirs(BASE_FOLDER, exist_ok=True)
+BASE_FOLDER = os.getenv("CRAWL_FOLDER", "City_of_Vancouver_PDFs")
+CRAWL_MAX_CONNECTIONS = int(os.getenv("CRAWL_MAX_CONNECTIONS", "8"))
+CRAWL_PER_HOST = int(os.getenv("CRAWL_PER_HOST", "2"))
+# Minimum seconds between the starts of two requests to the same host
+CRAWL_HOST_DELAY = float(os.getenv("CRAWL_HOST_DELAY", "1.0"))
+CRAWL_RETRIES = int(os.getenv("CRAWL_RETRIES", "3"))
+USER_AGENT = os.getenv("CRAWL_USER_AGENT", "JoviBot-PDF-crawler/1.0 (+https://jovirealty.com)")
+MANIFEST_NAME = "crawl_manifest.json"
+CHUNK_SIZE = 64 * 1024
 
-def download_pdf(url, folder):
-    file_name = url.split("/")[-1]
-    file_path = os.path.join(folder, file_name)
-    try:
-        resp = requests.get(url, stream=True, timeout=30)
-        if resp.status_code == 200 and 'application/pdf' in resp.headers.get("Content-Type", ""):
-            with open(file_path, "wb") as f:
-                for chunk in resp.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-            print(f"Downloaded: {file_path}")
+
+class CrawlManifest:
+    """Per-URL validators and hashes of the downloaded PDFs, saved atomically."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def get(self, url):
+        return self.entries.get(url, {})
+
+    def update(self, url, **fields):
+        entry = self.entries.setdefault(url, {})
+        entry.update(fields)
+        self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+class HostLimiter:
+    """At most ``per_host`` requests per host, their starts ``delay`` seconds apart."""
+
+    def __init__(self, per_host=CRAWL_PER_HOST, delay=CRAWL_HOST_DELAY):
+        self.per_host = per_host
+        self.delay = delay
+        self._slots = {}
+        self._next_start = {}
+        self._locks = {}
+
+    def slot(self, host):
+        if host not in self._slots:
+            self._slots[host] = asyncio.Semaphore(self.per_host)
+            self._locks[host] = asyncio.Lock()
+            self._next_start[host] = 0.0
+        return _HostSlot(self, host)
+
+    async def _wait_turn(self, host):
+        async with self._locks[host]:
+            now = time.monotonic()
+            wait = self._next_start[host] - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_start[host] = max(now, self._next_start[host]) + self.delay
+
+
+class _HostSlot:
+    def __init__(self, limiter, host):
+        self.limiter = limiter
+        self.host = host
+
+    async def __aenter__(self):
+        await self.limiter._slots[self.host].acquire()
+        try:
+            await self.limiter._wait_turn(self.host)
+        except BaseException:
+            self.limiter._slots[self.host].release()
+            raise
+
+    async def __aexit__(self, *exc):
+        self.limiter._slots[self.host].release()
+        return False
+
+
+class _Truncated(Exception):
+    pass
+
+
+def file_name_for(url):
+    return unquote(urlsplit(url).path.rstrip("/").split("/")[-1]) or "index.pdf"
+
+
+def _is_pdf(resp, first_bytes):
+    return "application/pdf" in resp.headers.get("Content-Type", "") or first_bytes.startswith(b"%PDF")
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Crawler:
+    def __init__(self, folder=BASE_FOLDER, max_connections=CRAWL_MAX_CONNECTIONS, per_host=CRAWL_PER_HOST,
+                 host_delay=CRAWL_HOST_DELAY, retries=CRAWL_RETRIES, timeout=30.0):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.manifest = CrawlManifest(os.path.join(folder, MANIFEST_NAME))
+        self.limiter = HostLimiter(per_host, host_delay)
+        self.retries = retries
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout),
+            headers={"User-Agent": USER_AGENT},
+            follow_redirects=True,
+        )
+        self.bytes_downloaded = 0
+
+    async def close(self):
+        await self.client.aclose()
+
+    def _local_names(self, urls):
+        # Assigned up front, so two URLs ending in the same file name never race for it
+        names = {}
+        taken = {entry["file"]: url for url, entry in self.manifest.entries.items() if entry.get("file")}
+        for url in urls:
+            file_name = self.manifest.get(url).get("file")
+            if file_name is None:
+                file_name = file_name_for(url)
+                if file_name in taken:
+                    stem, ext = os.path.splitext(file_name)
+                    file_name = f"{stem}-{hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]}{ext}"
+                taken[file_name] = url
+            names[url] = file_name
+        return names
+
+    async def fetch_pdf(self, url, file_name):
+        """Downloads ``url`` to ``file_name`` if it changed. Returns (status,
+        file name), where status is new, changed, unchanged, skipped or failed."""
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._fetch_once(url, file_name), file_name
+            except (httpx.TransportError, _Truncated) as e:
+                if attempt == self.retries:
+                    print(f"❌ Error downloading {url}: {e}")
+                    return "failed", file_name
+                # The .part file is kept; the retry continues from where this one stopped
+                await asyncio.sleep(min(2 ** attempt, 10))
+            except Exception as e:
+                print(f"❌ Error downloading {url}: {e}")
+                return "failed", file_name
+
+    async def _fetch_once(self, url, file_name):
+        entry = self.manifest.get(url)
+        path = os.path.join(self.folder, file_name)
+        part_path = path + ".part"
+        headers = {}
+        have_file = entry.get("sha256") and os.path.exists(path)
+        if have_file:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        partial = entry.get("partial") or {}
+        validator = partial.get("etag") or partial.get("last_modified")
+        if offset and validator:
+            # If-Range: the server sends the rest only if the file is still the same version
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
         else:
-            print(f"Skipped (Not PDF or error): {url}")
-        resp.close()
-    except Exception as e:
-        print(f"Error downloading {url}: {e}")
-    time.sleep(1)
-
-# Download static PDF links
-for pdf_url in PDF_LINKS:
-    download_pdf(pdf_url, BASE_FOLDER)
-
-for pdf_url in PDF_LINKS:
-    download_pdf(pdf_url, BASE_FOLDER)
-# Scrape additional brochures from the city page
-try:
-    resp = requests.get(BROCHURE_PAGE, timeout=30)
-    soup = BeautifulSoup(resp.text, "html.parser")
-    pdf_links = [a['href'] for a in soup.find_all("a", href=True) if a['href'].lower().endswith(".pdf")]
-    for link in pdf_links:
-        full_url = urljoin(BROCHURE_PAGE, link)
-        download_pdf(full_url, BASE_FOLDER)
-except Exception as e:
-    print(f"Failed to scrape brochures: {e}")
-
-print("\nPDF download complete.")
\ No newline at end of file
+            offset = 0
+
+        async with self.limiter.slot(urlsplit(url).netloc):
+            async with self.client.stream("GET", url, headers=headers) as resp:
+                if resp.status_code == 304:
+                    self.manifest.update(url, checked_at=formatdate(usegmt=True))
+                    return "unchanged"
+                if resp.status_code not in (200, 206):
+                    print(f"⚠️ Skipped (HTTP {resp.status_code}): {url}")
+                    return "skipped"
+                if resp.status_code == 200:
+                    offset = 0
+                elif not resp.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+                    raise _Truncated("unexpected Content-Range")
+                body = resp.aiter_bytes(CHUNK_SIZE)
+                first = await anext(body, b"")
+                if offset == 0 and not _is_pdf(resp, first):
+                    print(f"⚠️ Skipped (not a PDF): {url}")
+                    return "skipped"
+                expected = _expected_length(resp, offset)
+                # Remember the version being written, so an interrupted download can resume
+                self.manifest.update(url, file=file_name, partial={
+                    "etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")})
+                written = offset
+                with open(part_path, "ab" if offset else "wb") as f:
+                    chunk = first
+                    while chunk:
+                        f.write(chunk)
+                        written += len(chunk)
+                        self.bytes_downloaded += len(chunk)
+                        chunk = await anext(body, b"")
+                if expected is not None and written != expected:
+                    raise _Truncated(f"got {written} of {expected} bytes")
+                etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+
+        sha256 = await asyncio.to_thread(_sha256, part_path)
+        os.replace(part_path, path)
+        previous = entry.get("sha256")
+        self.manifest.update(url, file=file_name, etag=etag, last_modified=last_modified, sha256=sha256,
+                             size=written, partial=None, checked_at=formatdate(usegmt=True))
+        if previous is None:
+            return "new"
+        # Servers without validators always send the file; compare contents
+        return "unchanged" if previous == sha256 else "changed"
+
+    async def discover(self, page_url):
+        """PDF links on an HTML page."""
+        try:
+            async with self.limiter.slot(urlsplit(page_url).netloc):
+                resp = await self.client.get(page_url)
+            resp.raise_for_status()
+        except Exception as e:
+            print(f"❌ Failed to scrape {page_url}: {e}")
+            return []
+        soup = BeautifulSoup(resp.text, "html.parser")
+        return [urljoin(page_url, a["href"]) for a in soup.find_all("a", href=True)
+                if a["href"].lower().split("?")[0].endswith(".pdf")]
+
+    async def crawl(self, urls, pages=()):
+        """Fetches ``urls`` and the PDFs linked from ``pages``; returns {url: (status, file name)}."""
+        discovered = await asyncio.gather(*(self.discover(page) for page in pages))
+        # Each URL once, in order
+        all_urls = list(dict.fromkeys([*urls, *(url for found in discovered for url in found)]))
+        names = self._local_names(all_urls)
+        results = await asyncio.gather(*(self.fetch_pdf(url, names[url]) for url in all_urls))
+        return dict(zip(all_urls, results))
+
+
+def _expected_length(resp, offset):
+    length = resp.headers.get("Content-Length")
+    if length is None or resp.headers.get("Content-Encoding"):
+        return None
+    return offset + int(length)
+
+
+async def run_crawl(folder, urls, pages, **crawler_options):
+    crawler = Crawler(folder, **crawler_options)
+    start = time.perf_counter()
+    try:
+        results = await crawler.crawl(urls, pages)
+    finally:
+        await crawler.close()
+    return results, crawler.bytes_downloaded, time.perf_counter() - start
+
+
+def summarize(results):
+    counts = {}
+    for status, _ in results.values():
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+def ingest(folder, file_names):
+    # Incremental Pinecone ingestion of just these files; everything else in the index is left alone
+    from preprocess_pdf import main as preprocess_main
+
+    preprocess_main(pdf_folder=folder, only_files=file_names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the City of Vancouver PDFs")
+    parser.add_argument("--folder", default=BASE_FOLDER)
+    parser.add_argument("--url", action="append", help="PDF URL to fetch (default: the built-in list)")
+    parser.add_argument("--page", action="append", help="HTML page to scrape for PDF links (default: brochures)")
+    parser.add_argument("--max-connections", type=int, default=CRAWL_MAX_CONNECTIONS)
+    parser.add_argument("--per-host", type=int, default=CRAWL_PER_HOST)
+    parser.add_argument("--host-delay", type=float, default=CRAWL_HOST_DELAY)
+    parser.add_argument("--ingest", action="store_true",
+                        help="Ingest new and changed PDFs into Pinecone (preprocess_pdf.py) after the crawl")
+    args = parser.parse_args()
+
+    results, downloaded, elapsed = asyncio.run(run_crawl(
+        args.folder, args.url or PDF_LINKS, args.page if args.page is not None else [BROCHURE_PAGE],
+        max_connections=args.max_connections, per_host=args.per_host, host_delay=args.host_delay,
+    ))
+    for url, (status, file_name) in results.items():
+        if status in ("new", "changed"):
+            print(f"📥 {status.capitalize()}: {os.path.join(args.folder, file_name)}")
+    counts = ", ".join(f"{count} {status}" for status, count in sorted(summarize(results).items()))
+    print(f"\nPDF download complete in {elapsed:.1f}s: {counts}; {downloaded / 1e6:.1f} MB downloaded.")
+
+    updated = sorted({file_name for status, file_name in results.values() if status in ("new", "changed")})
+    if args.ingest and updated:
+        print(f"🧠 Ingesting {len(updated)} new/changed PDFs")
+        ingest(args.folder, updated)
+
+
+if __name__ == "__main__":
+    main()
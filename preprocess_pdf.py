@@ -1,11 +1,16 @@
 import os
+import asyncio
 import logging
+from collections import Counter
 from dotenv import load_dotenv
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai.embeddings import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from pinecone import Pinecone, ServerlessSpec
+from pinecone import Pinecone, PineconeAsyncio, ServerlessSpec
+from answer_cache import bump_index_version
+from compact_vectors import EMBEDDING_DIMENSIONS, FULL_EMBEDDING_DIMENSIONS, CompactEmbeddings, compact_embeddings
+from embedding_cache import cached_embeddings
+from hierarchical_chunking import CHUNKING, ParentStore
+from hybrid_retrieval import BM25Index, bm25_index_path
+from ingestion import IngestManifest, PineconeUpsertEngine, chunk_id, file_sha256, iter_pdf_chunks
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -17,85 +22,212 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
 PINECONE_NAMESPACE = os.getenv("PINECONE_NAMESPACE", "default")
-
-# Verify environment variables
-required_env_vars = {
-    "OPENAI_API_KEY": OPENAI_API_KEY,
-    "PINECONE_API_KEY": PINECONE_API_KEY,
-    "PINECONE_INDEX_NAME": PINECONE_INDEX_NAME
-}
-for var_name, var_value in required_env_vars.items():
-    if not var_value:
-        logger.error(f"Missing required environment variable: {var_name}")
-        raise ValueError(f"Missing required environment variable: {var_name}")
+PDF_FOLDER = os.getenv("PDF_FOLDER", "data")
+# The BM25 index for hybrid retrieval is per Pinecone index and namespace
+BM25_PATH = bm25_index_path(f"pinecone-{PINECONE_INDEX_NAME}-{PINECONE_NAMESPACE}")
 
 # Text splitter configuration
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=150
-)
-# Load and split PDFs
-pdf_folder = "data"
-all_documents = []
-
-try:
-    for filename in os.listdir(pdf_folder):
-        if filename.endswith(".pdf"):
-            path = os.path.join(pdf_folder, filename)
-            logger.info(f"📄 Processing: {filename}")
-            loader = PyPDFLoader(path)
-            docs = loader.load_and_split(text_splitter=text_splitter)
-            for doc in docs:
-                doc.metadata["source"] = filename
-            all_documents.extend(docs)
-except Exception as e:
-    logger.error(f"Error processing PDFs: {str(e)}")
-    raise
-
-logger.info(f"🧠 Total chunks: {len(all_documents)}")
-
-# Initialize Pinecone
-try:
-    pc = Pinecone(api_key=PINECONE_API_KEY)
-    logger.info("Pinecone initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize Pinecone: {str(e)}")
-    raise
-
-# Create index if it doesn't exist
-try:
-    if PINECONE_INDEX_NAME not in pc.list_indexes().names():
-        logger.info(f"🆕 Creating Pinecone index '{PINECONE_INDEX_NAME}'...")
-        pc.create_index(
-            name=PINECONE_INDEX_NAME,
-            dimension=1536,
-            metric="cosine",
-            spec=ServerlessSpec(cloud="aws", region="us-east-1")  # Adjust region if needed
-        )
-except Exception as e:
-    logger.error(f"Failed to create Pinecone index: {str(e)}")
-    raise
-
-# Push to Pinecone using LangChain in batches
-try:
-    logger.info("📤 Uploading embeddings to Pinecone...")
-    embedding = OpenAIEmbeddings(
-        api_key=OPENAI_API_KEY,
-        model="text-embedding-3-small"
-    )
-    
-    # Batch documents to avoid payload size limit
-    batch_size = 100
-    for i in range(0, len(all_documents), batch_size):
-        batch = all_documents[i:i + batch_size]
-        logger.info(f"Uploading batch {i//batch_size + 1} of {len(all_documents)//batch_size + 1} ({len(batch)} documents)")
-        vectorstore = PineconeVectorStore.from_documents(
-            documents=batch,
-            embedding=embedding,
-            index_name=PINECONE_INDEX_NAME,
-            namespace=PINECONE_NAMESPACE
-        )
-    logger.info("✅ Vector store created and uploaded to Pinecone.")
-except Exception as e:
-    logger.error(f"Failed to upload embeddings: {str(e)}")
-    raise
\ No newline at end of file
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+
+# Pinecone accepts at most 1000 ids per delete call
+DELETE_BATCH_SIZE = 1000
+
+
+async def delete_ids(index, ids):
+    for i in range(0, len(ids), DELETE_BATCH_SIZE):
+        await index.delete(ids=ids[i:i + DELETE_BATCH_SIZE], namespace=PINECONE_NAMESPACE)
+
+
+async def sync_index(embedding, index_host, manifest, pdf_folder, changed_files, removed_files, pdf_hashes,
+                     bm25=None, parent_store=None):
+    async with PineconeAsyncio(api_key=PINECONE_API_KEY) as pc:
+        async with pc.IndexAsyncio(host=index_host) as index:
+            for filename in removed_files:
+                stale_ids = sorted(manifest.chunk_ids(filename))
+                logger.info(f"🗑️ Removing {len(stale_ids)} chunks of deleted file {filename}")
+                await delete_ids(index, stale_ids)
+                manifest.remove_file(filename)
+                if parent_store is not None:
+                    parent_store.remove(filename)
+
+            # Chunks recorded for a file are already in the index, either from an
+            # earlier version or from batches of a run that crashed
+            uploaded_ids = {}
+            run_ids = {}
+            outstanding = Counter()
+            parsed_files = set()
+
+            async def complete(filename):
+                stale_ids = sorted(uploaded_ids.pop(filename) - run_ids[filename])
+                if stale_ids:
+                    logger.info(f"🗑️ Removing {len(stale_ids)} stale chunks of {filename}")
+                    await delete_ids(index, stale_ids)
+                if parent_store is not None:
+                    parent_store.commit(filename)
+                manifest.complete_file(filename, pdf_hashes[filename], run_ids.pop(filename))
+                logger.info(f"✅ {filename} synced")
+
+            async def on_uploaded(request):
+                for filename in {doc.metadata["source"] for _, doc in request}:
+                    ids = [doc_id for doc_id, doc in request if doc.metadata["source"] == filename]
+                    manifest.record_uploaded(filename, ids)
+                    outstanding[filename] -= len(ids)
+                    if filename in parsed_files and outstanding[filename] == 0:
+                        parsed_files.discard(filename)
+                        await complete(filename)
+
+            engine = PineconeUpsertEngine(embedding, index, PINECONE_NAMESPACE, on_uploaded=on_uploaded)
+            total_chunks = 0
+            chunks = iter_pdf_chunks(pdf_folder, changed_files, CHUNK_SIZE, CHUNK_OVERLAP, parent_store=parent_store)
+            try:
+                while True:
+                    # Parsing runs in worker processes; wait for it off the event loop
+                    item = await asyncio.to_thread(next, chunks, None)
+                    if item is None:
+                        break
+                    filename, docs, file_done = item
+                    if filename not in uploaded_ids:
+                        logger.info(f"📄 Processing: {filename}")
+                        uploaded_ids[filename] = manifest.chunk_ids(filename)
+                        run_ids[filename] = set()
+                    new_items = []
+                    for doc in docs:
+                        doc_id = chunk_id(doc)
+                        if doc_id not in run_ids[filename] and doc_id not in uploaded_ids[filename]:
+                            new_items.append((doc_id, doc))
+                        run_ids[filename].add(doc_id)
+                    total_chunks += len(docs)
+                    if bm25 is not None:
+                        bm25.add_documents((chunk_id(doc), doc) for doc in docs)
+                    outstanding[filename] += len(new_items)
+                    await engine.submit(new_items)
+
+                    if file_done:
+                        # Send the file's tail now rather than with the next file
+                        await engine.flush()
+                        if outstanding[filename] == 0:
+                            await complete(filename)
+                        else:
+                            parsed_files.add(filename)
+                await engine.drain()
+            finally:
+                # Closing shuts down the parser's worker processes and waits for them
+                await asyncio.to_thread(chunks.close)
+            return total_chunks, engine.chunks_uploaded, engine.throughput
+
+
+def main(pdf_folder=PDF_FOLDER, only_files=None):
+    """Syncs the indexes with the PDFs in ``pdf_folder``.
+
+    With ``only_files``, just those files are (re)ingested and nothing is
+    treated as removed; the crawler uses this for the PDFs it downloaded.
+    """
+    # Verify environment variables
+    required_env_vars = {
+        "OPENAI_API_KEY": OPENAI_API_KEY,
+        "PINECONE_API_KEY": PINECONE_API_KEY,
+        "PINECONE_INDEX_NAME": PINECONE_INDEX_NAME
+    }
+    for var_name, var_value in required_env_vars.items():
+        if not var_value:
+            logger.error(f"Missing required environment variable: {var_name}")
+            raise ValueError(f"Missing required environment variable: {var_name}")
+
+    # Work out which PDFs are new, changed or removed since the last run
+    manifest = IngestManifest()
+
+    try:
+        pdf_hashes = {
+            filename: file_sha256(os.path.join(pdf_folder, filename))
+            for filename in sorted(only_files if only_files is not None else os.listdir(pdf_folder))
+            if filename.endswith(".pdf")
+        }
+    except Exception as e:
+        logger.error(f"Error reading PDFs: {str(e)}")
+        raise
+
+    changed_files = [filename for filename, sha in pdf_hashes.items() if not manifest.is_current(filename, sha)]
+    removed_files = [] if only_files is not None else [
+        filename for filename in manifest.files if filename not in pdf_hashes]
+    logger.info(f"🧾 {len(changed_files)} new/changed, {len(removed_files)} removed, "
+                f"{len(pdf_hashes) - len(changed_files)} unchanged PDFs")
+
+    # The BM25 index for hybrid retrieval is kept next to the vector index.
+    # Files it is missing (e.g. on its first build) are re-parsed for it;
+    # their vectors are skipped as already uploaded
+    try:
+        bm25 = BM25Index.load(BM25_PATH) if os.path.exists(BM25_PATH) else BM25Index()
+    except Exception as e:
+        logger.error(f"Failed to load BM25 index, rebuilding it: {str(e)}")
+        bm25 = BM25Index()
+    bm25_sources = bm25.sources()
+    # Structured chunking also needs each file's parent sections
+    parent_store = ParentStore() if CHUNKING == "structured" else None
+    parent_sources = parent_store.sources() if parent_store is not None else bm25_sources
+    parse_files = [filename for filename in pdf_hashes
+                   if filename in changed_files or filename not in bm25_sources or filename not in parent_sources]
+    stale_sources = set(parse_files) | set(removed_files)
+    bm25.remove(lambda metadata: metadata.get("source") in stale_sources)
+
+    # Initialize Pinecone
+    try:
+        pc = Pinecone(api_key=PINECONE_API_KEY)
+        logger.info("Pinecone initialized successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize Pinecone: {str(e)}")
+        raise
+
+    # Create index if it doesn't exist
+    try:
+        # EMBEDDING_DIMENSIONS=256|512 stores shortened vectors; an existing
+        # index of another width needs a new PINECONE_INDEX_NAME
+        dimension = EMBEDDING_DIMENSIONS or FULL_EMBEDDING_DIMENSIONS
+        if PINECONE_INDEX_NAME not in pc.list_indexes().names():
+            logger.info(f"🆕 Creating Pinecone index '{PINECONE_INDEX_NAME}' ({dimension} dimensions)...")
+            pc.create_index(
+                name=PINECONE_INDEX_NAME,
+                dimension=dimension,
+                metric="cosine",
+                spec=ServerlessSpec(cloud="aws", region="us-east-1")  # Adjust region if needed
+            )
+        elif pc.describe_index(PINECONE_INDEX_NAME).dimension != dimension:
+            raise ValueError(f"Pinecone index '{PINECONE_INDEX_NAME}' does not hold {dimension}-dimensional vectors")
+    except Exception as e:
+        logger.error(f"Failed to create Pinecone index: {str(e)}")
+        raise
+
+    # Sync Pinecone with the manifest: upsert only new chunks, delete stale ones
+    try:
+        # Unchanged chunks are served from the embedding cache on re-runs.
+        # With EMBEDDING_DIMENSIONS set, the full vectors go to the rescoring sidecar
+        embedding = compact_embeddings(cached_embeddings(OpenAIEmbeddings(
+            api_key=OPENAI_API_KEY,
+            model="text-embedding-3-small"
+        )))
+        index_host = os.getenv("PINECONE_HOST") or pc.describe_index(PINECONE_INDEX_NAME).host
+        try:
+            total_chunks, uploaded_chunks, throughput = asyncio.run(sync_index(
+                embedding, index_host, manifest, pdf_folder, parse_files, removed_files, pdf_hashes, bm25,
+                parent_store
+            ))
+        finally:
+            # Full vectors of whatever was uploaded, even if the run failed part way
+            if isinstance(embedding, CompactEmbeddings):
+                embedding.store.save()
+        logger.info(f"⚡ Upload throughput: {throughput:.1f} chunks/sec")
+        logger.info(f"🧠 {total_chunks} chunks parsed, {uploaded_chunks} uploaded")
+        if parse_files or removed_files:
+            bm25.save(BM25_PATH)
+            logger.info(f"🔎 BM25 index saved ({len(bm25)} chunks)")
+        if changed_files or removed_files:
+            # Cached answers were built from the old index
+            bump_index_version()
+        logger.info("✅ Pinecone index is up to date.")
+    except Exception as e:
+        logger.error(f"Failed to upload embeddings: {str(e)}")
+        raise
+
+
+if __name__ == "__main__":
+    main()
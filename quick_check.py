@@ -1,9 +1,29 @@
+import argparse
+import asyncio
+import json
 import os
+import sys
+import time
+import numpy as np
 from dotenv import load_dotenv
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain.chains import RetrievalQA
 from langchain_pinecone import PineconeVectorStore
 from pinecone import Pinecone
+from answer_cache import QueryEmbeddingMemo
+from compact_vectors import compact_embeddings, rescoring
+from embedding_cache import cached_embeddings
+
+# One question from input(), or a regression set in batch mode:
+#
+#   python quick_check.py --batch questions.txt --out answers.jsonl
+#   cat questions.txt | python quick_check.py --batch - --concurrency 16
+#
+# Batch mode builds the clients and chain once, embeds every question in one
+# batched request, then runs retrieval and completion for up to
+# QUICK_CHECK_CONCURRENCY questions at a time. Each answer is written as a
+# JSONL line when it is done, with its sources and timings. Questions are
+# plain lines or JSONL with a "question" field (bench_questions.jsonl works).
 
 # Load environment variables
 load_dotenv()
@@ -19,6 +39,7 @@ for var_name, var_value in required_env_vars.items():
         raise ValueError(f"Missing required environment variable: {var_name}")
 
 PINECONE_NAMESPACE = os.getenv("PINECONE_NAMESPACE", "default")
+QUICK_CHECK_CONCURRENCY = int(os.getenv("QUICK_CHECK_CONCURRENCY", "8"))
 
 # Initialize Pinecone
 try:
@@ -30,14 +51,15 @@ except Exception as e:
 
 # Initialize embedding and vector store
 try:
-    embedding = OpenAIEmbeddings(
+    # Batch mode primes the memo with the batched question vectors
+    embedding = QueryEmbeddingMemo(cached_embeddings(OpenAIEmbeddings(
         api_key=required_env_vars["OPENAI_API_KEY"],
         model="text-embedding-3-small"
-    )
+    )))
     
     vectorstore = PineconeVectorStore(
         index_name=required_env_vars["PINECONE_INDEX_NAME"],
-        embedding=embedding,
+        embedding=compact_embeddings(embedding),
         namespace=PINECONE_NAMESPACE,
         pinecone_api_key=required_env_vars["PINECONE_API_KEY"]
     )
@@ -46,7 +68,7 @@ except Exception as e:
 
 # Create retriever and QA chain
 try:
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
+    retriever = rescoring(vectorstore).as_retriever(search_kwargs={"k": 3})
     llm = ChatOpenAI(
         api_key=required_env_vars["OPENAI_API_KEY"],
         model="gpt-4o-mini",
@@ -61,6 +83,71 @@ try:
 except Exception as e:
     raise Exception(f"Failed to initialize QA chain: {str(e)}")
 
+def read_questions(path):
+    f = sys.stdin if path == "-" else open(path)
+    try:
+        questions = []
+        for line in f:
+            line = line.strip()
+            if line.startswith("{"):
+                line = json.loads(line)["question"].strip()
+            if line:
+                questions.append(line)
+        return questions
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+async def answer_one(index, question, limit):
+    queued = time.perf_counter()
+    async with limit:
+        start = time.perf_counter()
+        record = {"index": index, "question": question}
+        try:
+            # The same retrieval and "stuff" completion that qa.invoke runs, timed separately
+            sources = await retriever.ainvoke(question)
+            retrieved = time.perf_counter()
+            result = await qa.combine_documents_chain.ainvoke({"input_documents": sources, "question": question})
+            record.update(answer=result["output_text"], sources=[
+                {"source": doc.metadata.get("source", "Unknown source"), "page": doc.metadata.get("page")}
+                for doc in sources
+            ], error=None)
+            timings = {"retrieve_ms": (retrieved - start) * 1000, "answer_ms": (time.perf_counter() - retrieved) * 1000}
+        except Exception as e:
+            record.update(answer=None, sources=[], error=str(e))
+            timings = {}
+        timings.update(queue_ms=(start - queued) * 1000, total_ms=(time.perf_counter() - start) * 1000)
+        record["timings"] = {name: round(value, 1) for name, value in timings.items()}
+        return record
+
+
+async def run_batch(questions, out, concurrency=QUICK_CHECK_CONCURRENCY):
+    start = time.perf_counter()
+    # One embedding request for the whole set; the retriever then finds each
+    # vector in the memo instead of embedding the question again
+    embedding.max_entries = max(embedding.max_entries, len(questions))
+    embedding.prime(questions, await embedding.embeddings.aembed_documents(questions))
+    embed_seconds = time.perf_counter() - start
+    print(f"🧮 Embedded {len(questions)} questions in {embed_seconds:.2f}s", file=sys.stderr)
+
+    limit = asyncio.Semaphore(concurrency)
+    totals, errors = [], 0
+    async with vectorstore:
+        tasks = [asyncio.ensure_future(answer_one(i, question, limit)) for i, question in enumerate(questions)]
+        for done in asyncio.as_completed(tasks):
+            record = await done
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            totals.append(record["timings"]["total_ms"])
+            errors += record["error"] is not None
+    elapsed = time.perf_counter() - start
+    print(f"✅ {len(questions)} questions ({errors} failed) in {elapsed:.1f}s, "
+          f"{len(questions) / elapsed:.1f} questions/s; per question p50 {np.percentile(totals, 50):.0f} ms, "
+          f"p95 {np.percentile(totals, 95):.0f} ms", file=sys.stderr)
+    return errors
+
+
 # Ask a question
 def main():
     try:
@@ -85,4 +172,21 @@ def main():
         print(f"Error processing question: {str(e)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ask one question, or answer a file of them with --batch")
+    parser.add_argument("--batch", metavar="PATH", help="Questions file, one per line or JSONL; - for stdin")
+    parser.add_argument("--out", default="-", help="JSONL output file (default stdout)")
+    parser.add_argument("--concurrency", type=int, default=QUICK_CHECK_CONCURRENCY)
+    args = parser.parse_args()
+    if args.batch is None:
+        main()
+    else:
+        questions = read_questions(args.batch)
+        if not questions:
+            raise SystemExit("No questions to answer.")
+        out = sys.stdout if args.out == "-" else open(args.out, "w")
+        try:
+            failed = asyncio.run(run_batch(questions, out, args.concurrency))
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        sys.exit(1 if failed else 0)
\ No newline at end of file
@@ -0,0 +1,86 @@
+import json
+
+# Shared helpers for the FastAPI apps (main.py and local_main.py)
+
+FALLBACK_PHRASES = [
+    "I don't know", "I'm not sure", "I cannot answer that",
+    "Sorry, I don't know", "I do not have enough information"
+]
+FALLBACK_MESSAGE = "I have no idea about this thing. I am trained on very limited data, that is why I can't answer that question."
+
+# Tag carried by the LLM that writes the final answer, so its tokens can be
+# told apart from the question-condensing LLM in the event stream
+ANSWER_TAG = "rag_answer"
+
+
+def is_fallback(answer):
+    return any(phrase.lower() in answer.lower() for phrase in FALLBACK_PHRASES)
+
+
+class FallbackFilter:
+    """Applies the fallback-phrase check to a token stream.
+
+    The last ``len(longest phrase) - 1`` characters are held back, so a phrase
+    split across tokens is caught before any part of it reaches the client.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.emitted = 0
+        self.tripped = False
+        self._holdback = max(len(phrase) for phrase in FALLBACK_PHRASES) - 1
+
+    def feed(self, token):
+        # Returns the text that is safe to forward, or None once tripped
+        if self.tripped:
+            return None
+        self.text += token
+        if is_fallback(self.text):
+            self.tripped = True
+            return None
+        safe_until = max(self.emitted, len(self.text) - self._holdback)
+        chunk = self.text[self.emitted:safe_until]
+        self.emitted = safe_until
+        return chunk
+
+    def flush(self):
+        if self.tripped:
+            return None
+        chunk = self.text[self.emitted:]
+        self.emitted = len(self.text)
+        return chunk
+
+    @property
+    def answer(self):
+        return FALLBACK_MESSAGE if self.tripped else self.text
+
+
+def sse_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+async def stream_chain_answer(chain, inputs, config=None):
+    """Yields ``token``/``replace``/``done`` events for one chain run.
+
+    ``replace`` tells the client to swap what it has rendered so far for the
+    fallback message.
+    """
+    fallback = FallbackFilter()
+    events = chain.astream_events(inputs, config, version="v2")
+    try:
+        async for event in events:
+            if event["event"] != "on_chat_model_stream" or ANSWER_TAG not in event.get("tags", []):
+                continue
+            chunk = fallback.feed(event["data"]["chunk"].content)
+            if fallback.tripped:
+                # No point paying for the rest of an answer we won't show
+                yield {"type": "replace", "text": FALLBACK_MESSAGE}
+                break
+            if chunk:
+                yield {"type": "token", "text": chunk}
+    finally:
+        await events.aclose()
+    tail = fallback.flush()
+    if tail:
+        yield {"type": "token", "text": tail}
+    yield {"type": "done", "answer": fallback.answer}
@@ -0,0 +1,70 @@
+import argparse
+import os
+
+import uvicorn
+
+# Production launcher: runs N uvicorn worker processes on one port.
+# Each worker builds its own clients and connection pools after it starts
+# (nothing is shared across the fork), while conversation memory and cached
+# answers move to a backend every worker can see, so a follow-up question
+# may land on any worker. On SIGTERM/SIGINT workers stop accepting
+# connections and finish in-flight requests for up to --graceful-timeout
+# seconds before exiting.
+#
+#   python serve.py --app main --workers 4 --port 8000
+#   SESSION_BACKEND=redis ANSWER_CACHE_BACKEND=redis REDIS_URL=redis://cache:6379/0 python serve.py
+
+# What in-process state becomes when there is more than one worker
+SHARED_BACKENDS = {"SESSION_BACKEND": "sqlite", "ANSWER_CACHE_BACKEND": "sqlite"}
+
+
+def shared_state_env(workers, env):
+    """Backend overrides so every worker sees the same sessions and answers.
+
+    Explicit settings are kept, except "memory", which can't be shared.
+    """
+    if workers <= 1:
+        return {}
+    return {name: backend for name, backend in SHARED_BACKENDS.items() if env.get(name, "memory") == "memory"}
+
+
+def pool_env(workers, max_connections):
+    # Split a total upstream connection budget between the workers
+    if not max_connections:
+        return {}
+    return {"OPENAI_MAX_CONNECTIONS": str(max(1, max_connections // workers))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the RAG API with several worker processes")
+    parser.add_argument("--app", default="main", help="Module exposing the FastAPI app")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+                        help="Worker processes; defaults to one per core")
+    parser.add_argument("--graceful-timeout", type=float, default=30,
+                        help="Seconds to let in-flight requests finish on shutdown")
+    parser.add_argument("--max-connections", type=int, default=0,
+                        help="Total OpenAI connections across all workers (0 leaves the per-worker default)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    # Workers are spawned from this process and inherit its environment
+    overrides = {**shared_state_env(args.workers, os.environ), **pool_env(args.workers, args.max_connections)}
+    os.environ.update(overrides)
+    for name, value in overrides.items():
+        print(f"⚙️ {name}={value}")
+    print(f"🚀 Starting {args.workers} worker(s) of {args.app}:app on {args.host}:{args.port}")
+
+    uvicorn.run(
+        f"{args.app}:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Per-session conversation memory with a bounded footprint.
+# Each session keeps only the most recent turns that fit its token budget,
+# idle sessions expire after a TTL, and the total number of sessions is
+# capped (least recently used sessions are dropped first).
+# SESSION_BACKEND picks where sessions live: in this process (memory), or
+# shared by every worker on the host (sqlite) or across hosts (redis).
+# The shared stores block on file locks and network round-trips, so the
+# async apps call their aget_history/aappend, which run them in a thread.
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # memory | sqlite | redis
+SESSION_PATH = os.getenv("SESSION_PATH", "sessions.sqlite3")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SESSION_MAX_TOKENS = int(os.getenv("SESSION_MAX_TOKENS", "1000"))
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "6"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+
+# Shared stores run the expiry/size sweep every this many appends
+_EVICT_EVERY = 64
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text; close enough for budgeting
+    # and avoids a tokenizer pass on the hot path
+    return len(text) // 4 + 1
+
+
+def trim_turns(turns, max_tokens=SESSION_MAX_TOKENS, max_turns=SESSION_MAX_TURNS):
+    """Returns the most recent (question, answer) turns that fit the budget."""
+    kept = []
+    used = 0
+    for question, answer in reversed(turns[-max_turns:] if max_turns else []):
+        cost = estimate_tokens(question) + estimate_tokens(answer)
+        if used + cost > max_tokens:
+            break
+        kept.append((question, answer))
+        used += cost
+    kept.reverse()
+    return kept
+
+
+class _BlockingStore:
+    # Async entry points for stores whose calls block: run them off the event loop
+    async def aget_history(self, session_id):
+        return await asyncio.to_thread(self.get_history, session_id)
+
+    async def aappend(self, session_id, question, answer):
+        await asyncio.to_thread(self.append, session_id, question, answer)
+
+
+class SessionStore:
+    def __init__(self, max_tokens=SESSION_MAX_TOKENS, max_turns=SESSION_MAX_TURNS,
+                 ttl_seconds=SESSION_TTL_SECONDS, max_sessions=SESSION_MAX_SESSIONS):
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session_id -> (last_seen, turns)
+        self._lock = threading.Lock()
+
+    def get_history(self, session_id):
+        if not session_id:
+            return []
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            last_seen, turns = entry
+            if time.monotonic() - last_seen > self.ttl_seconds:
+                del self._sessions[session_id]
+                return []
+            return list(turns)
+
+    def append(self, session_id, question, answer):
+        if not session_id:
+            return
+        now = time.monotonic()
+        with self._lock:
+            _, turns = self._sessions.pop(session_id, (now, []))
+            turns = trim_turns(turns + [(question, answer)], self.max_tokens, self.max_turns)
+            self._sessions[session_id] = (now, turns)
+            self._evict(now)
+
+    # In memory and O(turns): cheaper to run on the event loop than to hand off
+    async def aget_history(self, session_id):
+        return self.get_history(session_id)
+
+    async def aappend(self, session_id, question, answer):
+        self.append(session_id, question, answer)
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict(self, now):
+        # Sessions are kept in last-used order, so expired and overflow
+        # entries are always at the front
+        while self._sessions:
+            session_id, (last_seen, _) = next(iter(self._sessions.items()))
+            if now - last_seen <= self.ttl_seconds and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def close(self):
+        pass
+
+
+def _encode_turns(turns):
+    return json.dumps(turns)
+
+
+def _decode_turns(text):
+    return [tuple(turn) for turn in json.loads(text)]
+
+
+class SQLiteSessionStore(_BlockingStore):
+    """Sessions in a SQLite file, shared by every worker process on the host.
+
+    Same interface as SessionStore. Timestamps are wall-clock, since
+    monotonic clocks aren't comparable between processes.
+    """
+
+    def __init__(self, path=SESSION_PATH, max_tokens=SESSION_MAX_TOKENS, max_turns=SESSION_MAX_TURNS,
+                 ttl_seconds=SESSION_TTL_SECONDS, max_sessions=SESSION_MAX_SESSIONS):
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, turns TEXT NOT NULL, last_seen REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)")
+        self._lock = threading.Lock()
+        self._appends = 0
+
+    def get_history(self, session_id):
+        if not session_id:
+            return []
+        with self._lock:
+            row = self._conn.execute("SELECT turns, last_seen FROM sessions WHERE session_id = ?",
+                                     (session_id,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return []
+        return _decode_turns(row[0])
+
+    def append(self, session_id, question, answer):
+        if not session_id:
+            return
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two workers appending
+            # to the same session can't both read the old turns
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT turns, last_seen FROM sessions WHERE session_id = ?",
+                                         (session_id,)).fetchone()
+                turns = _decode_turns(row[0]) if row and now - row[1] <= self.ttl_seconds else []
+                turns = trim_turns(turns + [(question, answer)], self.max_tokens, self.max_turns)
+                self._conn.execute("INSERT OR REPLACE INTO sessions (session_id, turns, last_seen) VALUES (?, ?, ?)",
+                                   (session_id, _encode_turns(turns), now))
+                self._appends += 1
+                if self._appends % _EVICT_EVERY == 0:
+                    self._evict(now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def clear(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM sessions WHERE last_seen < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM sessions WHERE session_id IN "
+            "(SELECT session_id FROM sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,),
+        )
+
+
+class RedisSessionStore(_BlockingStore):
+    """Sessions in Redis (or anything speaking its protocol), shared across hosts.
+
+    Each session is one key that expires after the TTL; the session cap is
+    left to the server's maxmemory policy.
+    """
+
+    def __init__(self, url=REDIS_URL, max_tokens=SESSION_MAX_TOKENS, max_turns=SESSION_MAX_TURNS,
+                 ttl_seconds=SESSION_TTL_SECONDS, prefix="rag:session:"):
+        import redis
+
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+        self._watch_error = redis.WatchError
+
+    def get_history(self, session_id):
+        if not session_id:
+            return []
+        value = self._redis.get(self.prefix + session_id)
+        return _decode_turns(value) if value else []
+
+    def append(self, session_id, question, answer):
+        if not session_id:
+            return
+        key = self.prefix + session_id
+        ttl = max(1, int(self.ttl_seconds))
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    # Optimistic check-and-set: retried if another worker wrote the session meanwhile
+                    pipe.watch(key)
+                    value = pipe.get(key)
+                    turns = _decode_turns(value) if value else []
+                    turns = trim_turns(turns + [(question, answer)], self.max_tokens, self.max_turns)
+                    pipe.multi()
+                    pipe.set(key, _encode_turns(turns), ex=ttl)
+                    pipe.execute()
+                    return
+                except self._watch_error:
+                    continue
+
+    def clear(self, session_id):
+        self._redis.delete(self.prefix + session_id)
+
+    def __len__(self):
+        return sum(1 for _ in self._redis.scan_iter(match=self.prefix + "*", count=1000))
+
+    def close(self):
+        self._redis.close()
+
+
+def build_session_store():
+    if SESSION_BACKEND == "sqlite":
+        return SQLiteSessionStore()
+    if SESSION_BACKEND == "redis":
+        return RedisSessionStore()
+    return SessionStore()
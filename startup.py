@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+# Lazy startup for the apps. Importing an app module only defines routes;
+# the OpenAI/Pinecone clients, the vector store and the chain are built by
+# LazyResource on first use. STARTUP_MODE picks when that happens:
+#   background  warm up in a background task as soon as the server starts
+#   eager       finish warming up before the server accepts requests
+#   lazy        build on the first request that needs it
+# Run `python startup.py main` for an import-time profile of a module.
+
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background")  # background | eager | lazy
+
+logger = logging.getLogger(__name__)
+
+
+class LazyResource:
+    """A value built on first use, exactly once, from any thread or task.
+
+    A failed build is not cached; the next caller tries again.
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.seconds = None
+        self.error = None
+        self._value = None
+        self._built = False
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._built
+
+    def get(self):
+        if self._built:
+            return self._value
+        with self._lock:
+            if not self._built:
+                start = time.perf_counter()
+                try:
+                    self._value = self.factory()
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                self.seconds = time.perf_counter() - start
+                self.error = None
+                self._built = True
+        return self._value
+
+    async def aget(self):
+        # The build imports modules and may do network I/O; keep it off the loop
+        if self._built:
+            return self._value
+        return await asyncio.to_thread(self.get)
+
+    def status(self):
+        return {"ready": self._built, "seconds": self.seconds, "error": self.error}
+
+
+class WarmUp:
+    """Runs an app's async warm-up coroutine once, shared by every caller.
+
+    ``wait()`` starts it if needed and waits for it; a failed warm-up is
+    retried by the next ``wait()``.
+    """
+
+    def __init__(self, warm_up):
+        self.warm_up = warm_up
+        self.seconds = None
+        self.error = None
+        self._task = None
+
+    @property
+    def done(self):
+        return self._task is not None and self._task.done() and not self._task.cancelled() \
+            and self._task.exception() is None
+
+    def start(self):
+        if self._task is None or (self._task.done() and not self.done):
+            self._task = asyncio.ensure_future(self._run())
+        return self._task
+
+    async def _run(self):
+        start = time.perf_counter()
+        try:
+            await self.warm_up()
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"Warm-up failed: {str(e)}")
+            raise
+        self.seconds = time.perf_counter() - start
+        self.error = None
+        logger.info(f"Warm-up complete in {self.seconds:.2f}s")
+
+    async def wait(self):
+        # Shielded, so a client disconnecting doesn't cancel everyone's warm-up
+        await asyncio.shield(self.start())
+
+    async def on_startup(self, mode=STARTUP_MODE):
+        if mode == "eager":
+            await self.wait()
+        elif mode == "background":
+            self.start()
+
+    async def on_shutdown(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
+def readiness(warm_up, *resources):
+    """Payload and status code for a readiness endpoint."""
+    ready = warm_up.done and all(resource.ready for resource in resources)
+    return {
+        "ready": ready,
+        "mode": STARTUP_MODE,
+        "warmup_seconds": warm_up.seconds,
+        "warmup_error": warm_up.error,
+        "components": {resource.name: resource.status() for resource in resources},
+    }, 200 if ready else 503
+
+
+# Import-time profile
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def import_profile(module, python=sys.executable, env=None):
+    """Imports ``module`` in a fresh interpreter under ``-X importtime``.
+
+    Returns the wall time and, per imported module, its self and cumulative
+    microseconds and nesting depth, in import order.
+    """
+    start = time.perf_counter()
+    result = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, env=env)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append({"module": name, "self_us": int(self_us), "cumulative_us": int(cumulative_us),
+                         "depth": len(indent) // 2})
+    return wall, rows
+
+
+def _top_level_package(name):
+    return name.split(".")[0]
+
+
+def summarize_profile(module, wall, rows, top=15):
+    target = next((row for row in rows if row["module"] == module and row["depth"] == 0), None)
+    # What each third-party/top-level package costs in total, wherever it was first imported
+    packages = {}
+    for row in rows:
+        package = _top_level_package(row["module"])
+        packages[package] = packages.get(package, 0) + row["self_us"]
+    # The direct imports of the module: what to make lazy
+    direct = []
+    if target is not None:
+        index = rows.index(target)
+        # -X importtime lists children before their parent
+        for row in reversed(rows[:index]):
+            if row["depth"] == 0:
+                break
+            if row["depth"] == 1:
+                direct.append(row)
+    return {
+        "module": module,
+        "wall_s": wall,
+        "import_s": (target["cumulative_us"] if target else sum(r["self_us"] for r in rows)) / 1e6,
+        "module_body_s": (target["self_us"] / 1e6) if target else None,
+        "packages": sorted(([name, us / 1e6] for name, us in packages.items()), key=lambda item: -item[1])[:top],
+        "direct_imports": sorted(([row["module"], row["cumulative_us"] / 1e6] for row in direct),
+                                 key=lambda item: -item[1])[:top],
+    }
+
+
+def print_profile(summary):
+    print(f"⏱️ import {summary['module']}: {summary['import_s']:.2f}s of imports, "
+          f"{summary['wall_s']:.2f}s wall including interpreter start")
+    if summary["module_body_s"] is not None:
+        print(f"   module body itself: {summary['module_body_s']:.3f}s")
+    print("\nDirect imports (cumulative):")
+    for name, seconds in summary["direct_imports"]:
+        print(f"  {seconds:>7.3f}s  {name}")
+    print("\nPackages (self time, all imports):")
+    for name, seconds in summary["packages"]:
+        print(f"  {seconds:>7.3f}s  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time profile of an app module")
+    parser.add_argument("modules", nargs="+", help="Modules to import, e.g. main local_main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", help="Also write the summaries here, to track cold starts over time")
+    args = parser.parse_args()
+
+    summaries = []
+    for module in args.modules:
+        wall, rows = import_profile(module)
+        summary = summarize_profile(module, wall, rows, args.top)
+        print_profile(summary)
+        print()
+        summaries.append(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summaries, f, indent=2)
+        print(f"📝 Profile written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
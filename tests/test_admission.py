@@ -0,0 +1,145 @@
+import asyncio
+import unittest
+
+from admission import AdmissionController, Coalescer, Overloaded, coalesce_key
+
+
+class AdmissionControllerTest(unittest.TestCase):
+    def test_admits_up_to_max_concurrency_then_queues(self):
+        async def run():
+            controller = AdmissionController(max_concurrency=2, max_queue=4, queue_timeout=5, enabled=True)
+            first = await controller.acquire()
+            await controller.acquire()
+            waiter = asyncio.ensure_future(controller.acquire())
+            await asyncio.sleep(0)
+            self.assertEqual(controller.stats()["queued"], 1)
+            self.assertFalse(waiter.done())
+            first.release()
+            await asyncio.wait_for(waiter, 1)
+            return controller.stats()
+
+        stats = asyncio.run(run())
+        self.assertEqual((stats["running"], stats["queued"]), (2, 0))
+
+    def test_full_queue_is_rejected_with_429(self):
+        async def run():
+            controller = AdmissionController(max_concurrency=1, max_queue=0, queue_timeout=5, enabled=True)
+            await controller.acquire()
+            await controller.acquire()
+
+        with self.assertRaises(Overloaded) as raised:
+            asyncio.run(run())
+        self.assertEqual(raised.exception.status_code, 429)
+        self.assertIn("Retry-After", raised.exception.headers())
+
+    def test_queue_deadline_is_rejected_with_503(self):
+        async def run():
+            controller = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=0.05, enabled=True)
+            await controller.acquire()
+            try:
+                await controller.acquire()
+            finally:
+                self.assertEqual(controller.stats()["queued"], 0)
+
+        with self.assertRaises(Overloaded) as raised:
+            asyncio.run(run())
+        self.assertEqual(raised.exception.status_code, 503)
+
+    def test_slots_are_handed_over_in_arrival_order(self):
+        async def run():
+            controller = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=5, enabled=True)
+            order = []
+
+            async def worker(name):
+                async with controller.slot():
+                    order.append(name)
+                    await asyncio.sleep(0.01)
+
+            await asyncio.gather(*(worker(name) for name in "abcd"))
+            return order, controller.stats()
+
+        order, stats = asyncio.run(run())
+        self.assertEqual(order, list("abcd"))
+        self.assertEqual(stats["running"], 0)
+        self.assertIsNotNone(stats["service_seconds"])
+
+    def test_release_is_idempotent(self):
+        async def run():
+            controller = AdmissionController(max_concurrency=1, enabled=True)
+            permit = await controller.acquire()
+            permit.release()
+            permit.release()
+            return controller.stats()["running"]
+
+        self.assertEqual(asyncio.run(run()), 0)
+
+    def test_disabled_controller_never_rejects(self):
+        async def run():
+            controller = AdmissionController(max_concurrency=1, max_queue=0, enabled=False)
+            for _ in range(5):
+                await controller.acquire()
+
+        asyncio.run(run())
+
+
+class CoalescerTest(unittest.TestCase):
+    def test_concurrent_callers_share_one_run(self):
+        async def run():
+            coalescer = Coalescer()
+            calls = []
+
+            async def answer():
+                calls.append(1)
+                await asyncio.sleep(0.01)
+                return "answer"
+
+            results = await asyncio.gather(*(coalescer.run(coalesce_key(question), answer)
+                                             for question in ["What is RS-1?", "what is  rs-1?"]))
+            return results, len(calls), len(coalescer)
+
+        self.assertEqual(asyncio.run(run()), (["answer", "answer"], 1, 0))
+
+    def test_late_stream_joiner_gets_every_event(self):
+        async def run():
+            coalescer = Coalescer()
+            calls = []
+
+            async def events():
+                calls.append(1)
+                for i in range(3):
+                    yield i
+                    await asyncio.sleep(0.01)
+
+            async def collect(delay):
+                await asyncio.sleep(delay)
+                return [event async for event in coalescer.stream("q", events)]
+
+            results = await asyncio.gather(collect(0), collect(0.015))
+            return results, len(calls), coalescer.streaming("q")
+
+        self.assertEqual(asyncio.run(run()), ([[0, 1, 2], [0, 1, 2]], 1, False))
+
+    def test_stream_error_reaches_every_follower(self):
+        async def run():
+            coalescer = Coalescer()
+
+            async def events():
+                yield "token"
+                raise RuntimeError("upstream down")
+
+            async def collect():
+                seen = []
+                try:
+                    async for event in coalescer.stream("q", events):
+                        seen.append(event)
+                except RuntimeError as e:
+                    seen.append(str(e))
+                return seen
+
+            return await asyncio.gather(collect(), collect())
+
+        self.assertEqual(asyncio.run(run()), [["token", "upstream down"]] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import answer_cache
+from answer_cache import AnswerCache, MemoryCacheBackend, SQLiteCacheBackend, bump_index_version
+
+
+class AnswerCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.stamp = os.path.join(self.tmp.name, ".index_version")
+        self.cache = AnswerCache(MemoryCacheBackend(), similarity_threshold=0.9, index_stamp_path=self.stamp)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_exact_hit_ignores_case_and_punctuation(self):
+        self.cache.store("What is RS-1?", "A zone.")
+        self.assertEqual(self.cache.lookup_exact("  what is rs-1 "), "A zone.")
+
+    def test_semantic_hit_above_threshold_only(self):
+        self.cache.store("What is RS-1?", "A zone.", [1.0, 0.0])
+        self.assertIsNone(self.cache.lookup_exact("Tell me about RS-1"))
+        self.assertEqual(self.cache.lookup_semantic([0.99, 0.05]), "A zone.")
+        self.assertIsNone(self.cache.lookup_semantic([0.5, 0.5]))
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_bumping_index_version_clears_cache(self):
+        self.cache.store("What is RS-1?", "A zone.", [1.0, 0.0])
+        bump_index_version(self.stamp)
+        self.assertIsNone(self.cache.lookup_exact("What is RS-1?"))
+        self.assertIsNone(self.cache.lookup_semantic([1.0, 0.0]))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_unchanged_index_version_keeps_cache(self):
+        bump_index_version(self.stamp)
+        cache = AnswerCache(MemoryCacheBackend(), index_stamp_path=self.stamp)
+        cache.store("What is RS-1?", "A zone.")
+        self.assertEqual(cache.lookup_exact("What is RS-1?"), "A zone.")
+
+    def test_async_entry_points(self):
+        async def run():
+            await self.cache.astore("What is RS-1?", "A zone.", [1.0, 0.0])
+            return await self.cache.alookup_exact("what is rs-1"), await self.cache.alookup_semantic([1.0, 0.0])
+
+        self.assertEqual(asyncio.run(run()), ("A zone.", "A zone."))
+
+    def test_stamp_read_only_when_file_changes(self):
+        bump_index_version(self.stamp)
+        cache = AnswerCache(MemoryCacheBackend(), index_stamp_path=self.stamp)
+        with mock.patch.object(answer_cache, "read_index_version", wraps=answer_cache.read_index_version) as read:
+            cache.lookup_exact("What is RS-1?")
+            cache.lookup_exact("What is RS-1?")
+            self.assertEqual(read.call_count, 0)
+            os.utime(self.stamp, ns=(0, 0))
+            cache.lookup_exact("What is RS-1?")
+            self.assertEqual(read.call_count, 1)
+
+    def test_memory_backend_async_lookups_skip_the_lock(self):
+        self.cache.store("What is RS-1?", "A zone.", [1.0, 0.0])
+
+        async def run():
+            return await self.cache.alookup_exact("What is RS-1?"), await self.cache.alookup_semantic([1.0, 0.0])
+
+        # A thread holding the lock must not stall the event loop
+        with self.cache._lock:
+            self.assertEqual(asyncio.run(run()), ("A zone.", "A zone."))
+
+
+class SQLiteAnswerCacheTest(unittest.TestCase):
+    def test_bumping_index_version_clears_shared_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            stamp = os.path.join(tmp, ".index_version")
+            cache = AnswerCache(SQLiteCacheBackend(os.path.join(tmp, "answers.sqlite3")), index_stamp_path=stamp)
+            try:
+                cache.store("What is RS-1?", "A zone.")
+                self.assertEqual(cache.lookup_exact("What is RS-1?"), "A zone.")
+                bump_index_version(stamp)
+                self.assertIsNone(cache.lookup_exact("What is RS-1?"))
+            finally:
+                cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
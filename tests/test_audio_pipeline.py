@@ -0,0 +1,122 @@
+import asyncio
+import io
+import threading
+import unittest
+import wave
+from types import SimpleNamespace
+
+import numpy as np
+
+from audio_pipeline import AudioTooLarge, AudioTranscriber, SilenceSegmenter, WavStreamDecoder, filename_for, wav_bytes
+
+RATE = 8000
+
+
+def tone(seconds, amplitude=8000):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * RATE), dtype=np.int16)
+
+
+def stereo_wav(left, right):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(2)
+        out.setsampwidth(2)
+        out.setframerate(RATE)
+        out.writeframes(np.column_stack([left, right]).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+class FakeTranscriptions:
+    """Sync client stand-in: the "text" of a segment is its length in seconds."""
+
+    def __init__(self):
+        self.files = []
+        self.lock = threading.Lock()
+
+    def create(self, model, file):
+        name, data = file if isinstance(file, tuple) else (file.name, file.read())
+        with self.lock:
+            self.files.append(name)
+        with wave.open(io.BytesIO(data)) as wav:
+            return SimpleNamespace(text=f"{wav.getnframes() / wav.getframerate():.0f}s")
+
+
+async def chunked(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+class WavStreamDecoderTest(unittest.TestCase):
+    def test_any_chunking_gives_the_same_samples(self):
+        samples = tone(0.5)
+        data = wav_bytes(samples, RATE)
+        for size in (1, 7, 44, 1000, len(data)):
+            decoder = WavStreamDecoder()
+            decoded = np.concatenate([decoder.feed(data[i:i + size]) for i in range(0, len(data), size)])
+            np.testing.assert_array_equal(decoded, samples)
+            self.assertEqual(decoder.sample_rate, RATE)
+
+    def test_stereo_is_mixed_down(self):
+        decoder = WavStreamDecoder()
+        left = np.full(100, 1000, dtype=np.int16)
+        decoded = decoder.feed(stereo_wav(left, np.full(100, 3000, dtype=np.int16)))
+        np.testing.assert_array_equal(decoded, np.full(100, 2000, dtype=np.int16))
+
+    def test_rejects_other_formats(self):
+        with self.assertRaises(ValueError):
+            WavStreamDecoder().feed(b"RIFF\0\0\0\0AVI LIST")
+
+
+class SilenceSegmenterTest(unittest.TestCase):
+    def test_cuts_at_pause_and_drops_silence(self):
+        segmenter = SilenceSegmenter(RATE, min_seconds=1, max_seconds=5, min_silence=0.3)
+        audio = np.concatenate([tone(2), silence(1), tone(1.5), silence(2)])
+        segments = segmenter.feed(audio) + segmenter.finish()
+        self.assertEqual(len(segments), 2)
+        # Cut inside the pause
+        self.assertTrue(2.0 <= len(segments[0]) / RATE <= 3.0)
+
+    def test_long_speech_is_cut_at_max_seconds(self):
+        segmenter = SilenceSegmenter(RATE, min_seconds=1, max_seconds=3, min_silence=0.3)
+        segments = segmenter.feed(tone(7)) + segmenter.finish()
+        self.assertTrue(all(len(segment) <= 3 * RATE for segment in segments))
+        self.assertEqual(sum(len(segment) for segment in segments), 7 * RATE)
+
+
+class AudioTranscriberTest(unittest.TestCase):
+    def setUp(self):
+        self.transcriptions = FakeTranscriptions()
+        self.client = SimpleNamespace(audio=SimpleNamespace(transcriptions=self.transcriptions))
+
+    def test_wav_is_split_and_stitched_in_order(self):
+        transcriber = AudioTranscriber(self.client, concurrency=2)
+        audio = np.concatenate([tone(12), silence(1), tone(3), silence(1), tone(11)])
+        data = wav_bytes(audio, RATE)
+        text = asyncio.run(transcriber.transcribe_stream(chunked(data, 4095), "note.wav"))
+        self.assertEqual(text, "12s 16s")
+        self.assertEqual(sorted(self.transcriptions.files), ["segment-000.wav", "segment-001.wav"])
+
+    def test_unsplittable_upload_is_sent_whole(self):
+        transcriber = AudioTranscriber(self.client, split=False)
+        data = wav_bytes(tone(2), RATE)
+        text = asyncio.run(transcriber.transcribe_stream(chunked(data, 1000), "note.wav"))
+        self.assertEqual(text, "2s")
+
+    def test_size_limit(self):
+        transcriber = AudioTranscriber(self.client, max_bytes=10000)
+        data = wav_bytes(tone(2), RATE)
+        with self.assertRaises(AudioTooLarge):
+            asyncio.run(transcriber.transcribe_stream(chunked(data, 4096), "note.wav"))
+
+    def test_filename_for(self):
+        self.assertEqual(filename_for("audio/wav; codecs=1"), "audio.wav")
+        self.assertEqual(filename_for("application/octet-stream"), "audio.webm")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from compact_vectors import CompactEmbeddings, FullVectorStore, RescoringVectorStore, rescore, shorten
+
+# On their first two values "beta" is closer to the query; on all four, "alpha" is
+VECTORS = {
+    "alpha": [0.6, 0.8, 1.0, 0.0],
+    "beta": [1.0, 0.0, 0.0, 1.0],
+    "query": [1.0, 0.0, 1.0, 0.0],
+}
+
+
+class FixedEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [VECTORS[text] for text in texts]
+
+    def embed_query(self, text):
+        return VECTORS[text]
+
+
+class ShortenTest(unittest.TestCase):
+    def test_keeps_prefix_and_normalises(self):
+        vector = shorten([3.0, 4.0, 12.0], 2)[0]
+        np.testing.assert_allclose(vector, [0.6, 0.8], rtol=1e-6)
+
+    def test_zero_keeps_all_values(self):
+        self.assertEqual(shorten([1.0, 0.0, 0.0], 0).shape, (1, 3))
+
+
+class FullVectorStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_pending_then_saved_round_trip(self):
+        store = FullVectorStore(self.tmp.name)
+        store.put(["alpha"], [VECTORS["alpha"]])
+        found, vectors = store.get(["alpha", "beta"])
+        self.assertEqual(found.tolist(), [True, False])
+        store.save()
+        store.put(["beta"], [VECTORS["beta"]])
+        store.save()
+
+        reopened = FullVectorStore(self.tmp.name)
+        found, vectors = reopened.get(["beta", "alpha"])
+        self.assertEqual(found.tolist(), [True, True])
+        np.testing.assert_allclose(vectors[1], shorten(VECTORS["alpha"], 0)[0], rtol=1e-6)
+        self.assertEqual(len(reopened), 2)
+
+
+class RescoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = FullVectorStore(self.tmp.name)
+        self.store.put(["alpha", "beta"], [VECTORS["alpha"], VECTORS["beta"]])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_reorders_by_full_vectors(self):
+        docs = [Document(page_content="beta"), Document(page_content="alpha")]
+        ranked = rescore(docs, VECTORS["query"], self.store, 2)
+        self.assertEqual([doc.page_content for doc in ranked], ["alpha", "beta"])
+
+    def test_docs_without_vector_go_last(self):
+        docs = [Document(page_content="unknown"), Document(page_content="beta")]
+        ranked = rescore(docs, VECTORS["query"], self.store, 2)
+        self.assertEqual([doc.page_content for doc in ranked], ["beta", "unknown"])
+
+
+class RescoringVectorStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_from_texts_builds_and_rescores(self):
+        embedding = CompactEmbeddings(FixedEmbeddings(), dim=2,
+                                      store=FullVectorStore(os.path.join(self.tmp.name, "full")))
+        vectorstore = RescoringVectorStore.from_texts(["alpha", "beta"], embedding, mode="flat", dtype="float32")
+        self.assertIsInstance(vectorstore, RescoringVectorStore)
+        # The compact index alone prefers beta
+        compact = vectorstore.vectorstore.similarity_search("query", k=1)
+        self.assertEqual(compact[0].page_content, "beta")
+        self.assertEqual(vectorstore.similarity_search("query", k=1)[0].page_content, "alpha")
+
+    def test_from_texts_wraps_plain_embeddings(self):
+        vectorstore = RescoringVectorStore.from_texts(["alpha"], FixedEmbeddings(), mode="flat", dtype="float32")
+        self.assertIsInstance(vectorstore.embeddings, CompactEmbeddings)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from langchain_core.documents import Document
+
+from context_compression import compress_documents, extract_relevant, merge_chunks, split_sentences
+from session_memory import estimate_tokens
+
+PAGE = ("Guard dogs must be leashed in public places at all times. "
+        "The owner must post a sign at every entrance to the property. "
+        "A licence for a guard dog costs one hundred and twenty dollars per year. ")
+
+
+def chunk(text, page=0, source="a.pdf"):
+    return Document(page_content=text, metadata={"source": source, "page": page})
+
+
+class MergeChunksTest(unittest.TestCase):
+    def test_overlapping_chunks_of_a_page_are_joined(self):
+        merged = merge_chunks([chunk(PAGE[:120]), chunk(PAGE[80:])])
+        self.assertEqual([doc.page_content for doc in merged], [PAGE.strip()])
+
+    def test_duplicates_dropped_other_pages_kept(self):
+        merged = merge_chunks([chunk(PAGE), chunk(PAGE[10:60]), chunk(PAGE[:120], page=1)])
+        self.assertEqual(len(merged), 2)
+        self.assertEqual(merged[1].metadata["page"], 1)
+
+    def test_chunk_bridging_two_passages_merges_them(self):
+        merged = merge_chunks([chunk(PAGE[:70]), chunk(PAGE[130:]), chunk(PAGE[40:160])])
+        self.assertEqual([doc.page_content for doc in merged], [PAGE.strip()])
+
+
+class ExtractRelevantTest(unittest.TestCase):
+    def test_split_sentences(self):
+        self.assertEqual(len(split_sentences(PAGE)), 3)
+
+    def test_keeps_best_sentences_in_order_within_budget(self):
+        docs = [chunk(PAGE)]
+        budget = estimate_tokens(split_sentences(PAGE)[2]) + 2
+        compressed = extract_relevant("how much is a guard dog licence", docs, budget)
+        self.assertEqual(compressed[0].page_content, split_sentences(PAGE)[2])
+
+    def test_gap_marks_skipped_sentences(self):
+        text = PAGE + "Sheds are limited to ten square metres. Licence fees are due in January."
+        sentences = split_sentences(text)
+        budget = estimate_tokens(sentences[2]) + estimate_tokens(sentences[4])
+        compressed = extract_relevant("licence fees dollars", [chunk(text)], budget)
+        self.assertEqual(compressed[0].page_content, f"{sentences[2]} … {sentences[4]}")
+
+    def test_within_budget_nothing_is_cut(self):
+        docs = [chunk(PAGE[:120]), chunk(PAGE[80:])]
+        self.assertEqual(compress_documents("sign", docs, budget=1000)[0].page_content, PAGE.strip())
+
+
+if __name__ == "__main__":
+    unittest.main()
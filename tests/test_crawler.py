@@ -0,0 +1,60 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from fake_services import fake_pdf, start_pdf_site
+from pdf_files_COV import run_crawl, summarize
+
+
+class CrawlerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.site = start_pdf_site({"a.pdf": fake_pdf("zoning"), "b.pdf": fake_pdf("parking")}, latency=0)
+
+    def tearDown(self):
+        self.site.shutdown()
+        self.site.server_close()
+        self.tmp.cleanup()
+
+    def crawl(self, urls=(), pages=()):
+        results, _, _ = asyncio.run(run_crawl(self.tmp.name, list(urls), list(pages), host_delay=0))
+        return results
+
+    def test_discovers_downloads_then_revalidates(self):
+        results = self.crawl(pages=[self.site.url("brochures.html")])
+        self.assertEqual(summarize(results), {"new": 2})
+        with open(os.path.join(self.tmp.name, "a.pdf"), "rb") as f:
+            self.assertEqual(f.read(), fake_pdf("zoning"))
+
+        self.site.reset()
+        self.site.put("b.pdf", fake_pdf("parking v2"))
+        results = self.crawl(pages=[self.site.url("brochures.html")])
+        self.assertEqual(results[self.site.url("a.pdf")][0], "unchanged")
+        self.assertEqual(results[self.site.url("b.pdf")][0], "changed")
+        self.assertEqual(self.site.snapshot()["responses"].get("304"), 1)
+
+    def test_interrupted_download_resumes_with_range(self):
+        # Larger than the crawler's read size, so part of it is on disk when the connection drops
+        self.site.put("a.pdf", fake_pdf("zoning", pages=10))
+        self.site.drop_after["a.pdf"] = 100000
+        results = self.crawl([self.site.url("a.pdf")])
+        self.assertEqual(results[self.site.url("a.pdf")][0], "new")
+        self.assertEqual(self.site.snapshot()["responses"].get("206"), 1)
+        with open(os.path.join(self.tmp.name, "a.pdf"), "rb") as f:
+            self.assertEqual(f.read(), fake_pdf("zoning", pages=10))
+
+    def test_same_file_name_on_two_urls(self):
+        self.site.put("docs/a.pdf", fake_pdf("other"), linked=False)
+        results = self.crawl([self.site.url("a.pdf"), self.site.url("docs/a.pdf")])
+        names = {name for _, name in results.values()}
+        self.assertEqual(len(names), 2)
+        self.assertTrue(all(os.path.exists(os.path.join(self.tmp.name, name)) for name in names))
+
+    def test_missing_file_is_skipped(self):
+        results = self.crawl([self.site.url("missing.pdf")])
+        self.assertEqual(results[self.site.url("missing.pdf")][0], "skipped")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import asyncio
+import tempfile
+import unittest
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic 4-dimensional vectors; records every text it is asked to embed."""
+
+    model = "counting"
+
+    def __init__(self):
+        self.calls = []
+
+    def _vector(self, text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0, 0.5]
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return self._vector(text)
+
+
+class EmbeddingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_put_then_get(self):
+        cache = EmbeddingCache(self.tmp.name)
+        cache.put_many({"a" * 64: [1.0, 2.0], "b" * 64: [3.0, 4.0]})
+        found = cache.get_many(["a" * 64, "c" * 64])
+        self.assertEqual(list(found), ["a" * 64])
+        np.testing.assert_array_equal(found["a" * 64], [1.0, 2.0])
+
+    def test_reused_rows_never_return_another_keys_vector(self):
+        cache = EmbeddingCache(self.tmp.name, max_entries=2)
+        keys = [f"{i:x}" * 64 for i in range(1, 5)]
+        for i, key in enumerate(keys):
+            cache.put_many({key: [float(i), float(i)]})
+        self.assertEqual(len(cache), 2)
+        # Another process's view of the same store
+        other = EmbeddingCache(self.tmp.name, max_entries=2)
+        for cached in (cache, other):
+            found = cached.get_many(keys)
+            self.assertEqual(sorted(found), sorted(keys[2:]))
+            for i, key in enumerate(keys[2:], start=2):
+                np.testing.assert_array_equal(found[key], [float(i), float(i)])
+
+    def test_hits_do_not_write_until_flushed(self):
+        cache = EmbeddingCache(self.tmp.name, touch_seconds=3600)
+        cache.put_many({"a" * 64: [1.0]})
+        before = cache._db.execute("SELECT last_used FROM entries").fetchone()[0]
+        cache.get_many(["a" * 64])
+        self.assertEqual(cache._db.execute("SELECT last_used FROM entries").fetchone()[0], before)
+        cache.flush_touches()
+        self.assertGreaterEqual(cache._db.execute("SELECT last_used FROM entries").fetchone()[0], before)
+        self.assertEqual(cache._touched, {})
+
+
+class CachedEmbeddingsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.model = CountingEmbeddings()
+        self.embeddings = CachedEmbeddings(self.model, EmbeddingCache(self.tmp.name))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_only_misses_reach_the_model(self):
+        first = self.embeddings.embed_documents(["zoning", "permits"])
+        second = self.embeddings.embed_documents(["permits", "fees", "zoning", "fees"])
+        self.assertEqual(self.model.calls, [["zoning", "permits"], ["fees"]])
+        self.assertEqual(second[0], first[1])
+        self.assertEqual(second[2], first[0])
+        self.assertEqual(second[1], second[3])
+
+    def test_queries_and_documents_are_cached_separately(self):
+        self.embeddings.embed_documents(["zoning"])
+        self.embeddings.embed_query("zoning")
+        self.embeddings.embed_query("zoning")
+        self.assertEqual(self.model.calls, [["zoning"], ["zoning"]])
+
+    def test_cache_outlives_the_wrapper(self):
+        vector = self.embeddings.embed_query("zoning")
+        again = CachedEmbeddings(CountingEmbeddings(), EmbeddingCache(self.tmp.name))
+        self.assertEqual(again.embed_query("zoning"), vector)
+        self.assertEqual(again.embeddings.calls, [])
+
+    def test_async_paths_share_the_cache(self):
+        async def run():
+            vector = await self.embeddings.aembed_query("zoning")
+            documents = await self.embeddings.aembed_documents(["zoning", "fees"])
+            return vector, documents, await self.embeddings.aembed_query("zoning")
+
+        vector, documents, again = asyncio.run(run())
+        self.assertEqual(vector, again)
+        self.assertEqual(len(documents), 2)
+        self.assertEqual(self.model.calls, [["zoning"], ["zoning", "fees"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
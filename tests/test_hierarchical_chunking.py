@@ -0,0 +1,92 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from hierarchical_chunking import ParentChildRetriever, ParentStore, expand_to_parents, split_structured
+
+PAGES = [
+    "CITY BY-LAW\nGUARD DOGS\n16.1 A person must keep a guard dog leashed in public at all times.\n"
+    "(a) the sign must be visible from the street;\n(b) the sign must state the owner's phone number.\n1",
+    "CITY BY-LAW\nFEES\nDog licence $45\nGuard dog licence $120\n2",
+    "CITY BY-LAW\nPET STORES\n17.1 A pet store must not sell a dog under eight weeks old.\n3",
+]
+
+
+class FixedRetriever(BaseRetriever):
+    docs: list
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return self.docs
+
+
+class SplitStructuredTest(unittest.TestCase):
+    def setUp(self):
+        self.children, self.parents = split_structured(PAGES, "bylaw.pdf", min_chars=0)
+
+    def test_parents_follow_headings_without_running_headers(self):
+        self.assertEqual([doc.metadata["section"] for doc in self.parents], ["GUARD DOGS", "FEES", "PET STORES"])
+        for doc in self.parents:
+            self.assertNotIn("CITY BY-LAW", doc.page_content)
+            self.assertEqual(doc.id, doc.metadata["parent_id"])
+
+    def test_children_point_at_their_parent_and_keep_table_rows(self):
+        parent_ids = {doc.id for doc in self.parents}
+        self.assertTrue(all(doc.metadata["parent_id"] in parent_ids for doc in self.children))
+        table = [doc for doc in self.children if doc.metadata["kind"] == "table"]
+        self.assertEqual(len(table), 1)
+        self.assertEqual(table[0].page_content, "FEES\nDog licence $45\nGuard dog licence $120")
+
+    def test_ids_are_stable(self):
+        _, parents = split_structured(PAGES, "bylaw.pdf", min_chars=0)
+        self.assertEqual([doc.id for doc in parents], [doc.id for doc in self.parents])
+
+
+class ParentStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = ParentStore(os.path.join(self.tmp.name, "parents"))
+        _, self.parents = split_structured(PAGES, "bylaw.pdf", min_chars=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_staged_parents_are_written_on_commit(self):
+        self.store.stage("bylaw.pdf", self.parents)
+        self.assertIsNone(self.store.get(self.parents[0].id))
+        self.store.commit("bylaw.pdf")
+        self.assertEqual(self.store.sources(), {"bylaw.pdf"})
+        reopened = ParentStore(self.store.path)
+        self.assertEqual(reopened.get(self.parents[1].id).page_content, self.parents[1].page_content)
+
+    def test_remove(self):
+        self.store.put("bylaw.pdf", self.parents)
+        self.store.remove("bylaw.pdf")
+        self.assertIsNone(self.store.get(self.parents[0].id))
+        self.assertEqual(self.store.sources(), set())
+
+    def test_expand_to_parents_dedupes_and_passes_through(self):
+        self.store.put("bylaw.pdf", self.parents)
+        first, second = self.parents[0].id, self.parents[2].id
+        plain = Document(page_content="recursive chunk", metadata={})
+        children = [Document(page_content="a", metadata={"parent_id": first}),
+                    Document(page_content="b", metadata={"parent_id": first}),
+                    plain,
+                    Document(page_content="c", metadata={"parent_id": second})]
+        expanded = expand_to_parents(children, self.store, k=3)
+        self.assertEqual([doc.page_content for doc in expanded],
+                         [self.parents[0].page_content, "recursive chunk", self.parents[2].page_content])
+
+    def test_retriever_returns_parents(self):
+        self.store.put("bylaw.pdf", self.parents)
+        child = Document(page_content="child", metadata={"parent_id": self.parents[1].id})
+        retriever = ParentChildRetriever(child_retriever=FixedRetriever(docs=[child]), store=self.store)
+        self.assertEqual(retriever.invoke("fees")[0].page_content, self.parents[1].page_content)
+        self.assertEqual(asyncio.run(retriever.ainvoke("fees"))[0].page_content, self.parents[1].page_content)
+
+
+if __name__ == "__main__":
+    unittest.main()
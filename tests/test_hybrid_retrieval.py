@@ -0,0 +1,137 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from langchain_core.documents import Document
+
+import hybrid_retrieval
+from hybrid_retrieval import BM25Index, HybridRetriever, bm25_index_path, reciprocal_rank_fusion, tokenize
+
+
+def docs(*texts):
+    return [Document(page_content=text, metadata={"source": "a.pdf", "page": 0}) for text in texts]
+
+
+class ReciprocalRankFusionTest(unittest.TestCase):
+    def test_documents_in_both_lists_rank_first(self):
+        fused = reciprocal_rank_fusion([docs("a", "b", "c"), docs("c", "d")], k=60)
+        self.assertEqual([doc.page_content for doc in fused], ["c", "a", "b", "d"])
+
+    def test_duplicates_are_merged(self):
+        fused = reciprocal_rank_fusion([docs("a", "b"), docs("b", "a")])
+        self.assertEqual(sorted(doc.page_content for doc in fused), ["a", "b"])
+
+    def test_single_list_keeps_its_order(self):
+        fused = reciprocal_rank_fusion([docs("x", "y", "z")])
+        self.assertEqual([doc.page_content for doc in fused], ["x", "y", "z"])
+
+    def test_empty_input(self):
+        self.assertEqual(reciprocal_rank_fusion([[], []]), [])
+
+
+class TokenizeTest(unittest.TestCase):
+    def test_drops_stopwords_and_folds_plurals(self):
+        self.assertEqual(tokenize("What are the zones for dogs?"), ["zone", "dog"])
+
+    def test_keeps_codes_whole_and_adds_their_parts(self):
+        tokens = tokenize("RS-1 and section 11.24")
+        self.assertIn("rs-1", tokens)
+        self.assertIn("rs1", tokens)
+        self.assertIn("11.24", tokens)
+        self.assertIn("24", tokens)
+
+    def test_double_s_is_not_a_plural(self):
+        self.assertEqual(tokenize("business class"), ["business", "class"])
+
+
+def bm25_corpus():
+    index = BM25Index()
+    index.add(["a", "b", "c"], [
+        "Guard dogs must be licensed every year.",
+        "The RS-1 zone permits one-family dwellings.",
+        "Laneway houses are allowed in RS-1 and RS-5 zones. RS-1 lots need a permit.",
+    ], [{"source": "x.pdf"}, {"source": "y.pdf"}, {"source": "y.pdf"}])
+    return index
+
+
+class BM25IndexTest(unittest.TestCase):
+    def test_search_ranks_matching_chunks(self):
+        index = bm25_corpus()
+        hits = index.search("rs1 laneway")
+        self.assertEqual([index.ids[row] for row, _ in hits], ["c", "b"])
+        self.assertGreater(hits[0][1], hits[1][1])
+
+    def test_no_match_returns_nothing(self):
+        self.assertEqual(bm25_corpus().search("embodied carbon"), [])
+
+    def test_k_limits_hits(self):
+        self.assertEqual(len(bm25_corpus().search("rs-1", k=1)), 1)
+
+    def test_add_replaces_by_id_and_remove_filters(self):
+        index = bm25_corpus()
+        index.add(["a"], ["Cats need no licence."], [{"source": "x.pdf"}])
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.search("guard dogs"), [])
+        index.remove(lambda metadata: metadata["source"] == "y.pdf")
+        self.assertEqual(index.ids, ["a"])
+        self.assertEqual(index.sources(), {"x.pdf"})
+
+    def test_save_load_round_trip(self):
+        index = bm25_corpus()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bm25")
+            index.save(path)
+            index.save(path)  # replacing an existing index
+            loaded = BM25Index.load(path)
+        self.assertEqual(loaded.ids, index.ids)
+        self.assertEqual(loaded.search("rs1 laneway"), index.search("rs1 laneway"))
+        self.assertEqual(loaded.document(0).metadata, {"source": "x.pdf"})
+
+    def test_load_missing_index_raises(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaises(FileNotFoundError):
+                BM25Index.load(os.path.join(tmp, "missing"))
+
+
+class FixedVectorStore:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def similarity_search(self, query, k=4):
+        return self.docs[:k]
+
+    async def asimilarity_search(self, query, k=4):
+        return self.docs[:k]
+
+
+class HybridRetrieverTest(unittest.TestCase):
+    def setUp(self):
+        bm25 = bm25_corpus()
+        dense = [bm25.document(1), Document(page_content="Only the vector store has this.", metadata={})]
+        self.retriever = HybridRetriever(vectorstore=FixedVectorStore(dense), bm25=bm25, k=3)
+
+    def test_fuses_dense_and_lexical_results(self):
+        docs = self.retriever.invoke("rs1 laneway")
+        self.assertEqual([doc.id for doc in docs][:1], ["b"])
+        self.assertEqual(len(docs), 3)
+
+    def test_async_path_matches_sync(self):
+        sync = [doc.page_content for doc in self.retriever.invoke("rs1 laneway")]
+        result = asyncio.run(self.retriever.ainvoke("rs1 laneway"))
+        self.assertEqual([doc.page_content for doc in result], sync)
+
+
+class BM25IndexPathTest(unittest.TestCase):
+    def test_each_store_gets_its_own_path(self):
+        with mock.patch.object(hybrid_retrieval, "BM25_INDEX_PATH", ""):
+            self.assertNotEqual(bm25_index_path("local"), bm25_index_path("chroma"))
+
+    def test_override_pins_one_path(self):
+        with mock.patch.object(hybrid_retrieval, "BM25_INDEX_PATH", "/tmp/bm25"):
+            self.assertEqual(bm25_index_path("local"), "/tmp/bm25")
+
+
+if __name__ == "__main__":
+    unittest.main()
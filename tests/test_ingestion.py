@@ -0,0 +1,79 @@
+import hashlib
+import os
+import tempfile
+import unittest
+
+from langchain_core.documents import Document
+
+from hierarchical_chunking import parent_id
+from ingestion import IngestManifest, chunk_id, file_sha256
+
+
+def doc(text, source="a.pdf", page=0):
+    return Document(page_content=text, metadata={"source": source, "page": page})
+
+
+class ChunkIdTest(unittest.TestCase):
+    def test_stable_and_content_addressed(self):
+        self.assertEqual(chunk_id(doc("RS-1 zone")), chunk_id(doc("RS-1 zone")))
+        self.assertNotEqual(chunk_id(doc("RS-1 zone")), chunk_id(doc("RS-2 zone")))
+        self.assertNotEqual(chunk_id(doc("RS-1 zone")), chunk_id(doc("RS-1 zone", page=1)))
+        self.assertNotEqual(chunk_id(doc("RS-1 zone")), chunk_id(doc("RS-1 zone", source="b.pdf")))
+
+    def test_ids_of_a_file_share_its_prefix(self):
+        prefix = chunk_id(doc("one")).split("-", 1)[0]
+        self.assertEqual(chunk_id(doc("two", page=3)).split("-", 1)[0], prefix)
+        # Parent sections are found by the same prefix
+        self.assertEqual(parent_id("a.pdf", "section").split("-", 1)[0], prefix)
+
+
+class IngestManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "manifest.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_new_file_is_not_current(self):
+        self.assertFalse(IngestManifest(self.path).is_current("a.pdf", "abc"))
+
+    def test_partial_upload_keeps_file_stale(self):
+        # A crashed run: its uploaded batches are remembered, the file is not done
+        manifest = IngestManifest(self.path)
+        manifest.record_uploaded("a.pdf", ["id1", "id2"])
+        manifest.record_uploaded("a.pdf", ["id3"])
+        reopened = IngestManifest(self.path)
+        self.assertFalse(reopened.is_current("a.pdf", "abc"))
+        self.assertEqual(reopened.chunk_ids("a.pdf"), {"id1", "id2", "id3"})
+
+    def test_changed_file_diff(self):
+        manifest = IngestManifest(self.path)
+        manifest.complete_file("a.pdf", "v1", ["id1", "id2", "id3"], chunking="recursive")
+        self.assertTrue(manifest.is_current("a.pdf", "v1", chunking="recursive"))
+        self.assertFalse(manifest.is_current("a.pdf", "v2", chunking="recursive"))
+        self.assertFalse(manifest.is_current("a.pdf", "v1", chunking="structured"))
+
+        # The new version keeps id2, adds id4: only id4 is uploaded, id1 and id3 are stale
+        uploaded = manifest.chunk_ids("a.pdf")
+        run_ids = {"id2", "id4"}
+        self.assertEqual(run_ids - uploaded, {"id4"})
+        self.assertEqual(sorted(uploaded - run_ids), ["id1", "id3"])
+        manifest.complete_file("a.pdf", "v2", run_ids, chunking="recursive")
+        self.assertEqual(IngestManifest(self.path).chunk_ids("a.pdf"), {"id2", "id4"})
+
+    def test_remove_file(self):
+        manifest = IngestManifest(self.path)
+        manifest.complete_file("a.pdf", "v1", ["id1"])
+        manifest.remove_file("a.pdf")
+        self.assertEqual(IngestManifest(self.path).files, {})
+
+    def test_file_sha256(self):
+        path = os.path.join(self.tmp.name, "a.pdf")
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.4\n" * 300000)
+        self.assertEqual(file_sha256(path), hashlib.sha256(b"%PDF-1.4\n" * 300000).hexdigest())
+
+
+if __name__ == "__main__":
+    unittest.main()
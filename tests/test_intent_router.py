@@ -0,0 +1,50 @@
+import unittest
+
+from intent_router import (CHITCHAT, GOODBYE, GREETING, INTENTS, QUESTION, THANKS, IntentRouter, canned_reply,
+                           char_ngram_vector)
+
+
+class IntentRouterTest(unittest.TestCase):
+    def setUp(self):
+        self.router = IntentRouter()
+
+    def test_rules(self):
+        self.assertEqual(self.router.classify("Hello there!"), (GREETING, "rule"))
+        self.assertEqual(self.router.classify("ok thanks a lot"), (THANKS, "rule"))
+        self.assertEqual(self.router.classify("bye"), (GOODBYE, "rule"))
+        self.assertEqual(self.router.classify("how are you?"), (CHITCHAT, "rule"))
+
+    def test_model_catches_variants(self):
+        self.assertEqual(self.router.classify("thnx so much"), (THANKS, "model"))
+        self.assertEqual(self.router.classify("gud nite"), (GOODBYE, "model"))
+
+    def test_domain_questions_always_go_to_the_chain(self):
+        for message in ["hi, what is the rs-1 zone?", "parking", "lot size 33ft", "",
+                        "could you please walk me through what I need to do for this"]:
+            self.assertEqual(self.router.classify(message)[0], QUESTION, message)
+
+    def test_history_uses_rules_only(self):
+        self.assertEqual(self.router.route("thnx so much", has_history=True), QUESTION)
+        self.assertEqual(self.router.route("thanks", has_history=True), THANKS)
+
+    def test_rules_only_model(self):
+        router = IntentRouter(model="off")
+        self.assertEqual(router.classify("gud nite"), (QUESTION, "default"))
+
+    def test_route_counts_intents(self):
+        before = INTENTS._values.get((GREETING,), 0)
+        self.router.route("hey")
+        self.assertEqual(INTENTS._values[(GREETING,)], before + 1)
+
+    def test_canned_reply(self):
+        self.assertEqual(canned_reply(GREETING, "🌞 Good afternoon"), "🌞 Good afternoon")
+        self.assertIn("welcome", canned_reply(THANKS, "hi"))
+        self.assertIsNone(canned_reply(QUESTION, "hi"))
+
+    def test_ngram_vector_is_unit_length(self):
+        vector = char_ngram_vector("thanks")
+        self.assertAlmostEqual(sum(weight * weight for weight in vector.values()), 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
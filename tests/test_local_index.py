@@ -0,0 +1,107 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from local_index import LocalVectorIndex, matches_filter
+
+
+class TableEmbeddings(Embeddings):
+    """Looks each text up in a fixed table of vectors."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+
+def random_table(count, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return {f"doc{i}": rng.normal(size=dim).tolist() for i in range(count)}
+
+
+class LocalVectorIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.table = random_table(200)
+        self.texts = list(self.table)
+        self.metadatas = [{"source": "a.pdf" if i % 2 else "b.pdf", "page": i} for i in range(len(self.texts))]
+        self.embedding = TableEmbeddings(self.table)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def build(self, **kwargs):
+        return LocalVectorIndex.from_texts(self.texts, self.embedding, self.metadatas, ids=self.texts, **kwargs)
+
+    def exact_top(self, query, k, rows=None):
+        matrix = np.array([self.table[text] for text in self.texts])
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        scores = matrix @ (np.array(self.table[query]) / np.linalg.norm(self.table[query]))
+        order = [row for row in np.argsort(-scores) if rows is None or row in rows]
+        return [self.texts[row] for row in order[:k]]
+
+    def test_flat_search_is_exact(self):
+        index = self.build(mode="flat", dtype="float32")
+        found = [doc.page_content for doc in index.similarity_search("doc7", k=5)]
+        self.assertEqual(found, self.exact_top("doc7", 5))
+        self.assertEqual(found[0], "doc7")
+
+    def test_filter(self):
+        index = self.build(mode="flat", dtype="float32")
+        docs = index.similarity_search("doc7", k=5, filter={"source": "b.pdf", "page": {"$lt": 100}})
+        self.assertEqual([doc.page_content for doc in docs],
+                         self.exact_top("doc7", 5, rows={row for row in range(0, 100, 2)}))
+
+    def test_matches_filter_operators(self):
+        metadata = {"source": "a.pdf", "page": 3}
+        self.assertTrue(matches_filter(metadata, {"$or": [{"source": "b.pdf"}, {"page": {"$gte": 3}}]}))
+        self.assertFalse(matches_filter(metadata, {"source": {"$nin": ["a.pdf"]}}))
+        self.assertFalse(matches_filter(metadata, {"missing": {"$gt": 1}}))
+
+    def test_delete_and_replace(self):
+        index = self.build(mode="flat", dtype="float32")
+        index.delete(["doc7"])
+        self.assertEqual(len(index), 199)
+        self.assertNotIn("doc7", [doc.page_content for doc in index.similarity_search("doc7", k=5)])
+        index.add_texts(["doc7"], [{"source": "c.pdf"}], ids=["doc7"])
+        self.assertEqual(index.similarity_search("doc7", k=1)[0].metadata, {"source": "c.pdf"})
+
+    def test_save_and_load(self):
+        path = os.path.join(self.tmp.name, "index")
+        index = self.build(mode="flat", dtype="float32", path=path)
+        index.delete(["doc3"])
+        index.save()
+        loaded = LocalVectorIndex.load(path, self.embedding)
+        self.assertEqual(len(loaded), 199)
+        self.assertEqual([doc.page_content for doc in loaded.similarity_search("doc7", k=5)],
+                         [doc.page_content for doc in index.similarity_search("doc7", k=5)])
+        self.assertEqual(loaded.get_by_ids(["doc8"])[0].metadata, self.metadatas[8])
+
+    def test_int8_keeps_the_nearest(self):
+        index = self.build(mode="flat", dtype="int8")
+        found = [doc.page_content for doc in index.similarity_search("doc7", k=5)]
+        self.assertEqual(found[0], "doc7")
+        self.assertGreaterEqual(len(set(found) & set(self.exact_top("doc7", 5))), 4)
+
+    def test_hnsw_recall(self):
+        index = self.build(mode="hnsw", dtype="float32")
+        hits = sum(len({doc.page_content for doc in index.similarity_search(query, k=10)}
+                       & set(self.exact_top(query, 10))) for query in self.texts[:20])
+        self.assertGreaterEqual(hits / 200, 0.9)
+
+    def test_async_search(self):
+        index = self.build(mode="flat", dtype="float32")
+        docs = asyncio.run(index.asimilarity_search("doc7", k=3))
+        self.assertEqual([doc.page_content for doc in docs], self.exact_top("doc7", 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+from session_memory import SessionStore, SQLiteSessionStore, estimate_tokens, trim_turns
+
+
+class TrimTurnsTest(unittest.TestCase):
+    def test_keeps_most_recent_turns_up_to_max_turns(self):
+        turns = [(f"q{i}", f"a{i}") for i in range(10)]
+        self.assertEqual(trim_turns(turns, max_tokens=1000, max_turns=3), turns[-3:])
+
+    def test_drops_oldest_turns_over_token_budget(self):
+        turns = [("q" * 40, "a" * 40), ("short", "reply"), ("last", "one")]
+        budget = sum(estimate_tokens(q) + estimate_tokens(a) for q, a in turns[1:])
+        self.assertEqual(trim_turns(turns, max_tokens=budget, max_turns=10), turns[1:])
+
+    def test_turn_over_budget_on_its_own_is_dropped(self):
+        self.assertEqual(trim_turns([("q" * 400, "a" * 400)], max_tokens=10, max_turns=5), [])
+
+    def test_zero_max_turns_keeps_nothing(self):
+        self.assertEqual(trim_turns([("q", "a")], max_tokens=1000, max_turns=0), [])
+
+
+class SessionStoreTest(unittest.TestCase):
+    def test_append_trims_history(self):
+        store = SessionStore(max_tokens=1000, max_turns=2)
+        for i in range(5):
+            store.append("s", f"q{i}", f"a{i}")
+        self.assertEqual(store.get_history("s"), [("q3", "a3"), ("q4", "a4")])
+
+    def test_sessions_are_separate(self):
+        store = SessionStore()
+        store.append("a", "q", "a")
+        self.assertEqual(store.get_history("b"), [])
+
+    def test_expired_session_is_empty(self):
+        store = SessionStore(ttl_seconds=0)
+        store.append("s", "q", "a")
+        self.assertEqual(store.get_history("s"), [])
+
+    def test_least_recently_used_session_is_evicted(self):
+        store = SessionStore(max_sessions=2)
+        store.append("a", "q", "a")
+        store.append("b", "q", "a")
+        store.append("a", "q2", "a2")
+        store.append("c", "q", "a")
+        self.assertEqual(store.get_history("b"), [])
+        self.assertEqual(len(store.get_history("a")), 2)
+
+    def test_no_session_id_is_not_stored(self):
+        store = SessionStore()
+        store.append(None, "q", "a")
+        self.assertEqual(len(store), 0)
+
+
+class SQLiteSessionStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SQLiteSessionStore(os.path.join(self.tmp.name, "sessions.sqlite3"), max_turns=2)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_append_trims_history(self):
+        for i in range(4):
+            self.store.append("s", f"q{i}", f"a{i}")
+        self.assertEqual(self.store.get_history("s"), [("q2", "a2"), ("q3", "a3")])
+
+    def test_history_is_shared_between_connections(self):
+        self.store.append("s", "q", "a")
+        other = SQLiteSessionStore(os.path.join(self.tmp.name, "sessions.sqlite3"))
+        try:
+            self.assertEqual(other.get_history("s"), [("q", "a")])
+        finally:
+            other.close()
+
+
+if __name__ == "__main__":
+    unittest.main()